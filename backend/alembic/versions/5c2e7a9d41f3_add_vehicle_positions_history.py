@@ -0,0 +1,41 @@
+"""add vehicle_positions history partitioned by day
+
+Revision ID: 5c2e7a9d41f3
+Revises: b35fb6756cac
+Create Date: 2026-10-17 16:05:12.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e7a9d41f3'
+down_revision: Union[str, None] = 'b35fb6756cac'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Day partitions are created and dropped by the API (backend/history.py).
+    # No primary key or foreign key: rows are only ever appended, and the
+    # history of a deleted vehicle stays until its partitions expire.
+    op.execute('''
+        CREATE TABLE vehicle_positions (
+            vehicle_id integer NOT NULL,
+            recorded_at timestamptz NOT NULL,
+            lat double precision NOT NULL,
+            lng double precision NOT NULL,
+            status varchar
+        ) PARTITION BY RANGE (recorded_at)
+    ''')
+    # Cascades to every partition
+    op.execute('CREATE INDEX ix_vehicle_positions_vehicle_time ON vehicle_positions (vehicle_id, recorded_at)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TABLE vehicle_positions')
@@ -0,0 +1,51 @@
+"""add indexed geography columns for orders and vehicles
+
+Revision ID: 825fd7f5c18e
+Revises: 7fc31163196d
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '825fd7f5c18e'
+down_revision: Union[str, None] = '7fc31163196d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, latitude column, longitude column)
+POINTS = [
+    ('orders', 'pickup_geog', 'pickup_lat', 'pickup_lng'),
+    ('orders', 'dropoff_geog', 'dropoff_lat', 'dropoff_lng'),
+    ('vehicles', 'current_geog', 'current_lat', 'current_lng'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+    # Stored generated columns are filled for existing rows when added (one
+    # table rewrite per ALTER) and kept in sync with lat/lng on every write.
+    # ST_MakePoint is strict, so rows missing a coordinate get NULL.
+    for table, column, lat, lng in POINTS:
+        op.execute(
+            f'ALTER TABLE {table} ADD COLUMN {column} geography(Point, 4326) '
+            f'GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint({lng}, {lat}), 4326)::geography) STORED'
+        )
+    # Build the indexes without blocking writes.
+    with op.get_context().autocommit_block():
+        for table, column, _, _ in POINTS:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_{column} ON {table} USING gist ({column})')
+    for table, _, _, _ in POINTS:
+        op.execute(f'ANALYZE {table}')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column, _, _ in reversed(POINTS):
+        op.drop_index(f'ix_{table}_{column}', table_name=table)
+        op.drop_column(table, column)
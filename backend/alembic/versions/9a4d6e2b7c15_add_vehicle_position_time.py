@@ -0,0 +1,29 @@
+"""add the receive time of a vehicle's stored position
+
+Revision ID: 9a4d6e2b7c15
+Revises: 5c2e7a9d41f3
+Create Date: 2026-10-17 18:20:37.604512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d6e2b7c15'
+down_revision: Union[str, None] = '5c2e7a9d41f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable without a default, so adding it does not rewrite the table.
+    op.add_column('vehicles', sa.Column('position_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('vehicles', 'position_at')
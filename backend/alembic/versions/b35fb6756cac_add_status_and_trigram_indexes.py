@@ -0,0 +1,42 @@
+"""add status and trigram name indexes
+
+Revision ID: b35fb6756cac
+Revises: 825fd7f5c18e
+Create Date: 2026-10-17 13:40:06.552871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b35fb6756cac'
+down_revision: Union[str, None] = '825fd7f5c18e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, index definition)
+INDEXES = [
+    # Status filter with keyset pagination by id
+    ('ix_orders_status_id', 'orders', '(status, id)'),
+    ('ix_vehicles_status_id', 'vehicles', '(status, id)'),
+    # ILIKE '%text%' searches
+    ('ix_orders_customer_name_trgm', 'orders', 'USING gin (customer_name gin_trgm_ops)'),
+    ('ix_vehicles_name_trgm', 'vehicles', 'USING gin (name gin_trgm_ops)'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for name, table, definition in INDEXES:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
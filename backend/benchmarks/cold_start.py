@@ -0,0 +1,131 @@
+"""Measure API worker startup: time to the first health response and resident memory.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.cold_start --runs 3
+
+Each configuration starts ``uvicorn backend.main:app`` as a fresh process
+and polls ``GET /`` until it answers. Then the resident memory of the
+server is read, together with that of its optimizer worker processes.
+The configurations are:
+
+- crud: ECOROUTE_OPTIMIZER_ENABLED=0
+- lazy: the optimizer mounted and loaded on first use (the default)
+- warm: ECOROUTE_OPTIMIZER_WARMUP=1
+
+With ``--optimize`` one small optimize_routes request is also timed after
+startup, which is where the lazy configuration pays its loading cost. The
+database is not needed. Without one, startup logs that the live index
+starts empty. Memory is read from /proc, so this runs on Linux only.
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from ..benchmarks.decomposition import random_request
+
+CONFIGS = {
+    "crud": {"ECOROUTE_OPTIMIZER_ENABLED": "0"},
+    "lazy": {"ECOROUTE_OPTIMIZER_ENABLED": "1", "ECOROUTE_OPTIMIZER_WARMUP": "0"},
+    "warm": {"ECOROUTE_OPTIMIZER_ENABLED": "1", "ECOROUTE_OPTIMIZER_WARMUP": "1"},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def children(pid: int):
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    found.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return found + [grandchild for child in found for grandchild in children(child)]
+
+
+def start_once(config: str, optimize: bool, timeout_s: float) -> dict:
+    port = free_port()
+    env = dict(os.environ, **CONFIGS[config])
+    t0 = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        url = f"http://127.0.0.1:{port}"
+        while True:
+            if time.perf_counter() - t0 > timeout_s or server.poll() is not None:
+                raise RuntimeError(f"{config}: server did not come up")
+            try:
+                if httpx.get(url + "/", timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                time.sleep(0.02)
+        result = {"ready_s": time.perf_counter() - t0}
+        if optimize and config != "crud":
+            request = random_request(20, 2, 0)
+            request.time_limit_seconds = 1
+            t1 = time.perf_counter()
+            httpx.post(url + "/optimize_routes", json=request.model_dump(), timeout=120).raise_for_status()
+            result["first_optimize_s"] = time.perf_counter() - t1
+        workers = children(server.pid)
+        result["server_mb"] = rss_mb(server.pid)
+        result["workers_mb"] = sum(rss_mb(pid) for pid in workers)
+        return result
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--optimize", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args(argv)
+
+    print(f"{'config':<6s} {'ready_s':>8s} {'server_MB':>10s} {'workers_MB':>11s} {'first_optimize_s':>17s}")
+    for config in args.configs:
+        runs = [start_once(config, args.optimize, args.timeout) for _ in range(args.runs)]
+
+        def median(key):
+            values = [run[key] for run in runs if key in run]
+            return statistics.median(values) if values else float("nan")
+
+        print(
+            f"{config:<6s} {median('ready_s'):>8.2f} {median('server_mb'):>10.0f} {median('workers_mb'):>11.0f}"
+            f" {median('first_optimize_s'):>17.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
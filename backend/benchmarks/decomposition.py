@@ -0,0 +1,77 @@
+"""Compare single-model and decomposed solves of large requests.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.decomposition --orders 500 1000 2000
+
+For every size a random request with one vehicle per ``--orders-per-vehicle``
+orders is solved both ways. Wall time, summed route time and distance, and
+the number of unassigned orders are reported. Cluster parallelism follows
+ECOROUTE_DECOMPOSITION_WORKERS (default: all cores). The single model is
+skipped above ``--max-single`` orders, where its dense matrices alone take
+gigabytes.
+"""
+import argparse
+import random
+import time
+
+from ..decomposition import solve_decomposed
+from ..optimizer import solve_routes
+from ..schemas import Location, OptimizeRouteRequest, OrderInOptimization, VehicleInOptimization
+from ..settings import settings
+
+
+def random_request(n_orders, n_vehicles, seed):
+    rng = random.Random(seed)
+
+    def loc():
+        return Location(latitude=40.7 + rng.uniform(-0.3, 0.3), longitude=-74.0 + rng.uniform(-0.3, 0.3))
+
+    return OptimizeRouteRequest(
+        orders=[OrderInOptimization(id=i, pickup_location=loc(), dropoff_location=loc()) for i in range(n_orders)],
+        vehicles=[VehicleInOptimization(id=100000 + v, start_location=loc()) for v in range(n_vehicles)],
+    )
+
+
+def summarize(response, seconds):
+    return {
+        "seconds": seconds,
+        "route_hours": sum(r.total_time or 0.0 for r in response.optimized_routes),
+        "route_km": sum(r.total_distance or 0.0 for r in response.optimized_routes),
+        "unassigned": len(response.unassigned_orders or []),
+    }
+
+
+def timed(solve, request):
+    t0 = time.perf_counter()
+    response = solve(request)
+    return summarize(response, time.perf_counter() - t0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--orders-per-vehicle", type=int, default=20)
+    parser.add_argument("--max-single", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(
+        f"workers={settings.decomposition_workers} cluster_orders={settings.decomposition_cluster_orders}"
+    )
+    print(f"{'orders':>7s} {'mode':>11s} {'seconds':>8s} {'route_h':>10s} {'route_km':>10s} {'unassigned':>10s}")
+    for n in args.orders:
+        request = random_request(n, max(1, n // args.orders_per_vehicle), args.seed)
+        rows = []
+        if n <= args.max_single:
+            rows.append(("single", timed(solve_routes, request)))
+        rows.append(("decomposed", timed(solve_decomposed, request)))
+        for mode, row in rows:
+            print(
+                f"{n:>7d} {mode:>11s} {row['seconds']:>8.1f} {row['route_hours']:>10.1f} "
+                f"{row['route_km']:>10.1f} {row['unassigned']:>10d}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Seeded synthetic delivery instances: clustered customers served from several depots.
+
+Used by the benchmark suite; the same ``(orders, seed)`` always gives the
+same request.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+from ..schemas import Location, OptimizeRouteRequest, OrderInOptimization, VehicleInOptimization
+from ..spatial import KM_PER_DEGREE
+
+CITY = (40.73, -73.98)
+# Radius around the city centre that depots and customer clusters are placed in
+CITY_RADIUS_KM = 15.0
+# Customers per cluster (a neighbourhood) and its spread
+CLUSTER_ORDERS = 40
+CLUSTER_SIGMA_KM = 1.2
+# Share of orders picked up at a depot; the rest go between two customers
+DEPOT_PICKUP_SHARE = 0.7
+ORDERS_PER_VEHICLE = 12
+VEHICLE_ID_BASE = 100000
+
+
+def _in_city(rng: np.random.Generator, count: int):
+    radius = CITY_RADIUS_KM * np.sqrt(rng.random(count))
+    angle = rng.uniform(0, 2 * math.pi, count)
+    lat = CITY[0] + radius * np.cos(angle) / KM_PER_DEGREE
+    lng = CITY[1] + radius * np.sin(angle) / (KM_PER_DEGREE * math.cos(math.radians(CITY[0])))
+    return lat, lng
+
+
+def fleet_request(
+    n_orders: int, seed: int = 0, n_depots: Optional[int] = None, time_limit_s: float = 10.0
+) -> OptimizeRouteRequest:
+    """``n_orders`` orders and one vehicle per ``ORDERS_PER_VEHICLE`` of them.
+
+    Customers are drawn around ``n_orders / CLUSTER_ORDERS`` cluster centres.
+    Depots default to one per 250 orders, at least two. Most orders run from
+    the depot nearest their customer to the customer, the rest between two
+    customers. Vehicles are spread over the depots round-robin and start and
+    end at theirs.
+    """
+    rng = np.random.default_rng(seed)
+    n_depots = n_depots or max(2, round(n_orders / 250))
+    depot_lat, depot_lng = _in_city(rng, n_depots)
+    n_clusters = max(1, round(n_orders / CLUSTER_ORDERS))
+    center_lat, center_lng = _in_city(rng, n_clusters)
+    cluster = rng.integers(n_clusters, size=n_orders)
+    north, east = rng.normal(0, CLUSTER_SIGMA_KM, (2, n_orders))
+    lat = center_lat[cluster] + north / KM_PER_DEGREE
+    lng = center_lng[cluster] + east / (KM_PER_DEGREE * math.cos(math.radians(CITY[0])))
+
+    def location(a, b):
+        return Location(latitude=float(a), longitude=float(b))
+
+    nearest_depot = np.argmin((lat[:, None] - depot_lat) ** 2 + (lng[:, None] - depot_lng) ** 2, axis=1)
+    from_depot = rng.random(n_orders) < DEPOT_PICKUP_SHARE
+    other = rng.permutation(n_orders)
+    orders = []
+    for i in range(n_orders):
+        if from_depot[i]:
+            pickup = location(depot_lat[nearest_depot[i]], depot_lng[nearest_depot[i]])
+        else:
+            pickup = location(lat[other[i]], lng[other[i]])
+        orders.append(OrderInOptimization(id=i, pickup_location=pickup, dropoff_location=location(lat[i], lng[i])))
+
+    n_vehicles = max(1, math.ceil(n_orders / ORDERS_PER_VEHICLE))
+    vehicles = []
+    for v in range(n_vehicles):
+        depot = location(depot_lat[v % n_depots], depot_lng[v % n_depots])
+        vehicles.append(VehicleInOptimization(id=VEHICLE_ID_BASE + v, start_location=depot, end_location=depot))
+    return OptimizeRouteRequest(orders=orders, vehicles=vehicles, time_limit_seconds=time_limit_s)
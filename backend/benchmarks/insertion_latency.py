@@ -0,0 +1,131 @@
+"""Measure single-order dispatch latency and check it against brute force.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.insertion_latency --vehicles 50 --stops 20
+
+Builds a random plan, then inserts ``--queries`` random orders with
+``dispatch.RoutePlan.evaluate`` and reports p50/p99 latency. Every answer is
+compared with ``insertion.cheapest_insertion`` run route by route on full
+matrices; exits non-zero if any added time differs.
+
+With ``--road-grid N`` the costs come from a synthetic N x N street grid
+with one-way streets, compiled as in ``benchmarks.road_network``, and all
+locations are drawn on the grid, so both sides route on the road network.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .. import road_network
+from ..benchmarks.road_network import BLOCK_M, ORIGIN, grid_edge_list
+from ..dispatch import RoutePlan
+from ..insertion import cheapest_insertion
+from ..matrix import build_matrices
+from ..optimizer import MAX_ROUTE_DISTANCE_M
+from ..schemas import Location, OptimizedRoute, OrderInOptimization, Stop, VehicleInOptimization
+
+
+# (south, west, north, east) that locations are drawn from
+AREA = [40.4, -74.3, 41.0, -73.7]
+
+
+def random_location(rng):
+    south, west, north, east = AREA
+    return Location(latitude=rng.uniform(south, north), longitude=rng.uniform(west, east))
+
+
+def random_plan(n_vehicles, n_stops, seed):
+    rng = random.Random(seed)
+    vehicles, routes = [], []
+    for v in range(n_vehicles):
+        end = random_location(rng) if v % 2 else None
+        vehicles.append(VehicleInOptimization(id=v, start_location=random_location(rng), end_location=end))
+        stops = [
+            Stop(order_id=v * n_stops + s, location=random_location(rng), type="pickup" if s % 2 == 0 else "dropoff")
+            for s in range(rng.randint(0, n_stops))
+        ]
+        routes.append(OptimizedRoute(vehicle_id=v, stops=stops))
+    return routes, vehicles
+
+
+def brute_force(routes, vehicles, order, max_distance):
+    """Cheapest added time over all routes, computed from per-route matrices."""
+    best = None
+    for vehicle, route in zip(vehicles, routes):
+        points = [vehicle.start_location] + [s.location for s in route.stops]
+        nodes = list(range(len(points)))
+        if vehicle.end_location is None:
+            nodes.append(0)
+        else:
+            points.append(vehicle.end_location)
+            nodes.append(len(points) - 1)
+        points += [order.pickup_location, order.dropoff_location]
+        distance, duration = build_matrices(points)
+        found = cheapest_insertion(distance, duration, nodes, len(points) - 2, len(points) - 1, max_distance)
+        if found is not None and (best is None or found[0] < best):
+            best = found[0]
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vehicles", type=int, default=50)
+    parser.add_argument("--stops", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-distance", type=int, default=MAX_ROUTE_DISTANCE_M)
+    parser.add_argument("--road-grid", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.road_grid:
+        with tempfile.TemporaryDirectory() as tmp:
+            edges = os.path.join(tmp, "edges.csv")
+            _, dlat, dlng = grid_edge_list(edges, args.road_grid, args.seed)
+            road_network.compile_graph(edges, os.path.join(tmp, "graph"))
+            road_network.GRAPH_PATH = os.path.join(tmp, "graph")
+            extent = args.road_grid - 1
+            AREA[:] = [ORIGIN[0], ORIGIN[1], ORIGIN[0] + extent * dlat, ORIGIN[1] + extent * dlng]
+            print(f"road grid {args.road_grid}x{args.road_grid} with {BLOCK_M:g} m blocks")
+            return run(args)
+    return run(args)
+
+
+def run(args):
+    routes, vehicles = random_plan(args.vehicles, args.stops, args.seed)
+    t0 = time.perf_counter()
+    plan = RoutePlan(routes, vehicles)
+    index_ms = (time.perf_counter() - t0) * 1000
+
+    rng = random.Random(args.seed + 1)
+    orders = [
+        OrderInOptimization(id=-q, pickup_location=random_location(rng), dropoff_location=random_location(rng))
+        for q in range(args.queries)
+    ]
+    latencies, mismatches = [], 0
+    for order in orders:
+        t0 = time.perf_counter()
+        result = plan.evaluate(order, args.max_distance)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        expected = brute_force(routes, vehicles, order, args.max_distance)
+        got = None if result.vehicle_id is None else round(result.added_time * 3600)
+        if got != expected:
+            mismatches += 1
+            print(f"order {order.id}: dispatch={got} brute_force={expected}")
+
+    stops = sum(len(r.stops) for r in routes)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{args.vehicles} vehicles, {stops} stops: index {index_ms:.2f} ms, p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+    if mismatches:
+        print(f"{mismatches}/{len(orders)} insertions differ from brute force")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
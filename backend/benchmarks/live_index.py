@@ -0,0 +1,80 @@
+"""Measure live spatial index query latency and check answers against brute force.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.live_index --points 500 5000 50000
+
+Fills a ``spatial.LiveIndex`` with random points around a city (a third of
+them "idle"), then times ``--queries`` nearest-idle, radius and move
+operations and reports mean and p99 in microseconds. Every answer is
+compared with a linear scan; exits non-zero on any difference.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from ..spatial import LiveIndex, haversine
+
+
+def percentiles(samples):
+    q = statistics.quantiles(samples, n=100)
+    return statistics.fmean(samples) * 1e6, q[98] * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[500, 5000, 50000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius-km", type=float, default=2.0)
+    parser.add_argument("--cell-deg", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    def where(item):
+        return item["status"] == "idle"
+
+    mismatches = 0
+    print(f"{'points':>7s} {'nearest_us':>11s} {'p99':>7s} {'within_us':>10s} {'p99':>7s} {'move_us':>8s}")
+    for n in args.points:
+        index, points = LiveIndex(args.cell_deg), {}
+        for key in range(n):
+            lat, lng = 40.7 + rng.uniform(-0.3, 0.3), -74.0 + rng.uniform(-0.3, 0.3)
+            item = {"status": "idle" if rng.random() < 1 / 3 else "busy"}
+            index.upsert(key, lat, lng, item)
+            points[key] = (lat, lng, item)
+
+        nearest_s, within_s, move_s = [], [], []
+        for _ in range(args.queries):
+            lat, lng = 40.7 + rng.uniform(-0.3, 0.3), -74.0 + rng.uniform(-0.3, 0.3)
+            t0 = time.perf_counter()
+            hits = index.nearest(lat, lng, args.k, where=where)
+            nearest_s.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            inside = index.within(lat, lng, args.radius_km)
+            within_s.append(time.perf_counter() - t0)
+
+            scan = sorted((haversine(lat, lng, p[0], p[1]), key) for key, p in points.items() if where(p[2]))
+            mismatches += [key for _, key, _ in hits] != [key for _, key in scan[: args.k]]
+            scan = sorted((haversine(lat, lng, p[0], p[1]), key) for key, p in points.items())
+            mismatches += [key for _, key, _ in inside] != [key for d, key in scan if d <= args.radius_km]
+
+            key = rng.randrange(n)
+            lat, lng = points[key][0] + rng.uniform(-0.01, 0.01), points[key][1] + rng.uniform(-0.01, 0.01)
+            t0 = time.perf_counter()
+            index.upsert(key, lat, lng, points[key][2])
+            move_s.append(time.perf_counter() - t0)
+            points[key] = (lat, lng, points[key][2])
+
+        (nm, n99), (wm, w99) = percentiles(nearest_s), percentiles(within_s)
+        print(f"{n:>7d} {nm:>11.1f} {n99:>7.1f} {wm:>10.1f} {w99:>7.1f} {statistics.fmean(move_s) * 1e6:>8.2f}")
+    if mismatches:
+        print(f"{mismatches} answers differ from brute force")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare the vectorized matrix builder against the per-pair scalar path.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.matrix_build --sizes 50 100 200
+
+For every size the scalar reference is run once, its output is checked for
+bit-for-bit equality with ``matrix.build_matrices`` and both timings are
+reported. The cached path is checked the same way, once filling an empty
+``matrix_cache.TravelTimeCache`` and once served from it. Exits non-zero on
+any mismatch.
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from ..matrix import build_matrices
+from ..matrix_cache import TravelTimeCache
+from ..schemas import Location
+from ..travel_time import current_model, euclidean_distance
+
+
+def scalar_matrices(locations):
+    """The original double loop from ``optimize_routes``.
+
+    Travel times come from the LightGBM booster itself, not the step table
+    compiled from it, so the check also covers the compilation.
+    """
+    booster = current_model().booster
+    size = len(locations)
+    distance_matrix = [[0] * size for _ in range(size)]
+    time_matrix = [[0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(size):
+            if i != j:
+                dist_km = euclidean_distance(locations[i], locations[j])
+                distance_matrix[i][j] = int(dist_km * 1000)
+                time_matrix[i][j] = int(booster.predict(np.array([[dist_km]]))[0] * 3600)
+    return distance_matrix, time_matrix
+
+
+def matches(matrices, ref) -> bool:
+    return all(np.array_equal(got, want) for got, want in zip(matrices, ref))
+
+
+def random_locations(n, seed):
+    rng = random.Random(seed)
+    return [
+        Location(latitude=40.7 + rng.uniform(-0.3, 0.3), longitude=-74.0 + rng.uniform(-0.3, 0.3))
+        for _ in range(n)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for size in args.sizes:
+        locations = random_locations(size, args.seed)
+
+        t0 = time.perf_counter()
+        ref_distance, ref_time = scalar_matrices(locations)
+        scalar_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        distance, duration = build_matrices(locations)
+        vector_s = time.perf_counter() - t0
+
+        ref = (np.array(ref_distance, dtype=np.int64), np.array(ref_time, dtype=np.int64))
+        same = matches((distance, duration), ref)
+        cache = TravelTimeCache(size)
+        cold = matches(build_matrices(locations, cache=cache), ref)
+        warm = matches(build_matrices(locations, cache=cache), ref)
+        failed |= not (same and cold and warm)
+        print(
+            f"locations={size:5d} scalar={scalar_s * 1000:9.1f} ms "
+            f"vectorized={vector_s * 1000:8.1f} ms speedup={scalar_s / vector_s:7.1f}x "
+            f"parity={'ok' if same else 'MISMATCH'} "
+            f"cached={'ok' if cold and warm else 'MISMATCH'}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Submit identical optimize_routes requests and count the solves they cost.
+
+Runs in-process, no database needed. Run from the repository root:
+
+    python -m backend.benchmarks.optimize_dedupe --orders 40 --vehicles 4 --concurrent 8 --seconds 2
+
+``--concurrent`` identical requests are posted at once, the orders and
+vehicles of each one shuffled, so only the first should start a solve and
+the rest join it. Then one more copy is posted, which should be served from
+the result cache. The X-Optimization-Cache header and latency of every
+response are printed with the number of solves the optimizer ran. Exits
+non-zero unless exactly one solve ran and every response has the same routes.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import httpx
+
+from ..benchmarks.decomposition import random_request
+from ..jobs import job_manager
+from ..main import app
+from ..result_cache import OPTIMIZATION_CACHE_HEADER
+
+
+def shuffled(payload: dict, rng: random.Random) -> dict:
+    payload = dict(payload, orders=list(payload["orders"]), vehicles=list(payload["vehicles"]))
+    rng.shuffle(payload["orders"])
+    rng.shuffle(payload["vehicles"])
+    return payload
+
+
+def routes_by_vehicle(body: dict):
+    return sorted((r["vehicle_id"], [(s["order_id"], s["type"]) for s in r["stops"]]) for r in body["optimized_routes"])
+
+
+async def run(args) -> int:
+    request = random_request(args.orders, args.vehicles, args.seed)
+    request.time_limit_seconds = args.seconds
+    payload = request.model_dump()
+    rng = random.Random(args.seed)
+    solves = []
+
+    async def count_solve(job):
+        solves.append(job.id)
+
+    job_manager.add_listener(count_solve)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def post():
+            t0 = time.perf_counter()
+            response = await client.post("/optimize_routes", json=shuffled(payload, rng))
+            response.raise_for_status()
+            return response, time.perf_counter() - t0
+
+        results = await asyncio.gather(*(post() for _ in range(args.concurrent)))
+        results.append(await post())
+    await job_manager.shutdown()
+
+    routes = {repr(routes_by_vehicle(response.json())) for response, _ in results}
+    for i, (response, seconds) in enumerate(results):
+        print(f"request {i:>2d}  {response.headers[OPTIMIZATION_CACHE_HEADER]:<6s} {seconds:>7.2f}s")
+    print(f"solves={len(solves)} distinct plans={len(routes)}")
+    return 0 if len(solves) == 1 and len(routes) == 1 else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=40)
+    parser.add_argument("--vehicles", type=int, default=4)
+    parser.add_argument("--concurrent", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
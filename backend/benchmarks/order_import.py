@@ -0,0 +1,118 @@
+"""Measure bulk order import throughput.
+
+Against a running API with its database, from the repository root:
+
+    python -m backend.benchmarks.order_import --url http://localhost:8000 --rows 20000
+
+posts ``--rows`` generated orders to ``POST /orders/import`` as one streamed
+CSV (or ``--format ndjson``) body with ``on_conflict=update``, so it can be
+rerun. It then creates ``--single`` orders one ``POST /orders`` at a time
+for comparison. Generated ids start at ``--first-id``.
+
+With ``--parse-only`` no server is needed: the same body is parsed and
+validated in-process, with the COPY and merge left out.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from ..order_import import COLUMNS, parse_csv, parse_ndjson
+from ..schemas import OrderCreate
+
+CHUNK_ROWS = 2000
+
+
+def order(i):
+    return {
+        "id": i,
+        "customer_name": f"Customer {i}",
+        "pickup_address": f"{i} Main St",
+        "dropoff_address": f"{i} Elm St",
+        "status": "pending",
+        "pickup_lat": 40.7 + (i % 600 - 300) / 1000,
+        "pickup_lng": -74.0 + (i % 587 - 293) / 1000,
+        "dropoff_lat": 40.7 + (i % 421 - 210) / 1000,
+        "dropoff_lng": -74.0 + (i % 397 - 198) / 1000,
+    }
+
+
+def body(fmt, first_id, rows):
+    """Yield the request body in chunks of ``CHUNK_ROWS`` rows."""
+    if fmt == "csv":
+        yield (",".join(COLUMNS) + "\n").encode()
+    for start in range(first_id, first_id + rows, CHUNK_ROWS):
+        ids = range(start, min(start + CHUNK_ROWS, first_id + rows))
+        if fmt == "csv":
+            lines = (",".join(str(order(i)[c]) for c in COLUMNS) for i in ids)
+        else:
+            lines = (OrderCreate(**order(i)).model_dump_json() for i in ids)
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def parse_only(args):
+    data = list(body(args.format, args.first_id, args.rows))
+
+    async def chunks():
+        for chunk in data:
+            yield chunk
+
+    parser = parse_csv if args.format == "csv" else parse_ndjson
+    t0 = time.perf_counter()
+    valid = 0
+    async for _, row, _ in parser(chunks()):
+        OrderCreate.model_validate(row)
+        valid += 1
+    seconds = time.perf_counter() - t0
+    print(f"parsed and validated {valid} rows in {seconds:.2f} s ({valid / seconds:.0f} rows/s)")
+
+
+async def against_server(args):
+    content_type = "text/csv" if args.format == "csv" else "application/x-ndjson"
+    async with httpx.AsyncClient(base_url=args.url, timeout=600) as client:
+
+        async def chunks():
+            for chunk in body(args.format, args.first_id, args.rows):
+                yield chunk
+
+        t0 = time.perf_counter()
+        response = await client.post(
+            "/orders/import",
+            params={"on_conflict": "update"},
+            content=chunks(),
+            headers={"Content-Type": content_type},
+        )
+        seconds = time.perf_counter() - t0
+        response.raise_for_status()
+        result = response.json()
+        print(
+            f"bulk import: {args.rows} rows in {seconds:.2f} s ({args.rows / seconds:.0f} rows/s), "
+            f"inserted={result['inserted']} updated={result['updated']} rejected={result['rejected']}"
+        )
+
+        if args.single:
+            start = args.first_id + args.rows
+            for i in range(start, start + args.single):
+                await client.delete(f"/orders/{i}")
+            t0 = time.perf_counter()
+            for i in range(start, start + args.single):
+                (await client.post("/orders", json=order(i))).raise_for_status()
+            seconds = time.perf_counter() - t0
+            print(f"POST /orders: {args.single} rows in {seconds:.2f} s ({args.single / seconds:.0f} rows/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--first-id", type=int, default=10_000_000)
+    parser.add_argument("--single", type=int, default=500)
+    parser.add_argument("--parse-only", action="store_true")
+    args = parser.parse_args(argv)
+    asyncio.run(parse_only(args) if args.parse_only else against_server(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Show the nearby-orders query moving from a sequential scan to a GiST index scan.
+
+Needs the PostGIS database from ``database.DATABASE_URL``. Run from the
+repository root:
+
+    python -m backend.benchmarks.postgis_nearby --rows 3000000
+
+Seeds a scratch ``bench_orders`` table (dropped afterwards unless
+``--keep``) with random pickups around a city. Three queries are
+explained and timed, before and after creating the GiST index: the old
+endpoint query that builds a point from lat/lng for every row, the radius
+filter on the generated geography column, and the same filter with KNN
+ordering and a limit.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from ..database import DATABASE_URL
+
+POINT = "ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography"
+QUERIES = {
+    "lat/lng per row": f"""
+        SELECT id FROM bench_orders
+        WHERE pickup_lat IS NOT NULL AND pickup_lng IS NOT NULL
+        AND ST_DWithin(ST_SetSRID(ST_MakePoint(pickup_lng, pickup_lat), 4326)::geography, {POINT}, :radius_m)
+    """,
+    "geography": f"SELECT id FROM bench_orders WHERE ST_DWithin(pickup_geog, {POINT}, :radius_m)",
+    "geography knn": f"""
+        SELECT id FROM bench_orders WHERE ST_DWithin(pickup_geog, {POINT}, :radius_m)
+        ORDER BY pickup_geog <-> {POINT} LIMIT :limit
+    """,
+}
+
+
+def plan_nodes(plan, depth=0):
+    yield depth, plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child, depth + 1)
+
+
+async def explain(conn, sql, params):
+    result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params)
+    document = result.scalar()
+    document = json.loads(document) if isinstance(document, str) else document
+    return document[0]
+
+
+async def measure(conn, label, params, repeat):
+    print(f"-- {label}")
+    for name, sql in QUERIES.items():
+        explained = await explain(conn, sql, params)
+        scans = [
+            f"{'  ' * depth}{node['Node Type']}" + (f" using {node['Index Name']}" if "Index Name" in node else "")
+            for depth, node in plan_nodes(explained["Plan"])
+        ]
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            rows = len((await conn.execute(text(sql), params)).all())
+            timings.append(time.perf_counter() - t0)
+        print(f"{name:>16s}: {statistics.median(timings) * 1000:8.1f} ms median, {rows} rows")
+        for line in scans:
+            print(f"{'':>18s}{line}")
+
+
+async def run(args):
+    engine = create_async_engine(DATABASE_URL)
+    params = {"lat": 40.7, "lng": -74.0, "radius_m": args.radius_km * 1000, "limit": args.limit}
+    async with engine.connect() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS bench_orders"))
+        await conn.execute(
+            text(
+                """
+                CREATE TABLE bench_orders (
+                    id integer PRIMARY KEY,
+                    pickup_lat double precision,
+                    pickup_lng double precision,
+                    pickup_geog geography(Point, 4326)
+                        GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(pickup_lng, pickup_lat), 4326)::geography) STORED
+                )
+                """
+            )
+        )
+        t0 = time.perf_counter()
+        await conn.execute(
+            text(
+                """
+                INSERT INTO bench_orders (id, pickup_lat, pickup_lng)
+                SELECT g, 40.7 + (random() - 0.5) * :spread, -74.0 + (random() - 0.5) * :spread
+                FROM generate_series(1, :rows) AS g
+                """
+            ),
+            {"rows": args.rows, "spread": args.spread_deg},
+        )
+        await conn.execute(text("ANALYZE bench_orders"))
+        await conn.commit()
+        print(f"seeded {args.rows} rows in {time.perf_counter() - t0:.1f} s")
+
+        await measure(conn, "without index", params, args.repeat)
+        t0 = time.perf_counter()
+        await conn.execute(text("CREATE INDEX ix_bench_orders_pickup_geog ON bench_orders USING gist (pickup_geog)"))
+        await conn.execute(text("ANALYZE bench_orders"))
+        await conn.commit()
+        print(f"built GiST index in {time.perf_counter() - t0:.1f} s")
+        await measure(conn, "with GiST index", params, args.repeat)
+
+        if not args.keep:
+            await conn.execute(text("DROP TABLE bench_orders"))
+            await conn.commit()
+    await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--spread-deg", type=float, default=2.0)
+    parser.add_argument("--radius-km", type=float, default=2.0)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true")
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
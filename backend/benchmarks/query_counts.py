@@ -0,0 +1,83 @@
+"""Check that every write endpoint costs a single database statement.
+
+Needs the API's database. Run from the repository root:
+
+    python -m backend.benchmarks.query_counts --first-id 900000000
+
+The app is driven in-process, and the statements each request executes are
+read from the ``ecoroute_db_queries_per_request`` histogram. The script
+creates, updates, moves and deletes orders and vehicles with ids from
+``--first-id``, including the 400 and 404 paths, and cleans up after itself.
+It prints the count per request and exits non-zero if any exceeds ``--max``.
+"""
+import argparse
+import sys
+
+from fastapi.testclient import TestClient
+
+from ..main import app
+from ..metrics import DB_QUERIES
+
+
+def order(oid, name="bench"):
+    return {
+        "id": oid,
+        "customer_name": name,
+        "pickup_address": "a",
+        "dropoff_address": "b",
+        "pickup_lat": 40.7,
+        "pickup_lng": -74.0,
+        "dropoff_lat": 40.8,
+        "dropoff_lng": -73.9,
+    }
+
+
+def vehicle(vid, name="bench"):
+    return {"id": vid, "name": name, "current_lat": 40.7, "current_lng": -74.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--first-id", type=int, default=900_000_000)
+    parser.add_argument("--max", type=int, default=1)
+    args = parser.parse_args(argv)
+    oid, vid = args.first_id, args.first_id
+    bulk = [vehicle(vid), vehicle(vid + 1), vehicle(vid + 2)]
+
+    # (method, url, route template, body, expected status)
+    steps = [
+        ("post", "/orders", "/orders", order(oid), 200),
+        ("post", "/orders", "/orders", order(oid), 400),
+        ("put", f"/orders/{oid}", "/orders/{order_id}", order(oid, "renamed"), 200),
+        ("put", f"/orders/{oid + 1}", "/orders/{order_id}", order(oid + 1), 404),
+        ("delete", f"/orders/{oid}", "/orders/{order_id}", None, 200),
+        ("delete", f"/orders/{oid}", "/orders/{order_id}", None, 404),
+        ("post", "/vehicles", "/vehicles", vehicle(vid), 200),
+        ("post", "/vehicles", "/vehicles", vehicle(vid), 400),
+        ("put", f"/vehicles/{vid}", "/vehicles/{vehicle_id}", vehicle(vid, "renamed"), 200),
+        ("put", f"/vehicles/{vid + 9}", "/vehicles/{vehicle_id}", vehicle(vid + 9), 404),
+        ("post", f"/vehicles/{vid}/telemetry", "/vehicles/{vehicle_id}/telemetry", {"current_lat": 40.71, "current_lng": -74.01}, 200),
+        ("post", f"/vehicles/{vid + 9}/telemetry", "/vehicles/{vehicle_id}/telemetry", {"current_lat": 40.71, "current_lng": -74.01}, 404),
+        ("post", "/vehicles/bulk", "/vehicles/bulk", {"vehicles": bulk}, 200),
+    ] + [
+        ("delete", f"/vehicles/{v['id']}", "/vehicles/{vehicle_id}", None, 200) for v in bulk
+    ]
+
+    # No lifespan: the live index and background flushers are not needed here.
+    client = TestClient(app)
+    # The first connection runs the dialect's setup queries; keep them out of the counts.
+    client.get(f"/orders/{oid}")
+    failed = False
+    print(f"{'request':<40s} {'status':>6s} {'queries':>7s}")
+    for method, url, route, body, expected in steps:
+        before = DB_QUERIES.totals(route=route)[1]
+        response = client.request(method, url, json=body)
+        queries = int(DB_QUERIES.totals(route=route)[1] - before)
+        bad = response.status_code != expected or queries > args.max
+        failed |= bad
+        print(f"{method.upper() + ' ' + url:<40s} {response.status_code:>6d} {queries:>7d}{'  FAIL' if bad else ''}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
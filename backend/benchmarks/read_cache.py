@@ -0,0 +1,132 @@
+"""Exercise the read-through cache: hit rate, latency and staleness under concurrent writes.
+
+Runs without a database. Run from the repository root:
+
+    python -m backend.benchmarks.read_cache --readers 50 --writes 200 --rows 100 --db-ms 2
+
+A dict with ``--db-ms`` of simulated query latency stands in for Postgres.
+Readers repeatedly get random rows through the cache while a writer
+updates rows and invalidates the namespace, as the write handlers do. Any
+read that returns a row older than the last write completed before the
+read began counts as stale, and the script exits non-zero if there is
+one. ``--backend redis`` runs the same workload through ``RedisBackend``
+on an in-process stand-in client with ``--redis-ms`` of round-trip
+latency, or on a real server given ``--redis-url`` (needs the ``redis``
+package).
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from ..cache import MemoryBackend, ReadThroughCache, RedisBackend
+
+
+class StandInRedis:
+    """The subset of ``redis.asyncio.Redis`` the cache uses, with a fixed round-trip delay."""
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self._data = {}
+
+    async def get(self, key):
+        await asyncio.sleep(self.latency_s)
+        entry = self._data.get(key)
+        if entry is None or (entry[0] is not None and entry[0] <= time.monotonic()):
+            return None
+        return entry[1]
+
+    async def set(self, key, value, px=None):
+        await asyncio.sleep(self.latency_s)
+        self._data[key] = (time.monotonic() + px / 1000 if px else None, value)
+
+    async def incr(self, key):
+        await asyncio.sleep(self.latency_s)
+        value = int(self._data.get(key, (None, 0))[1]) + 1
+        self._data[key] = (None, str(value).encode())
+        return value
+
+
+async def run(args) -> int:
+    if args.backend == "memory":
+        backend = MemoryBackend(args.rows * 4)
+    elif args.redis_url:
+        import redis.asyncio as redis
+
+        backend = RedisBackend(redis.from_url(args.redis_url), prefix=f"ecoroute-bench-{time.time_ns()}:")
+    else:
+        backend = RedisBackend(StandInRedis(args.redis_ms / 1000))
+    cache = ReadThroughCache(backend, args.ttl)
+    db = {i: 0 for i in range(args.rows)}
+    # Last version of every row whose write and invalidation have completed
+    committed = dict(db)
+    latencies = {True: [], False: []}
+    stale = 0
+    writing = True
+
+    async def load(row):
+        await asyncio.sleep(args.db_ms / 1000)
+        return {"id": row, "version": db[row]}
+
+    async def reader():
+        nonlocal stale
+        while writing:
+            row = random.randrange(args.rows)
+            floor = committed[row]
+            loads = []
+
+            async def counted_load():
+                loads.append(1)
+                return await load(row)
+
+            t0 = time.perf_counter()
+            value = await cache.get_or_load("bench", f"id:{row}", counted_load)
+            latencies[not loads].append(time.perf_counter() - t0)
+            if value["version"] < floor:
+                stale += 1
+            # In-process hits never suspend; let the writer run.
+            await asyncio.sleep(0)
+
+    async def writer():
+        nonlocal writing
+        for _ in range(args.writes):
+            await asyncio.sleep(args.write_interval_ms / 1000)
+            row = random.randrange(args.rows)
+            await asyncio.sleep(args.db_ms / 1000)
+            db[row] += 1
+            await cache.invalidate("bench")
+            committed[row] = db[row]
+        writing = False
+
+    t0 = time.perf_counter()
+    await asyncio.gather(writer(), *(reader() for _ in range(args.readers)))
+    elapsed = time.perf_counter() - t0
+    hits, misses = len(latencies[True]), len(latencies[False])
+    print(f"backend={args.backend} reads={hits + misses} in {elapsed:.1f}s  hit rate={hits / max(1, hits + misses):.1%}")
+    for hit, label in ((True, "hit"), (False, "miss")):
+        if latencies[hit]:
+            ms = sorted(x * 1000 for x in latencies[hit])
+            print(f"  {label:<5s} median={statistics.median(ms):.3f}ms  p99={ms[int(len(ms) * 0.99) - 1]:.3f}ms")
+    print(f"  stale reads={stale}")
+    return 1 if stale else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["memory", "redis"], default="memory")
+    parser.add_argument("--redis-url", default=None)
+    parser.add_argument("--redis-ms", type=float, default=0.2)
+    parser.add_argument("--readers", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--write-interval-ms", type=float, default=5)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--db-ms", type=float, default=2)
+    parser.add_argument("--ttl", type=float, default=30)
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Check road-network matrices on a synthetic grid graph against plain Dijkstra and time them.
+
+No network or map data is needed. Run from the repository root:
+
+    python -m backend.benchmarks.road_network --grid 60 --points 400
+
+A ``--grid`` x ``--grid`` street grid with 200 m blocks is written as an
+edge list. Each block is 0-60% longer than the straight line, some streets
+are one-way and some are removed. A small island of streets is added that
+cannot be reached from the grid, and the list is compiled with contraction
+hierarchies. Random points are then routed between, some of them on the
+island and some too far from any street to snap. Their matrix is compared
+with per-source Dijkstra on the uncompiled graph plus the snap legs.
+Unsnappable and unconnected pairs must have no road distance. The compile
+time and both query times are printed. Finally ``build_matrices`` is run
+with the graph configured to show the great-circle fallback. Exits non-zero
+on any mismatch. Search processes come from ECOROUTE_ROAD_MATRIX_WORKERS.
+"""
+import argparse
+import csv
+import heapq
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .. import road_network
+from ..matrix import build_matrices
+from ..road_network import RoadNetwork, compile_graph, read_edge_list
+from ..schemas import Location
+from ..settings import settings
+from ..spatial import KM_PER_DEGREE, haversine
+
+ORIGIN = (40.70, -74.02)
+BLOCK_M = 200.0
+
+
+def grid_edge_list(path: str, n: int, seed: int):
+    rng = np.random.default_rng(seed)
+    dlat = BLOCK_M / 1000 / KM_PER_DEGREE
+    dlng = dlat / math.cos(math.radians(ORIGIN[0]))
+
+    def coord(i, j, base=ORIGIN):
+        return base[0] + i * dlat, base[1] + j * dlng
+
+    rows = []
+
+    def street(a, b):
+        length = haversine(*a, *b) * 1000 * rng.uniform(1.0, 1.6)
+        oneway = int(rng.random() < 0.15)
+        rows.append([*a, *b, f"{float(length):.3f}", oneway])
+
+    for i in range(n):
+        for j in range(n):
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < n and j + dj < n and rng.random() > 0.05:
+                    street(coord(i, j), coord(i + di, j + dj))
+    # An island east of the grid with no street to it
+    island = (ORIGIN[0], ORIGIN[1] + (n + 10) * dlng)
+    for i in range(3):
+        street(coord(i, 0, island), coord(i + 1, 0, island))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["from_lat", "from_lng", "to_lat", "to_lng", "length_m", "oneway"])
+        writer.writerows(rows)
+    return island, dlat, dlng
+
+
+def dijkstra(adjacency, source: int) -> dict:
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    done = set()
+    while heap:
+        d, v = heapq.heappop(heap)
+        if v in done:
+            continue
+        done.add(v)
+        for w, length in adjacency[v]:
+            if d + length < dist.get(w, math.inf):
+                dist[w] = d + length
+                heapq.heappush(heap, (d + length, w))
+    return dist
+
+
+def random_points(n_grid: int, count: int, island, dlat: float, dlng: float, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    lat = ORIGIN[0] + rng.uniform(0, n_grid - 1, count) * dlat
+    lng = ORIGIN[1] + rng.uniform(0, n_grid - 1, count) * dlng
+    # A few on the island and a few 5 km north of everything
+    lat[:3], lng[:3] = island[0] + np.arange(3) * dlat, island[1]
+    lat[3:6] = ORIGIN[0] + 5 / KM_PER_DEGREE + n_grid * dlat
+    return lat, lng
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid", type=int, default=60)
+    parser.add_argument("--points", type=int, default=400)
+    parser.add_argument("--check-sources", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        edges, graph = os.path.join(tmp, "edges.csv"), os.path.join(tmp, "graph")
+        island, dlat, dlng = grid_edge_list(edges, args.grid, args.seed)
+        t0 = time.perf_counter()
+        compile_graph(edges, graph)
+        compile_s = time.perf_counter() - t0
+        network = RoadNetwork(graph, settings.road_snap_m)
+        ch_edges = network.up_targets.size + network.down_targets.size
+        n_nodes = network.node_lat.size
+        print(f"grid {args.grid}x{args.grid}: {n_nodes} nodes, {ch_edges} CH edges, compiled in {compile_s:.1f}s")
+
+        lat, lng, src, dst, length_m = read_edge_list(edges)
+        adjacency = [[] for _ in range(lat.size)]
+        for a, b, length in zip(src.tolist(), dst.tolist(), length_m.tolist()):
+            adjacency[a].append((b, length))
+
+        plat, plng = random_points(args.grid, args.points, island, dlat, dlng, args.seed)
+        t0 = time.perf_counter()
+        road_km = network.matrix_km(plat, plng, plat, plng)
+        ch_s = time.perf_counter() - t0
+
+        nodes, offset_m = network.snap(plat, plng)
+        t0 = time.perf_counter()
+        worst = 0.0
+        for i in range(args.points):
+            reference = dijkstra(adjacency, int(nodes[i])) if nodes[i] >= 0 else {}
+            if i >= max(args.check_sources, 6):
+                continue
+            expected = np.array(
+                [
+                    (offset_m[i] + reference[t] + offset_m[j]) / 1000 if t in reference else np.nan
+                    for j, t in enumerate(nodes.tolist())
+                ]
+            )
+            if not np.array_equal(np.isnan(expected), np.isnan(road_km[i])):
+                print(f"source {i}: road distance missing or unexpected  FAIL")
+                ok = False
+            known = ~np.isnan(expected)
+            if known.any():
+                worst = max(worst, float(np.max(np.abs(expected[known] - road_km[i][known]))))
+        dijkstra_s = time.perf_counter() - t0
+        ok &= worst < 1e-9
+        snapped = int((nodes >= 0).sum())
+        print(
+            f"{args.points} points ({snapped} snapped): CH matrix {ch_s:.2f}s, Dijkstra per source {dijkstra_s:.2f}s,"
+            f" max error {worst * 1000:.2g} m{'' if worst < 1e-9 else '  FAIL'}"
+        )
+        unreachable = int(np.isnan(road_km).sum())
+        print(f"pairs without road distance (haversine fallback): {unreachable} of {road_km.size}")
+
+        road_network.GRAPH_PATH = graph
+        locations = [Location(latitude=a, longitude=b) for a, b in zip(plat[:60], plng[:60])]
+        distance, _ = build_matrices(locations)
+        road_network.GRAPH_PATH = ""
+        straight, _ = build_matrices(locations)
+        fallback = np.isnan(road_km[:60, :60]) & ~np.eye(60, dtype=bool)
+        same = np.array_equal(distance[fallback], straight[fallback])
+        longer = float(np.mean(distance[~fallback] >= straight[~fallback]))
+        print(f"build_matrices: fallback cells equal great-circle: {same}; road >= straight in {longer:.1%} of others")
+        ok &= same
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
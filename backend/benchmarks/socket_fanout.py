@@ -0,0 +1,160 @@
+"""Load-test vehicle fan-out to many Socket.IO clients.
+
+Run from the repository root (no database needed):
+
+    python -m backend.benchmarks.socket_fanout --clients 300 --vehicles 500 --seconds 20
+
+Serves the API in-process, connects ``--clients`` websocket clients and moves
+``--vehicles`` vehicles, each reporting every ``--ping-interval`` seconds.
+With ``--mode rooms`` every client subscribes to a random viewport of
+``--viewport-deg`` degrees and receives throttled ``vehicle_deltas`` frames;
+``--mode broadcast`` reproduces the previous behaviour of emitting every
+full vehicle to every client. Frames and bytes received and the latency
+from a frame leaving the server to its arrival are reported.
+
+Clients speak the Engine.IO v4 websocket protocol directly, so only the
+``websockets`` package is needed.
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import statistics
+import time
+
+import uvicorn
+import websockets
+
+from ..fanout import vehicle_fanout
+from ..sockets import sio
+
+CENTER = (40.7, -74.0)
+SPREAD_DEG = 0.3
+
+
+class Client:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.vehicles = 0
+        self.latencies = []
+
+    async def run(self, url, subscription, ready, stop):
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.recv()  # Engine.IO open packet
+            await ws.send("40")
+            await ws.recv()  # namespace connected
+            if subscription is not None:
+                await ws.send("420" + json.dumps(list(subscription)))
+            ready.release()
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                if message == "2":
+                    await ws.send("3")
+                elif message.startswith("42"):
+                    received = time.time()
+                    _, data = json.loads(message[2:])
+                    self.frames += 1
+                    self.bytes += len(message)
+                    self.vehicles += len(data.get("vehicles", [data]))
+                    self.latencies.append(received - data["ts"])
+
+
+async def move_vehicles(args, rng, mode, stop):
+    vehicles = [
+        {
+            "id": vid,
+            "name": f"vehicle-{vid}",
+            "status": "busy",
+            "current_lat": CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+            "current_lng": CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+        }
+        for vid in range(args.vehicles)
+    ]
+    tick_s = 0.05
+    per_tick = max(1, round(args.vehicles * tick_s / args.ping_interval))
+    position = 0
+    while not stop.is_set():
+        for _ in range(per_tick):
+            vehicle = vehicles[position % len(vehicles)]
+            position += 1
+            vehicle["current_lat"] += rng.uniform(-0.001, 0.001)
+            vehicle["current_lng"] += rng.uniform(-0.001, 0.001)
+            if mode == "rooms":
+                vehicle_fanout.publish(dict(vehicle))
+            else:
+                await sio.emit("vehicle_update", {**vehicle, "ts": time.time()})
+        await asyncio.sleep(tick_s)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run(args):
+    from ..main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    rng = random.Random(args.seed)
+    url = f"ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket"
+    stop, ready = asyncio.Event(), asyncio.Semaphore(0)
+    clients = [Client() for _ in range(args.clients)]
+    tasks = []
+    for client in clients:
+        subscription = None
+        if args.mode == "rooms":
+            south = CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG - args.viewport_deg)
+            west = CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG - args.viewport_deg)
+            viewport = {"south": south, "west": west, "north": south + args.viewport_deg, "east": west + args.viewport_deg}
+            subscription = ("subscribe_viewport", viewport)
+        tasks.append(asyncio.create_task(client.run(url, subscription, ready, stop)))
+    for _ in clients:
+        await ready.acquire()
+
+    mover = asyncio.create_task(move_vehicles(args, rng, args.mode, stop))
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(mover, *tasks)
+    server.should_exit = True
+    await serving
+
+    latencies = sorted(l for c in clients for l in c.latencies)
+    frames = sum(c.frames for c in clients)
+    total_bytes = sum(c.bytes for c in clients)
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    print(
+        f"mode={args.mode} clients={args.clients} vehicles={args.vehicles} ping_interval={args.ping_interval}s"
+        f" seconds={args.seconds}"
+    )
+    print(f"frames received       {frames} ({frames / args.seconds:.0f}/s)")
+    print(f"vehicle updates       {sum(c.vehicles for c in clients)}")
+    print(f"bytes received        {total_bytes} ({total_bytes / args.seconds / 1024:.0f} KiB/s)")
+    print(f"bytes per client      {total_bytes / args.clients / args.seconds:.0f} B/s")
+    print(f"emit latency p50/p99  {q[49] * 1000:.1f} / {q[98] * 1000:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["rooms", "broadcast"], default="rooms")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--vehicles", type=int, default=500)
+    parser.add_argument("--ping-interval", type=float, default=2.0)
+    parser.add_argument("--viewport-deg", type=float, default=0.1)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
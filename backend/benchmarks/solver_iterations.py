@@ -0,0 +1,110 @@
+"""Count search work done in a fixed time budget: Python callbacks vs native matrices.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.solver_iterations --orders 100 --vehicles 5 --seconds 5
+
+Both variants solve the same problem with guided local search so the whole
+budget is spent searching. The solver's branch, accepted-neighbor and
+solution counters show how much more of the search space the native
+transit matrices let OR-Tools explore.
+"""
+import argparse
+import random
+
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+from ..optimizer import (
+    DROP_PENALTY,
+    MAX_ROUTE_DISTANCE_M,
+    MAX_ROUTE_TIME_S,
+    SolverModel,
+    build_model,
+    build_problem,
+    default_search_parameters,
+)
+from ..schemas import Location, OptimizeRouteRequest, OrderInOptimization, VehicleInOptimization
+
+
+def build_callback_model(problem) -> SolverModel:
+    """The previous model: nested lists behind Python transit callbacks."""
+    manager = pywrapcp.RoutingIndexManager(
+        problem.size, len(problem.request.vehicles), problem.start_indices, problem.end_indices
+    )
+    routing = pywrapcp.RoutingModel(manager)
+    distance_matrix = problem.distance.tolist()
+    time_matrix = problem.duration.tolist()
+
+    def distance_callback(from_index, to_index):
+        from_node = manager.IndexToNode(from_index)
+        to_node = manager.IndexToNode(to_index)
+        return distance_matrix[from_node][to_node]
+
+    def time_callback(from_index, to_index):
+        from_node = manager.IndexToNode(from_index)
+        to_node = manager.IndexToNode(to_index)
+        return time_matrix[from_node][to_node]
+
+    distance_cb = routing.RegisterTransitCallback(distance_callback)
+    time_cb = routing.RegisterTransitCallback(time_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(time_cb)
+    routing.AddDimension(distance_cb, 0, MAX_ROUTE_DISTANCE_M, True, "Distance")
+    routing.AddDimension(time_cb, 0, MAX_ROUTE_TIME_S, True, "Time")
+    distance_dimension = routing.GetDimensionOrDie("Distance")
+    time_dimension = routing.GetDimensionOrDie("Time")
+    for pickup_idx, drop_idx, _ in problem.pickup_drop_indices:
+        pickup_i = manager.NodeToIndex(pickup_idx)
+        drop_i = manager.NodeToIndex(drop_idx)
+        routing.AddPickupAndDelivery(pickup_i, drop_i)
+        routing.solver().Add(routing.VehicleVar(pickup_i) == routing.VehicleVar(drop_i))
+        routing.solver().Add(distance_dimension.CumulVar(pickup_i) <= distance_dimension.CumulVar(drop_i))
+        routing.AddDisjunction([pickup_i, drop_i], DROP_PENALTY, 2)
+    # The callbacks must outlive the solve.
+    routing._callbacks = (distance_callback, time_callback)
+    return SolverModel(manager, routing, distance_dimension, time_dimension)
+
+
+def random_request(n_orders, n_vehicles, seed):
+    rng = random.Random(seed)
+
+    def loc():
+        return Location(latitude=40.7 + rng.uniform(-0.2, 0.2), longitude=-74.0 + rng.uniform(-0.2, 0.2))
+
+    return OptimizeRouteRequest(
+        orders=[OrderInOptimization(id=i, pickup_location=loc(), dropoff_location=loc()) for i in range(n_orders)],
+        vehicles=[VehicleInOptimization(id=1000 + v, start_location=loc()) for v in range(n_vehicles)],
+    )
+
+
+def run(model: SolverModel, seconds: int):
+    params = default_search_parameters(seconds)
+    params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    solution = model.routing.SolveWithParameters(params)
+    solver = model.routing.solver()
+    return {
+        "branches": solver.Branches(),
+        "accepted_neighbors": solver.AcceptedNeighbors(),
+        "solutions": solver.Solutions(),
+        "objective": solution.ObjectiveValue() if solution else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--vehicles", type=int, default=5)
+    parser.add_argument("--seconds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    problem = build_problem(random_request(args.orders, args.vehicles, args.seed))
+    before = run(build_callback_model(problem), args.seconds)
+    after = run(build_model(problem), args.seconds)
+    print(f"{'':20s} {'callbacks':>14s} {'matrix':>14s} {'ratio':>8s}")
+    for key in ("branches", "accepted_neighbors", "solutions", "objective"):
+        ratio = after[key] / before[key] if before[key] else float("nan")
+        print(f"{key:20s} {before[key]:>14} {after[key]:>14} {ratio:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
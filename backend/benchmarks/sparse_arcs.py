@@ -0,0 +1,54 @@
+"""Compare dense cost matrices with sparse k-nearest-neighbour arcs.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.sparse_arcs --orders 250 500 1000 --neighbors 60 --seconds 10
+
+For every size the problem is built both ways and the number of costed
+cells and build time are reported. With ``--seconds`` > 0 both variants are
+also solved (the sparse one including any dense retry within its time
+limit) and the summed
+route time, distance and unassigned orders are printed.
+"""
+import argparse
+import time
+
+from ..benchmarks.decomposition import random_request
+from ..optimizer import build_problem, solve_routes
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, nargs="+", default=[250, 500, 1000])
+    parser.add_argument("--orders-per-vehicle", type=int, default=10)
+    parser.add_argument("--neighbors", type=int, default=60)
+    parser.add_argument("--seconds", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'orders':>7s} {'mode':>7s} {'cells':>10s} {'build_s':>8s} {'solve_s':>8s} {'route_h':>9s} {'route_km':>9s} {'unassigned':>10s}")
+    for n in args.orders:
+        request = random_request(n, max(1, n // args.orders_per_vehicle), args.seed)
+        for mode in ("dense", "sparse"):
+            request.sparse_neighbors = args.neighbors if mode == "sparse" else None
+            problem, build_s = timed(build_problem, request)
+            cells = problem.size**2 if problem.arcs is None else len(problem.arcs.distance)
+            row = f"{n:>7d} {mode:>7s} {cells:>10d} {build_s:>8.2f}"
+            if args.seconds > 0:
+                response, solve_s = timed(solve_routes, request, time_limit_s=args.seconds)
+                row += (
+                    f" {solve_s:>8.1f} {sum(r.total_time or 0 for r in response.optimized_routes):>9.1f}"
+                    f" {sum(r.total_distance or 0 for r in response.optimized_routes):>9.1f}"
+                    f" {len(response.unassigned_orders or []):>10d}"
+                )
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
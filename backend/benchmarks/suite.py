@@ -0,0 +1,282 @@
+"""Run the optimizer and API benchmark scenarios and compare them with a stored baseline.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.suite --out results.json
+    python -m backend.benchmarks.suite --baseline baseline.json --out results.json
+
+Optimizer scenarios solve ``fleets.fleet_request`` instances of every
+``--sizes`` order count with the seed ``--seed``. The request strategy is
+"auto", as the API would run them, with a fixed ``--seconds`` budget. Each
+reports the cold matrix build time of the full request, the solve wall time,
+the solver objective (single-model solves only), route km and hours, and
+unassigned orders.
+
+API scenarios drive the app in-process. ``telemetry`` posts bulk batches
+of positions for ``--vehicles`` vehicles. ``live`` times the in-memory
+nearest and within queries. Both run without a database. ``lists`` is not
+run by default. It pages through the order and vehicle lists by cursor, as
+served through the read cache, and times the PostGIS nearby queries. It
+reads the database in ECOROUTE_DATABASE_URL, a local Postgres with the
+API's schema, and never writes to it. The schema uses PostGIS and
+Postgres-only statements, so SQLite cannot stand in for it.
+
+Results are written as JSON with ``--out``. With ``--baseline``, every
+metric is compared with the stored run. The script exits non-zero if a
+time or objective is worse by more than ``--tolerance`` (relative) and
+more than a small absolute noise floor, or if unassigned orders grew. Timings vary between machines, so compare only
+runs from the same host.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from ..benchmarks.fleets import CITY, fleet_request
+from ..jobs import use_decomposition
+from ..live import live_state
+from ..matrix_cache import travel_cache
+from ..optimizer import build_problem, solve_routes
+from ..decomposition import solve_decomposed
+from ..pagination import NEXT_CURSOR_HEADER
+from ..schemas import OrderRead, VehicleRead
+from ..telemetry import telemetry_buffer
+
+SCENARIOS = ("optimizer", "telemetry", "live", "lists")
+# Metrics where a larger value is better; every other one is lower-is-better
+HIGHER_IS_BETTER = ("per_s",)
+# Slowdowns smaller than this, by metric suffix, are timer noise and never regressions
+NOISE_FLOOR = {"_ms": 1.0, "_s": 0.05}
+
+
+def percentiles_ms(samples) -> dict:
+    ms = np.array(samples) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+
+def optimizer_scenario(n_orders: int, seconds: float, seed: int) -> dict:
+    request = fleet_request(n_orders, seed, time_limit_s=seconds).model_copy(update={"strategy": "auto", "debug": True})
+    if travel_cache is not None:
+        travel_cache.clear()
+    t0 = time.perf_counter()
+    build_problem(request)
+    matrix_build_s = time.perf_counter() - t0
+    if travel_cache is not None:
+        travel_cache.clear()
+
+    solve = solve_decomposed if use_decomposition(request) else solve_routes
+    t0 = time.perf_counter()
+    response = solve(request)
+    solve_s = time.perf_counter() - t0
+    solver = response.debug.solver if response.debug else None
+    return {
+        "matrix_build_s": matrix_build_s,
+        "solve_s": solve_s,
+        "objective": solver.objective if solver else None,
+        "route_km": sum(r.total_distance or 0.0 for r in response.optimized_routes),
+        "route_hours": sum(r.total_time or 0.0 for r in response.optimized_routes),
+        "unassigned": len(response.unassigned_orders or []),
+    }
+
+
+def _points(rng: np.random.Generator, count: int):
+    return CITY[0] + rng.uniform(-0.12, 0.12, count), CITY[1] + rng.uniform(-0.15, 0.15, count)
+
+
+def seed_live_state(vehicles: int, seed: int):
+    """Index ``vehicles`` idle vehicles and five open orders per vehicle, as startup would from the database."""
+    rng = np.random.default_rng(seed)
+    lat, lng = _points(rng, vehicles)
+    for v in range(vehicles):
+        live_state.put_vehicle(VehicleRead(id=v, name=f"bench-{v}", current_lat=lat[v], current_lng=lng[v]).model_dump())
+    lat, lng = _points(rng, 5 * vehicles)
+    for i in range(5 * vehicles):
+        order = OrderRead(id=i, customer_name=f"bench-{i}", pickup_address="", dropoff_address="")
+        live_state.put_order(order.model_copy(update={"pickup_lat": lat[i], "pickup_lng": lng[i]}).model_dump())
+
+
+async def telemetry_scenario(client: httpx.AsyncClient, vehicles: int, rounds: int, batch: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    lat, lng = _points(rng, vehicles)
+    latencies = []
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        lat += rng.normal(0, 0.0005, vehicles)
+        lng += rng.normal(0, 0.0005, vehicles)
+        for start in range(0, vehicles, batch):
+            positions = [
+                {"vehicle_id": v, "current_lat": float(lat[v]), "current_lng": float(lng[v])}
+                for v in range(start, min(start + batch, vehicles))
+            ]
+            t1 = time.perf_counter()
+            response = await client.post("/vehicles/telemetry", json={"positions": positions})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - t1)
+    elapsed = time.perf_counter() - t0
+    # Nothing flushes the buffer here; drop what it holds.
+    for v in range(vehicles):
+        telemetry_buffer.discard(v)
+    return {"positions_per_s": vehicles * rounds / elapsed, **percentiles_ms(latencies)}
+
+
+async def timed_gets(client: httpx.AsyncClient, paths) -> dict:
+    latencies = []
+    for path in paths:
+        t0 = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+    return {"mean_ms": 1000 * sum(latencies) / len(latencies), **percentiles_ms(latencies)}
+
+
+async def paged_gets(client: httpx.AsyncClient, path: str, pages: int) -> dict:
+    """Follow the next-page cursor of ``path`` for ``pages`` requests, starting over after the last page."""
+    latencies = []
+    cursor = None
+    for _ in range(pages):
+        t0 = time.perf_counter()
+        response = await client.get(path, params={"limit": 100, **({"cursor": cursor} if cursor else {})})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    return {"mean_ms": 1000 * sum(latencies) / len(latencies), **percentiles_ms(latencies)}
+
+
+async def live_scenario(client: httpx.AsyncClient, queries: int, seed: int) -> dict:
+    lat, lng = _points(np.random.default_rng(seed + 1), queries)
+    results = {}
+    for name, path in (
+        ("vehicles_nearest", "/vehicles/nearest?lat={}&lng={}&k=5"),
+        ("vehicles_within", "/vehicles/within?lat={}&lng={}&radius_km=2"),
+        ("orders_nearest", "/orders/nearest?lat={}&lng={}&k=5"),
+        ("orders_within", "/orders/within?lat={}&lng={}&radius_km=2"),
+    ):
+        results[name] = await timed_gets(client, [path.format(a, b) for a, b in zip(lat, lng)])
+    return results
+
+
+async def lists_scenario(client: httpx.AsyncClient, queries: int, seed: int) -> dict:
+    lat, lng = _points(np.random.default_rng(seed + 1), queries)
+    results = {
+        "orders_page": await paged_gets(client, "/orders", queries),
+        "vehicles_page": await paged_gets(client, "/vehicles", queries),
+    }
+    for name, path in (
+        ("orders_nearby", "/orders/nearby?lat={}&lng={}&radius_km=2"),
+        ("vehicles_nearby", "/vehicles/nearby?lat={}&lng={}&radius_km=2"),
+    ):
+        results[name] = await timed_gets(client, [path.format(a, b) for a, b in zip(lat, lng)])
+    return results
+
+
+async def api_scenarios(args) -> dict:
+    from ..main import app
+
+    results = {}
+    seed_live_state(args.vehicles, args.seed)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        if "telemetry" in args.scenarios:
+            telemetry = await telemetry_scenario(client, args.vehicles, args.rounds, args.batch, args.seed)
+            results["api/telemetry"] = telemetry
+        if "live" in args.scenarios:
+            for name, metrics in (await live_scenario(client, args.queries, args.seed)).items():
+                results[f"api/live/{name}"] = metrics
+        if "lists" in args.scenarios:
+            for name, metrics in (await lists_scenario(client, args.queries, args.seed)).items():
+                results[f"api/lists/{name}"] = metrics
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float):
+    """``(scenario, metric, baseline, current)`` of every metric that got worse than allowed."""
+    worse = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(scenario, {}).get(metric)
+            if value is None or base is None:
+                continue
+            if metric == "unassigned":
+                bad = value > base
+            elif metric.endswith(HIGHER_IS_BETTER):
+                bad = value < base * (1 - tolerance)
+            else:
+                floor = next((f for suffix, f in NOISE_FLOOR.items() if metric.endswith(suffix)), 0.0)
+                bad = value > base * (1 + tolerance) and value - base > floor
+            if bad:
+                worse.append((scenario, metric, base, value))
+    return worse
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=["optimizer", "telemetry", "live"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 1000, 2000])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = {}
+    if "optimizer" in args.scenarios:
+        for size in args.sizes:
+            results[f"optimizer/{size}"] = optimizer_scenario(size, args.seconds, args.seed)
+            print(f"optimizer/{size}: {json.dumps(results[f'optimizer/{size}'])}", flush=True)
+    if set(args.scenarios) & {"telemetry", "live", "lists"}:
+        for name, metrics in asyncio.run(api_scenarios(args)).items():
+            results[name] = metrics
+            print(f"{name}: {json.dumps(metrics)}", flush=True)
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    ok = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["args"] != report["meta"]["args"]:
+            print("baseline was run with different arguments; only matching scenarios are compared")
+        worse = regressions(results, baseline["results"], args.tolerance)
+        for scenario, metric, base, value in worse:
+            print(f"REGRESSION {scenario} {metric}: {base:.4g} -> {value:.4g}")
+        print(f"{len(worse)} regressions against {args.baseline} ({baseline['meta'].get('commit') or 'unknown commit'})")
+        ok = not worse
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Compare per-ping and bulk telemetry ingestion against a running API.
+
+Start the API with its database, then run from the repository root:
+
+    python -m backend.benchmarks.telemetry_ingest --url http://localhost:8000 --vehicles 500 --rounds 20
+
+``--vehicles`` vehicles (ids from ``--first-id``) are created if missing.
+Every round moves each vehicle once, first as one
+``POST /vehicles/{id}/telemetry`` per vehicle (``--concurrency`` in flight),
+then as ``POST /vehicles/telemetry`` requests of ``--batch`` positions.
+Positions per second and request latency are reported for both paths.
+The bulk path is asynchronous: its positions reach the database at the
+next buffer flush.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+
+async def ensure_vehicles(client, ids):
+    for vid in ids:
+        response = await client.get(f"/vehicles/{vid}")
+        if response.status_code == 404:
+            response = await client.post("/vehicles", json={"id": vid, "name": f"bench-{vid}"})
+            response.raise_for_status()
+
+
+def moves(ids, rng):
+    return [
+        {"vehicle_id": vid, "current_lat": 40.7 + rng.uniform(-0.3, 0.3), "current_lng": -74.0 + rng.uniform(-0.3, 0.3)}
+        for vid in ids
+    ]
+
+
+async def timed_post(client, latencies, url, payload):
+    t0 = time.perf_counter()
+    response = await client.post(url, json=payload)
+    latencies.append(time.perf_counter() - t0)
+    response.raise_for_status()
+
+
+async def per_ping(client, ids, rounds, concurrency, rng):
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def send(position):
+        async with limit:
+            url = f"/vehicles/{position.pop('vehicle_id')}/telemetry"
+            await timed_post(client, latencies, url, position)
+
+    for _ in range(rounds):
+        await asyncio.gather(*(send(p) for p in moves(ids, rng)))
+    return latencies
+
+
+async def bulk(client, ids, rounds, batch, rng):
+    latencies = []
+    for _ in range(rounds):
+        positions = moves(ids, rng)
+        await asyncio.gather(
+            *(
+                timed_post(client, latencies, "/vehicles/telemetry", {"positions": positions[i : i + batch]})
+                for i in range(0, len(positions), batch)
+            )
+        )
+    return latencies
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    ids = list(range(args.first_id, args.first_id + args.vehicles))
+    pings = args.vehicles * args.rounds
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        await ensure_vehicles(client, ids)
+        print(f"{'path':>9s} {'positions':>9s} {'seconds':>8s} {'pos/s':>9s} {'requests':>8s} {'p50_ms':>7s} {'p99_ms':>7s}")
+        for name, coro in (
+            ("per-ping", per_ping(client, ids, args.rounds, args.concurrency, rng)),
+            ("bulk", bulk(client, ids, args.rounds, args.batch, rng)),
+        ):
+            t0 = time.perf_counter()
+            latencies = await coro
+            seconds = time.perf_counter() - t0
+            q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            print(
+                f"{name:>9s} {pings:>9d} {seconds:>8.2f} {pings / seconds:>9.0f} {len(latencies):>8d}"
+                f" {q[49] * 1000:>7.1f} {q[98] * 1000:>7.1f}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--vehicles", type=int, default=500)
+    parser.add_argument("--first-id", type=int, default=900000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Check the compiled travel-time table against the raw LightGBM booster and compare their speed.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.travel_time_lookup --cells 1000000 --synthetic-trees 200
+
+The shipped model and, with ``--synthetic-trees`` > 0, a model trained on
+synthetic distance/time data with many splits are compiled. Each is
+evaluated both ways on random distances, on zero, and on every split
+threshold and its neighbouring floats, where a wrong interval would show.
+The largest difference and predictions per second of both paths are
+printed. A hot reload is then checked by replacing the model file the
+service watches. Exits non-zero if any prediction differs by more than
+``--tolerance`` hours (default: must be identical) or the reload is missed.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import lightgbm as lgb
+
+from .. import travel_time
+from ..travel_time import load_model
+
+
+def synthetic_model(path: str, trees: int, seed: int):
+    rng = np.random.default_rng(seed)
+    distance = rng.uniform(0, 60, 20000)
+    # Hours: slower in town, faster on longer trips, plus noise
+    hours = distance / np.where(distance < 5, 20, 45) + 0.05 + rng.normal(0, 0.02, distance.size)
+    booster = lgb.train(
+        {"objective": "regression", "num_leaves": 31, "verbose": -1, "seed": seed},
+        lgb.Dataset(distance.reshape(-1, 1), hours),
+        num_boost_round=trees,
+    )
+    booster.save_model(path)
+
+
+def probes(thresholds: np.ndarray, cells: int, max_km: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    edges = np.concatenate([thresholds, np.nextafter(thresholds, -np.inf), np.nextafter(thresholds, np.inf)])
+    return np.concatenate([[0.0], edges, rng.uniform(0, max_km, cells)])
+
+
+def rate(fn, x) -> float:
+    t0 = time.perf_counter()
+    fn(x)
+    return x.size / (time.perf_counter() - t0)
+
+
+def check(name: str, path: str, args) -> bool:
+    model = load_model(path)
+    x = probes(model.thresholds, args.cells, args.max_km, args.seed)
+    compiled = model.predict(x)
+    raw = model.booster.predict(x.reshape(-1, 1))
+    error = float(np.max(np.abs(compiled - raw)))
+    ok = error <= args.tolerance
+    print(
+        f"{name:<10s} version={model.version} thresholds={model.thresholds.size:>5d} max_error_h={error:.3g}"
+        f"  compiled={rate(model.predict, x) / 1e6:>7.1f}M/s  booster={rate(lambda v: model.booster.predict(v.reshape(-1, 1)), x) / 1e6:>6.2f}M/s"
+        f"{'' if ok else '  FAIL'}"
+    )
+    return ok
+
+
+def check_reload(source: str, replacement: str) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        watched = os.path.join(tmp, "model.txt")
+        shutil.copy(source, watched)
+        travel_time.MODEL_PATH = watched
+        travel_time._next_check = 0.0
+        before = travel_time.model_version()
+        shutil.copy(replacement, watched)
+        travel_time._next_check = 0.0
+        after = travel_time.model_version()
+    ok = before != after
+    print(f"hot reload {before} -> {after}{'' if ok else '  FAIL'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cells", type=int, default=1_000_000)
+    parser.add_argument("--max-km", type=float, default=100.0)
+    parser.add_argument("--synthetic-trees", type=int, default=200)
+    parser.add_argument("--tolerance", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    shipped = travel_time.MODEL_PATH
+    ok = check("shipped", shipped, args)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic_trees > 0:
+            synthetic = os.path.join(tmp, "synthetic.txt")
+            synthetic_model(synthetic, args.synthetic_trees, args.seed)
+            ok &= check("synthetic", synthetic, args)
+            ok &= check_reload(shipped, synthetic)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
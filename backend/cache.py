@@ -0,0 +1,230 @@
+"""Read-through cache of API read results, in process or in Redis.
+
+Entries are grouped in namespaces ("orders", "vehicles"). Every namespace
+has a generation number that is part of each of its keys, and a write
+invalidates a namespace by bumping it: single rows and list pages alike
+become unreachable at once and age out of the backend. A reader takes the
+generation before it queries the database, so a result loaded while a
+write was in flight is stored under the old generation and never served.
+Misses are loaded from the primary, never from a read replica, whose lag
+could otherwise put a row from before the write under the new generation.
+
+Telemetry moves vehicles many times a second, too often to drop the whole
+namespace each time. Position updates invalidate single rows instead: each
+namespace also has a sequence number, an invalidated row is marked with
+the sequence of its invalidation, and a cached value is only served while
+no row in it carries a mark newer than the sequence it was loaded at.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import Counter, Histogram
+from .settings import settings
+
+ORDERS = "orders"
+VEHICLES = "vehicles"
+# Bumped when telemetry changes a vehicle's status, which moves it between status-filtered pages
+VEHICLE_STATUSES = "vehicle_statuses"
+
+CACHE_LOOKUPS = Counter("ecoroute_cache_lookups_total", "Read-through cache lookups by result.", ("namespace", "result"))
+CACHE_SECONDS = Histogram(
+    "ecoroute_cache_read_seconds", "Latency of reads through the cache, loads included.", ("namespace", "result")
+)
+
+
+class MemoryBackend:
+    """LRU of ``max_entries`` values with a per-entry TTL, local to the process.
+
+    Generations are local too: a write handled by another worker process
+    does not invalidate this one's entries. Only usable with one worker.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl_s: float):
+        self._entries[key] = (time.monotonic() + ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def counters(self, keys: List[str]) -> List[int]:
+        return [self._counters.get(key, 0) for key in keys]
+
+    async def set_counters(self, values: Dict[str, int]):
+        self._counters.update(values)
+
+
+class RedisBackend:
+    """Values and generations in Redis, shared by every API process.
+
+    ``client`` is a ``redis.asyncio`` client or anything with the same
+    ``get``/``set``/``incr``/``mget``/``mset`` coroutines.
+    """
+
+    def __init__(self, client, prefix: str = "ecoroute:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl_s: float):
+        await self.client.set(self.prefix + key, value, px=max(1, int(ttl_s * 1000)))
+
+    async def counter(self, key: str) -> int:
+        value = await self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(self.prefix + key)
+
+    async def counters(self, keys: List[str]) -> List[int]:
+        if not keys:
+            return []
+        values = await self.client.mget([self.prefix + key for key in keys])
+        return [int(value) if value is not None else 0 for value in values]
+
+    async def set_counters(self, values: Dict[str, int]):
+        # Row marks have no TTL; there is one per row ever invalidated.
+        if values:
+            await self.client.mset({self.prefix + key: value for key, value in values.items()})
+
+
+class ReadThroughCache:
+    """JSON results of database reads, keyed by namespace generation and query."""
+
+    def __init__(self, backend, ttl_s: float):
+        self.backend = backend
+        self.ttl_s = ttl_s
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        key: str,
+        load: Callable[[], Awaitable[Any]],
+        items: Optional[Callable[[Any], Iterable[int]]] = None,
+    ) -> Any:
+        """Cached value of ``key``, or the result of ``load()``, which is cached if it is not ``None``.
+
+        ``items`` lists the ids of the ``namespace`` rows in a value. Such a
+        value is not served once one of them went through ``invalidate_items``.
+        A failing backend degrades to uncached reads.
+        """
+        if not self.enabled:
+            return await load()
+        start = time.perf_counter()
+        full_key = None
+        sequence = 0
+        cached = None
+        try:
+            generation, sequence = await self.backend.counters([f"gen:{namespace}", f"seq:{namespace}"])
+            full_key = f"{namespace}:{generation}:{key}"
+            cached = await self.backend.get(full_key)
+            if cached is not None:
+                cached = json.loads(cached)
+                if items is not None:
+                    if await self._changed_since(namespace, items(cached["value"]), cached["seq"]):
+                        cached = None
+                    else:
+                        cached = cached["value"]
+        except Exception as exc:
+            print(f"cache read failed: {exc!r}")
+            cached = None
+        if cached is not None:
+            result = "hit"
+            value = cached
+        else:
+            result = "miss"
+            value = await load()
+            if value is not None and full_key is not None:
+                try:
+                    if items is None:
+                        await self.backend.set(full_key, json.dumps(value).encode(), self.ttl_s)
+                    elif not await self._changed_since(namespace, items(value), sequence):
+                        # Rows invalidated while loading may be older in the value than in the database.
+                        entry = {"seq": sequence, "value": value}
+                        await self.backend.set(full_key, json.dumps(entry).encode(), self.ttl_s)
+                except Exception as exc:
+                    print(f"cache write failed: {exc!r}")
+        CACHE_LOOKUPS.inc(namespace=namespace, result=result)
+        CACHE_SECONDS.observe(time.perf_counter() - start, namespace=namespace, result=result)
+        return value
+
+    async def _changed_since(self, namespace: str, ids: Iterable[int], sequence: int) -> bool:
+        marks = await self.backend.counters([f"item:{namespace}:{id}" for id in ids])
+        return any(mark > sequence for mark in marks)
+
+    async def generation(self, namespace: str) -> int:
+        """Current generation of ``namespace``, for keys that must change when it is invalidated."""
+        try:
+            return await self.backend.counter(f"gen:{namespace}")
+        except Exception as exc:
+            print(f"cache read failed: {exc!r}")
+            return 0
+
+    async def invalidate(self, *namespaces: str):
+        """Drop every cached entry of ``namespaces``; call after the write has committed."""
+        for namespace in namespaces:
+            try:
+                await self.backend.incr(f"gen:{namespace}")
+            except Exception as exc:
+                # Entries of the namespace may be served until their TTL runs out.
+                print(f"cache invalidation of {namespace} failed: {exc!r}")
+
+    async def invalidate_items(self, namespace: str, ids: Iterable[int]):
+        """Stop serving cached values of ``namespace`` that hold any of the rows ``ids``.
+
+        Only values read with ``items`` are affected; call after the write has committed.
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        try:
+            sequence = await self.backend.incr(f"seq:{namespace}")
+            await self.backend.set_counters({f"item:{namespace}:{id}": sequence for id in ids})
+        except Exception as exc:
+            print(f"cache invalidation of {len(ids)} {namespace} failed: {exc!r}")
+
+
+def make_cache() -> ReadThroughCache:
+    if settings.cache_url:
+        # Optional dependency, only needed with a Redis cache
+        import redis.asyncio as redis
+
+        return ReadThroughCache(RedisBackend(redis.from_url(settings.cache_url)), settings.cache_ttl_s)
+    ttl_s = settings.cache_ttl_s
+    workers = settings.web_concurrency
+    if workers > 1 and ttl_s > 0:
+        print(f"read cache disabled: {workers} workers need the shared Redis cache (ECOROUTE_CACHE_URL)")
+        ttl_s = 0
+    return ReadThroughCache(MemoryBackend(settings.cache_max_entries), ttl_s)
+
+
+read_cache = make_cache()
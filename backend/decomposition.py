@@ -0,0 +1,254 @@
+"""Large-instance mode: solve geographic clusters of a request in parallel."""
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from .dispatch import RoutePlan
+from .metrics import collect_phases, phase
+from .optimizer import solve_routes
+from .schemas import OptimizationDebug, OptimizeRouteRequest, OptimizedRoute, OptimizedRouteResponse
+from .settings import settings
+from .spatial import plane_km
+
+# The time left of the request's limit is shared out between the clusters
+# not yet started, as they start. Once it is spent, clusters still search
+# this long, so they can find a first solution.
+MIN_CLUSTER_TIME_S = 0.2
+# Unassigned orders are offered to the routes of this many nearest other clusters.
+REBALANCE_NEIGHBOURS = 2
+KMEANS_ITERATIONS = 25
+
+# Stop flag shared with the cluster worker processes
+_stop_flag = None
+# Cluster workers live as long as the process, so OR-Tools and the travel-time
+# model are imported once per worker, not once per request. One decomposed
+# solve at a time uses them, since they share the stop flag.
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_flag = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(flag):
+    global _stop_flag
+    _stop_flag = flag
+
+
+def _solve_cluster(payload: dict, time_limit_s: float) -> dict:
+    request = OptimizeRouteRequest.model_validate(payload)
+    return solve_routes(request, should_stop=lambda: _stop_flag.value != 0, time_limit_s=time_limit_s).model_dump()
+
+
+def kmeans(points: np.ndarray, k: int, seed: int = 0, iterations: int = KMEANS_ITERATIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """Lloyd's algorithm with k-means++ seeding; returns ``(labels, centroids)``."""
+    rng = np.random.default_rng(seed)
+    centroids = np.empty((k, points.shape[1]))
+    centroids[0] = points[rng.integers(len(points))]
+    closest = ((points - centroids[0]) ** 2).sum(axis=1)
+    for c in range(1, k):
+        total = closest.sum()
+        pick = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centroids[c] = points[pick]
+        closest = np.minimum(closest, ((points - centroids[c]) ** 2).sum(axis=1))
+
+    labels = np.zeros(len(points), dtype=np.intp)
+    for _ in range(iterations):
+        d2 = ((points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        new_labels = d2.argmin(axis=1)
+        counts = np.bincount(new_labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, new_labels, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels, centroids
+
+
+def _allocate_vehicles(vehicle_points: np.ndarray, centroids: np.ndarray, order_counts: np.ndarray) -> np.ndarray:
+    """Give every cluster vehicles in proportion to its orders, preferring the closest ones."""
+    n_vehicles, k = len(vehicle_points), len(centroids)
+    quota = np.maximum(1, np.floor(n_vehicles * order_counts / order_counts.sum())).astype(int)
+    # Hand out what rounding left over to the clusters with the most orders per vehicle.
+    while quota.sum() < n_vehicles:
+        quota[np.argmax(order_counts / quota)] += 1
+    while quota.sum() > n_vehicles:
+        quota[np.argmin(np.where(quota > 1, order_counts / quota, np.inf))] -= 1
+
+    d2 = ((vehicle_points[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    cluster_of = np.full(n_vehicles, -1, dtype=np.intp)
+    for flat in np.argsort(d2, axis=None, kind="stable"):
+        v, c = divmod(int(flat), k)
+        if cluster_of[v] < 0 and quota[c] > 0:
+            cluster_of[v] = c
+            quota[c] -= 1
+    return cluster_of
+
+
+def split_request(
+    request: OptimizeRouteRequest, cluster_orders: int, seed: int = 0
+) -> Tuple[List[OptimizeRouteRequest], np.ndarray]:
+    """Cluster orders by pickup/dropoff midpoint and attach the nearest vehicles to each cluster.
+
+    Returns the per-cluster requests and their centroids on the local plane.
+    """
+    orders, vehicles = request.orders, request.vehicles
+    mid_lat = np.array([(o.pickup_location.latitude + o.dropoff_location.latitude) / 2 for o in orders])
+    mid_lng = np.array([(o.pickup_location.longitude + o.dropoff_location.longitude) / 2 for o in orders])
+    ref_lat = float(mid_lat.mean())
+    order_points = plane_km(mid_lat, mid_lng, ref_lat)
+    vehicle_points = plane_km(
+        np.array([v.start_location.latitude for v in vehicles]),
+        np.array([v.start_location.longitude for v in vehicles]),
+        ref_lat,
+    )
+
+    k = max(1, min(len(vehicles), math.ceil(len(orders) / cluster_orders)))
+    labels, centroids = kmeans(order_points, k, seed)
+    counts = np.bincount(labels, minlength=k)
+    used = np.flatnonzero(counts)
+    labels = np.searchsorted(used, labels)
+    centroids, counts = centroids[used], counts[used]
+
+    cluster_of = _allocate_vehicles(vehicle_points, centroids, counts)
+    clusters = [
+        OptimizeRouteRequest(
+            orders=[o for o, label in zip(orders, labels) if label == c],
+            vehicles=[v for v, label in zip(vehicles, cluster_of) if label == c],
+            sparse_neighbors=request.sparse_neighbors,
+        )
+        for c in range(len(centroids))
+    ]
+    return clusters, centroids
+
+
+def _cluster_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_flag
+    if _pool is None:
+        ctx = multiprocessing.get_context("spawn")
+        _pool_flag = ctx.Value("b", 0, lock=False)
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.decomposition_workers, mp_context=ctx, initializer=_init_worker, initargs=(_pool_flag,)
+        )
+    return _pool
+
+
+def _cluster_time_s(deadline: float, clusters_left: int, workers: int) -> float:
+    """Search time for the next cluster: the time left over the rounds of clusters still to run."""
+    return max(MIN_CLUSTER_TIME_S, (deadline - time.monotonic()) / math.ceil(clusters_left / workers))
+
+
+def _solve_clusters(
+    clusters: List[OptimizeRouteRequest], deadline: float, should_stop: Optional[Callable[[], bool]]
+) -> List[OptimizedRouteResponse]:
+    workers = max(1, min(settings.decomposition_workers, len(clusters)))
+    if workers == 1:
+        return [
+            solve_routes(c, should_stop=should_stop, time_limit_s=_cluster_time_s(deadline, len(clusters) - i, 1))
+            for i, c in enumerate(clusters)
+        ]
+
+    global _pool
+    with _pool_lock:
+        pool = _cluster_pool()
+        _pool_flag.value = 0
+        futures = {}
+        try:
+            # Only as many clusters as there are workers are queued, so each one's
+            # time is worked out when it starts, from what the others left.
+            for i in range(len(clusters)):
+                while len(futures) - sum(f.done() for f in futures.values()) >= workers:
+                    wait([f for f in futures.values() if not f.done()], timeout=0.1, return_when=FIRST_COMPLETED)
+                    if should_stop is not None and should_stop():
+                        _pool_flag.value = 1
+                time_limit_s = _cluster_time_s(deadline, len(clusters) - i, workers)
+                futures[i] = pool.submit(_solve_cluster, clusters[i].model_dump(), time_limit_s)
+            pending = set(futures.values())
+            while pending:
+                _, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                if should_stop is not None and should_stop():
+                    _pool_flag.value = 1
+            return [OptimizedRouteResponse.model_validate(futures[i].result()) for i in range(len(clusters))]
+        except BrokenProcessPool:
+            # A worker died; start fresh workers for the next request.
+            _pool = None
+            raise
+
+
+def _rebalance(
+    request: OptimizeRouteRequest,
+    clusters: List[OptimizeRouteRequest],
+    centroids: np.ndarray,
+    results: List[OptimizedRouteResponse],
+    routes: dict,
+) -> List[int]:
+    """Offer every unassigned order to the routes of neighbouring clusters; return what stays unassigned."""
+    orders = {o.id: o for o in request.orders}
+    d2 = ((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    unassigned = []
+    for c, result in enumerate(results):
+        neighbours = [n for n in np.argsort(d2[c], kind="stable") if n != c][:REBALANCE_NEIGHBOURS]
+        for oid in result.unassigned_orders or []:
+            vehicles = [v for n in neighbours for v in clusters[n].vehicles]
+            plan = RoutePlan([routes[v.id] for v in vehicles], vehicles)
+            inserted = plan.evaluate(orders[oid])
+            if inserted.vehicle_id is None:
+                unassigned.append(oid)
+            else:
+                routes[inserted.vehicle_id] = inserted.route
+    return unassigned
+
+
+def solve_decomposed(
+    request: OptimizeRouteRequest,
+    should_stop: Optional[Callable[[], bool]] = None,
+    on_progress=None,
+) -> OptimizedRouteResponse:
+    """Solve ``request`` as independent geographic clusters and merge the routes.
+
+    Clusters hold about ``settings.decomposition_cluster_orders`` orders and
+    the vehicles starting closest to them, so each model stays small. They
+    are solved concurrently in separate processes, since the OR-Tools search
+    holds the GIL. Orders a cluster could not serve are then placed by
+    cheapest insertion into the routes of its neighbouring clusters.
+    Clusters finish independently, so no anytime progress is reported and
+    ``on_progress`` is ignored. The clusters' searches share the request's
+    ``time_limit_seconds``, which bounds the whole call up to cluster model
+    builds, the minimum search of late clusters and the rebalancing.
+    """
+    if not request.orders or not request.vehicles:
+        return solve_routes(request, should_stop=should_stop)
+    deadline = time.monotonic() + request.time_limit_seconds
+    with collect_phases() as phases:
+        with phase("split"):
+            clusters, centroids = split_request(request, settings.decomposition_cluster_orders)
+        with phase("solve_clusters"):
+            results = _solve_clusters(clusters, deadline, should_stop)
+
+        with phase("rebalance"):
+            routes = {}
+            for cluster, result in zip(clusters, results):
+                if result.optimized_routes:
+                    routes.update((route.vehicle_id, route) for route in result.optimized_routes)
+                else:
+                    # No solution at all: keep the cluster's vehicles available, empty.
+                    routes.update(
+                        (v.id, OptimizedRoute(vehicle_id=v.id, stops=[], total_distance=0.0, total_time=0.0))
+                        for v in cluster.vehicles
+                    )
+            if len(clusters) > 1:
+                unassigned = _rebalance(request, clusters, centroids, results, routes)
+            else:
+                unassigned = list(results[0].unassigned_orders or [])
+    return OptimizedRouteResponse(
+        optimized_routes=[routes[v.id] for v in request.vehicles],
+        unassigned_orders=unassigned,
+        debug=OptimizationDebug(phases=dict(phases.totals)),
+        model_version=results[0].model_version,
+    )
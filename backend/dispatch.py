@@ -0,0 +1,221 @@
+"""Instant cheapest-insertion dispatch of single orders into existing routes."""
+import threading
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from .insertion import INFEASIBLE, best_pair
+from .matrix import travel_cells, travel_distance_km, travel_matrix_km
+from .optimizer import MAX_ROUTE_DISTANCE_M
+from .schemas import (
+    DispatchPlan,
+    InsertionResult,
+    OptimizedRoute,
+    OrderInOptimization,
+    Stop,
+    VehicleInOptimization,
+)
+
+# Added to the pickup costs of each route's edges so that one cumulative
+# minimum over all routes never carries a value across a route boundary.
+_SEGMENT_OFFSET = 1 << 40
+
+
+class RoutePlan:
+    """Routes flattened into node and edge arrays for fast insertion queries.
+
+    Node coordinates and the cost of every existing edge are computed once;
+    scoring an order then takes one distance pass to and from its stops and
+    one batched travel time prediction over the nodes, after which every
+    route's best placement is found with cumulative-minimum array
+    operations. Distances come from ``travel_distance_km``, so they follow
+    the road network when one is configured, as the optimizer's do.
+    """
+
+    def __init__(self, routes: List[OptimizedRoute], vehicles: List[VehicleInOptimization]):
+        by_vehicle = {route.vehicle_id: route for route in routes}
+        self.vehicles = list(vehicles)
+        self.routes = [
+            by_vehicle.get(v.id) or OptimizedRoute(vehicle_id=v.id, stops=[], total_distance=0.0, total_time=0.0)
+            for v in self.vehicles
+        ]
+        # Held by callers around evaluate-then-apply of a shared plan.
+        self.lock = threading.Lock()
+        self._index()
+
+    def _index(self):
+        lat, lng, edge_from, edge_to, edge_route, same_node = [], [], [], [], [], []
+        for r, (vehicle, route) in enumerate(zip(self.vehicles, self.routes)):
+            points = [vehicle.start_location] + [stop.location for stop in route.stops]
+            # Without an end location the route returns to its start node.
+            points.append(vehicle.end_location or vehicle.start_location)
+            first = len(lat)
+            lat.extend(p.latitude for p in points)
+            lng.extend(p.longitude for p in points)
+            n_edges = len(points) - 1
+            edge_from.extend(range(first, first + n_edges))
+            edge_to.extend(range(first + 1, first + n_edges + 1))
+            edge_route.extend([r] * n_edges)
+            same_node.extend([False] * n_edges)
+            if not route.stops and vehicle.end_location is None:
+                same_node[-1] = True
+
+        self.lat = np.array(lat, dtype=float)
+        self.lng = np.array(lng, dtype=float)
+        self.edge_from = np.array(edge_from, dtype=np.intp)
+        self.edge_to = np.array(edge_to, dtype=np.intp)
+        self.edge_route = np.array(edge_route, dtype=np.int64)
+        self.route_start = np.flatnonzero(np.r_[True, self.edge_route[1:] != self.edge_route[:-1]])
+
+        dist_km = travel_distance_km(
+            self.lat[self.edge_from], self.lng[self.edge_from], self.lat[self.edge_to], self.lng[self.edge_to]
+        )
+        distance, duration = travel_cells(dist_km)
+        mask = np.array(same_node, dtype=bool)
+        self.edge_distance = np.where(mask, 0, distance).astype(np.int64)
+        self.edge_time = np.where(mask, 0, duration).astype(np.int64)
+        self.route_distance = np.add.reduceat(self.edge_distance, self.route_start)
+
+    def evaluate(self, order: OrderInOptimization, max_distance: int = MAX_ROUTE_DISTANCE_M) -> InsertionResult:
+        """Find the cheapest feasible vehicle and positions for ``order`` without changing the plan."""
+        result = InsertionResult(order_id=order.id)
+        if self.edge_from.size == 0:
+            return result
+        p, d = order.pickup_location, order.dropoff_location
+        n = self.lat.size
+        stop_lat, stop_lng = np.array([p.latitude, d.latitude]), np.array([p.longitude, d.longitude])
+        # Both directions: with one-way streets a road distance depends on it.
+        to_stops = travel_matrix_km(self.lat, self.lng, stop_lat, stop_lng)
+        from_stops = travel_matrix_km(stop_lat, stop_lng, np.r_[self.lat, d.latitude], np.r_[self.lng, d.longitude])
+        dist_km = np.concatenate(
+            [to_stops[:, 0], from_stops[0, :n], to_stops[:, 1], from_stops[1, :n], from_stops[0, n:]]
+        )
+        distance, duration = travel_cells(dist_km)
+        distance = distance.astype(np.int64)
+        duration = duration.astype(np.int64)
+        # node -> pickup, pickup -> node, node -> dropoff, dropoff -> node, pickup -> dropoff
+        t_to_p, t_from_p, t_to_d, t_from_d = (duration[k * n : (k + 1) * n] for k in range(4))
+        d_to_p, d_from_p, d_to_d, d_from_d = (distance[k * n : (k + 1) * n] for k in range(4))
+        t_pd, d_pd = duration[-1], distance[-1]
+
+        a, b = self.edge_from, self.edge_to
+        pick = t_to_p[a] + t_from_p[b] - self.edge_time
+        drop = t_to_d[a] + t_from_d[b] - self.edge_time
+        same = t_to_p[a] + t_pd + t_from_d[b] - self.edge_time
+
+        # Cheapest pickup on a strictly earlier edge of the same route.
+        offset = self.edge_route * _SEGMENT_OFFSET
+        earlier = np.minimum.accumulate(pick - offset) + offset
+        earlier = np.r_[INFEASIBLE, earlier[:-1]]
+        earlier[self.route_start] = INFEASIBLE
+        best_edge = np.minimum(same, drop + earlier)
+        route_best = np.minimum.reduceat(best_edge, self.route_start)
+
+        dpick = d_to_p[a] + d_from_p[b] - self.edge_distance
+        ddrop = d_to_d[a] + d_from_d[b] - self.edge_distance
+        dsame = d_to_p[a] + d_pd + d_from_d[b] - self.edge_distance
+
+        # Visit routes from the cheapest unconstrained placement up; a route
+        # can only get more expensive once its distance budget is applied.
+        best = None
+        bounds = np.r_[self.route_start, a.size]
+        for r in np.argsort(route_best, kind="stable"):
+            if best is not None and route_best[r] >= best[0]:
+                break
+            lo, hi = bounds[r], bounds[r + 1]
+            budget = max_distance - int(self.route_distance[r])
+            j = lo + int(np.argmin(best_edge[lo:hi]))
+            i = j if same[j] <= drop[j] + earlier[j] else lo + int(np.argmin(pick[lo:j]))
+            extra_time = int(best_edge[j])
+            extra_distance = int(dsame[j]) if i == j else int(dpick[i] + ddrop[j])
+            if extra_distance > budget:
+                # The cheapest placement is too long; score every placement of
+                # this route against the distance budget instead.
+                found = best_pair(
+                    pick[lo:hi], drop[lo:hi], same[lo:hi], dpick[lo:hi], ddrop[lo:hi], dsame[lo:hi], budget
+                )
+                if found is None:
+                    continue
+                extra_time, i, j = found
+                i, j = lo + i, lo + j
+                extra_distance = int(dsame[j]) if i == j else int(dpick[i] + ddrop[j])
+            if best is None or extra_time < best[0]:
+                best = (extra_time, int(r), int(i - lo), int(j - lo), extra_distance)
+
+        if best is None:
+            return result
+        extra_time, r, i, j, extra_distance = best
+        return self._result(order, r, i, j, extra_distance, extra_time)
+
+    def _result(self, order, r, i, j, extra_distance, extra_time) -> InsertionResult:
+        route = self.routes[r]
+        stops = list(route.stops)
+        pickup = Stop(order_id=order.id, location=order.pickup_location, type="pickup")
+        dropoff = Stop(order_id=order.id, location=order.dropoff_location, type="dropoff")
+        new_stops = stops[:i] + [pickup] + stops[i:j] + [dropoff] + stops[j:]
+        return InsertionResult(
+            order_id=order.id,
+            vehicle_id=route.vehicle_id,
+            pickup_position=i,
+            dropoff_position=j + 1,
+            added_distance=extra_distance / 1000.0,
+            added_time=extra_time / 3600.0,
+            route=OptimizedRoute(
+                vehicle_id=route.vehicle_id,
+                stops=new_stops,
+                total_distance=(route.total_distance or 0.0) + extra_distance / 1000.0,
+                total_time=(route.total_time or 0.0) + extra_time / 3600.0,
+            ),
+        )
+
+    def apply(self, result: InsertionResult):
+        """Commit an insertion returned by ``evaluate`` to the plan."""
+        if result.route is None:
+            return
+        for r, route in enumerate(self.routes):
+            if route.vehicle_id == result.vehicle_id:
+                self.routes[r] = result.route
+        self._index()
+
+
+class PlanStore:
+    """Bounded LRU of server-held dispatch plans, shared by the request threads."""
+
+    def __init__(self, max_plans: int = 64):
+        self.max_plans = max_plans
+        self._plans: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, routes, vehicles, unassigned_orders=None) -> str:
+        plan_id = uuid.uuid4().hex
+        entry = (RoutePlan(routes, vehicles), list(unassigned_orders or []))
+        with self._lock:
+            self._plans[plan_id] = entry
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return plan_id
+
+    def get(self, plan_id: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._plans.get(plan_id)
+            if entry is not None:
+                self._plans.move_to_end(plan_id)
+        return entry
+
+    def describe(self, plan_id: str) -> Optional[DispatchPlan]:
+        entry = self.get(plan_id)
+        if entry is None:
+            return None
+        plan, unassigned = entry
+        with plan.lock:
+            return DispatchPlan(
+                id=plan_id,
+                vehicles=plan.vehicles,
+                optimized_routes=list(plan.routes),
+                unassigned_orders=list(unassigned),
+            )
+
+
+dispatch_plans = PlanStore()
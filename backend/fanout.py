@@ -0,0 +1,200 @@
+"""Vehicle updates routed to Socket.IO rooms and sent as throttled delta frames.
+
+Clients subscribe to a map viewport, to vehicle ids, or to both. Viewports
+are mapped onto a multi-level grid of cell rooms: the finest level whose
+cells cover the bounding box with at most ``MAX_VIEWPORT_CELLS`` rooms is
+used, and the whole-fleet room when even the coarsest level needs more.
+Every vehicle is in one cell room per level, the whole-fleet room and its
+own ``vehicle:{id}`` room.
+
+Published states are coalesced per vehicle and sent ``hz`` times a second
+as ``vehicle_deltas`` frames. Every room keeps track of the vehicles it has
+been sent. A vehicle a room already knows is sent as the fields that
+changed since the last frame, plus ``id``; one it has not seen yet, such
+as a vehicle driving into a cell, is sent in full. Vehicles that leave a
+room's cell or are deleted are listed by id under ``removed``.
+"""
+import asyncio
+import math
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from .settings import settings
+from .sockets import sio
+
+GRID_LEVELS_DEG = (0.01, 0.1, 1.0)
+MAX_VIEWPORT_CELLS = 16
+FLEET_ROOM = "fleet"
+DELTA_EVENT = "vehicle_deltas"
+
+
+def vehicle_room(vehicle_id: int) -> str:
+    return f"vehicle:{vehicle_id}"
+
+
+def _cell_room(level: int, row: int, col: int) -> str:
+    return f"cell:{level}:{row}:{col}"
+
+
+def position_rooms(lat: Optional[float], lng: Optional[float]) -> List[str]:
+    """Cell rooms at every level containing a position, plus the whole-fleet room."""
+    if lat is None or lng is None:
+        return [FLEET_ROOM]
+    rooms = [
+        _cell_room(level, math.floor(lat / size), math.floor(lng / size)) for level, size in enumerate(GRID_LEVELS_DEG)
+    ]
+    rooms.append(FLEET_ROOM)
+    return rooms
+
+
+def viewport_rooms(south: float, west: float, north: float, east: float) -> List[str]:
+    """Rooms covering a bounding box, at the finest level that needs few enough of them."""
+    if south > north or west > east:
+        # Inverted or antimeridian-crossing boxes: just follow the whole fleet.
+        return [FLEET_ROOM]
+    for level, size in enumerate(GRID_LEVELS_DEG):
+        rows = range(math.floor(south / size), math.floor(north / size) + 1)
+        cols = range(math.floor(west / size), math.floor(east / size) + 1)
+        if len(rows) * len(cols) <= MAX_VIEWPORT_CELLS:
+            return [_cell_room(level, row, col) for row in rows for col in cols]
+    return [FLEET_ROOM]
+
+
+def _rooms_of(vehicle: dict) -> List[str]:
+    return position_rooms(vehicle.get("current_lat"), vehicle.get("current_lng")) + [vehicle_room(vehicle["id"])]
+
+
+class VehicleFanout:
+    def __init__(self, sio, hz: float):
+        self.sio = sio
+        self.interval_s = 1.0 / hz
+        # Last state sent for every vehicle, states published since, and vehicles deleted since
+        self._sent: Dict[int, dict] = {}
+        self._dirty: Dict[int, dict] = {}
+        self._removed: Set[int] = set()
+        # Vehicles each subscribed room has been sent, in full or in a snapshot
+        self._known: Dict[str, Set[int]] = defaultdict(set)
+        # sid -> subscription kind ("viewport" / "vehicles") -> rooms
+        self._subscriptions: Dict[str, Dict[str, Set[str]]] = defaultdict(dict)
+        self._members: Dict[str, int] = defaultdict(int)
+        self._task: Optional[asyncio.Task] = None
+
+    def publish(self, vehicle: dict):
+        """Queue a vehicle's new state (a dict with at least ``id``) for the next frame."""
+        vid = vehicle["id"]
+        base = self._dirty.get(vid) or self._sent.get(vid, {})
+        self._dirty[vid] = {**base, **vehicle}
+        self._removed.discard(vid)
+
+    def remove(self, vehicle_id: int):
+        """Queue a deleted vehicle's removal from every room it was sent to."""
+        self._dirty.pop(vehicle_id, None)
+        self._removed.add(vehicle_id)
+
+    async def subscribe(self, sid: str, kind: str, rooms: Iterable[str]):
+        """Replace the client's ``kind`` subscription and send it a snapshot of what it newly sees."""
+        rooms = set(rooms)
+        current = self._subscriptions[sid].get(kind, set())
+        others = set().union(*(r for k, r in self._subscriptions[sid].items() if k != kind))
+        for room in current - rooms:
+            self._release(room)
+            if room not in others:
+                await self.sio.leave_room(sid, room)
+        for room in rooms - current:
+            self._members[room] += 1
+            if room not in others:
+                await self.sio.enter_room(sid, room)
+        self._subscriptions[sid][kind] = rooms
+
+        added = rooms - current - others
+        snapshot = []
+        for vehicle in self._sent.values():
+            seen_in = added.intersection(_rooms_of(vehicle))
+            if seen_in:
+                snapshot.append(vehicle)
+                for room in seen_in:
+                    self._known[room].add(vehicle["id"])
+        if snapshot:
+            await self.sio.emit(DELTA_EVENT, {"ts": time.time(), "vehicles": snapshot}, to=sid)
+
+    def _release(self, room: str):
+        self._members[room] -= 1
+        if self._members[room] <= 0:
+            del self._members[room]
+            self._known.pop(room, None)
+
+    def unsubscribe(self, sid: str):
+        """Forget a disconnected client; Socket.IO itself drops its room memberships."""
+        for rooms in self._subscriptions.pop(sid, {}).values():
+            for room in rooms:
+                self._release(room)
+
+    async def flush(self) -> int:
+        """Send one frame per subscribed room with changes; returns the number of frames."""
+        if not self._dirty and not self._removed:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        removed, self._removed = self._removed, set()
+        updates: Dict[str, List[dict]] = defaultdict(list)
+        removals: Dict[str, List[int]] = defaultdict(list)
+
+        def leave(vid: int, rooms: Iterable[str]):
+            for room in rooms:
+                known = self._known.get(room)
+                if known is not None and vid in known:
+                    known.discard(vid)
+                    removals[room].append(vid)
+
+        for vid in removed:
+            previous = self._sent.pop(vid, None)
+            if previous is not None:
+                leave(vid, _rooms_of(previous))
+        for vid, state in dirty.items():
+            previous = self._sent.get(vid, {})
+            delta = {key: value for key, value in state.items() if previous.get(key) != value}
+            if not delta:
+                continue
+            delta["id"] = vid
+            self._sent[vid] = state
+            rooms = set(_rooms_of(state))
+            for room in rooms:
+                if self._members.get(room, 0) > 0:
+                    known = self._known[room]
+                    updates[room].append(delta if vid in known else state)
+                    known.add(vid)
+            if previous:
+                leave(vid, set(_rooms_of(previous)) - rooms)
+        ts = time.time()
+        frames = set(updates) | set(removals)
+        for room in frames:
+            frame = {"ts": ts, "vehicles": updates.get(room, [])}
+            if room in removals:
+                frame["removed"] = removals[room]
+            await self.sio.emit(DELTA_EVENT, frame, room=room)
+        return len(frames)
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"vehicle fan-out failed: {exc!r}")
+            await asyncio.sleep(max(0.0, self.interval_s - (time.perf_counter() - started)))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+vehicle_fanout = VehicleFanout(sio, settings.fanout_hz)
@@ -0,0 +1,235 @@
+"""Append-only history of vehicle positions in day partitions, written in batches, and track downsampling.
+
+Every accepted ping is kept, unlike the ``vehicles`` row that only holds
+the latest position. Rows are buffered in memory and written with COPY,
+so the database sees one bulk write per flush, not one INSERT per ping.
+``vehicle_positions`` is range partitioned by ``recorded_at`` into one
+table per UTC day. Partitions are created a few days ahead, and those past
+the retention period are dropped whole, which takes no row deletes and no
+vacuum. Positions are stamped with the time the API received them, so a
+write always lands in a partition that exists.
+"""
+import asyncio
+import heapq
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from .database import async_session_maker
+from .metrics import Counter
+from .settings import settings
+from .spatial import plane_km
+
+TABLE = "vehicle_positions"
+COLUMNS = ["vehicle_id", "recorded_at", "lat", "lng", "status"]
+# Rows sent per COPY
+COPY_BATCH_ROWS = 10000
+_PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{8}})$")
+
+_LIST_PARTITIONS = text(
+    """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.relname = :table
+    """
+)
+
+# Rows are staged and appended only for vehicles that exist; telemetry for
+# an unknown id is accepted into the buffers but never matches a vehicle.
+_CREATE_STAGING = text(f"CREATE TEMP TABLE {TABLE}_import (LIKE {TABLE}) ON COMMIT DROP")
+_APPEND = text(
+    f"""
+    INSERT INTO {TABLE} ({", ".join(COLUMNS)})
+    SELECT {", ".join(COLUMNS)} FROM {TABLE}_import AS s
+    WHERE EXISTS (SELECT 1 FROM vehicles WHERE vehicles.id = s.vehicle_id)
+    """
+)
+
+# Serialises partition maintenance across workers: concurrent
+# ``CREATE TABLE IF NOT EXISTS ... PARTITION OF`` of the same day can fail.
+_MAINTENANCE_LOCK = text("SELECT pg_advisory_xact_lock(hashtext(:table))")
+
+HISTORY_ROWS = Counter(
+    "ecoroute_telemetry_history_rows_total", "Vehicle positions for the history by outcome.", ("result",)
+)
+
+Row = Tuple[int, datetime, float, float, Optional[str]]
+
+
+def partition_name(day: date) -> str:
+    return f"{TABLE}_p{day:%Y%m%d}"
+
+
+def _create_partition(day: date) -> str:
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+class TelemetryHistory:
+    """Buffers positions and appends them to ``vehicle_positions`` every ``flush_interval_s``.
+
+    At most ``max_pending`` rows wait in memory. While the database is
+    unreachable, newer positions beyond that are dropped and counted rather
+    than refusing live telemetry.
+    """
+
+    def __init__(
+        self, session_maker, flush_interval_s: float, max_pending: int, retention_days: int, premake_days: int
+    ):
+        self.session_maker = session_maker
+        self.flush_interval_s = flush_interval_s
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        self.premake_days = premake_days
+        self._rows: List[Row] = []
+        self._maintained_on: Optional[date] = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def record(self, positions: Iterable, at: Optional[datetime] = None):
+        """Queue ``VehiclePosition``-like positions received at ``at`` (now by default)."""
+        at = at or datetime.now(timezone.utc)
+        rows = [(p.vehicle_id, at, p.current_lat, p.current_lng, p.status) for p in positions]
+        room = self.max_pending - len(self._rows)
+        if len(rows) > room:
+            HISTORY_ROWS.inc(len(rows) - max(room, 0), result="dropped")
+            rows = rows[: max(room, 0)]
+        self._rows.extend(rows)
+        if len(self._rows) >= COPY_BATCH_ROWS:
+            self._wakeup.set()
+
+    async def maintain_partitions(self, today: Optional[date] = None):
+        """Create the partitions of today and the next ``premake_days`` days; drop those past retention."""
+        today = today or datetime.now(timezone.utc).date()
+        async with self.session_maker() as session:
+            await session.execute(_MAINTENANCE_LOCK, {"table": TABLE})
+            for offset in range(self.premake_days + 1):
+                await session.execute(text(_create_partition(today + timedelta(days=offset))))
+            dropped = []
+            if self.retention_days > 0:
+                oldest = today - timedelta(days=self.retention_days)
+                for (name,) in await session.execute(_LIST_PARTITIONS, {"table": TABLE}):
+                    match = _PARTITION_NAME.match(name)
+                    if match and datetime.strptime(match.group(1), "%Y%m%d").date() < oldest:
+                        await session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                        dropped.append(name)
+            await session.commit()
+        if dropped:
+            print(f"telemetry history: dropped partitions {', '.join(sorted(dropped))}")
+        self._maintained_on = today
+
+    async def flush(self) -> int:
+        """Append all buffered rows; returns the number written."""
+        if not self._rows:
+            return 0
+        if self._maintained_on != datetime.now(timezone.utc).date():
+            await self.maintain_partitions()
+        batch, self._rows = self._rows, []
+        try:
+            async with self.session_maker() as session:
+                conn = await session.connection()
+                await conn.execute(_CREATE_STAGING)
+                copy = (await conn.get_raw_connection()).driver_connection
+                for start in range(0, len(batch), COPY_BATCH_ROWS):
+                    records = batch[start : start + COPY_BATCH_ROWS]
+                    await copy.copy_records_to_table(f"{TABLE}_import", records=records, columns=COLUMNS)
+                written = (await conn.execute(_APPEND)).rowcount
+                await session.commit()
+        except BaseException:
+            # Put the batch back in front of anything that arrived meanwhile, within the bound.
+            rows = batch + self._rows
+            HISTORY_ROWS.inc(max(0, len(rows) - self.max_pending), result="dropped")
+            self._rows = rows[: self.max_pending]
+            raise
+        HISTORY_ROWS.inc(written, result="written")
+        HISTORY_ROWS.inc(len(batch) - written, result="unknown_vehicle")
+        return written
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"telemetry history flush failed, retrying: {exc!r}")
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop the flush loop and write out whatever is still buffered."""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as exc:
+            print(f"telemetry history flush on shutdown failed, {self.pending} positions lost: {exc!r}")
+
+
+def simplify_track(lat: np.ndarray, lng: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of at most ``max_points`` points of a track, chosen by Douglas-Peucker.
+
+    Starting from the two endpoints, the point furthest from the simplified
+    line is added until the budget is spent or every other point lies on
+    the line, so the most visible corners are always kept first.
+    """
+    n = len(lat)
+    if n <= max_points:
+        return np.arange(n)
+    points = plane_km(lat, lng, float(np.mean(lat)))
+    keep = [0, n - 1]
+    heap = []
+
+    def split(a: int, b: int):
+        if b - a < 2:
+            return
+        inner = points[a + 1 : b] - points[a]
+        chord = points[b] - points[a]
+        length = float(np.hypot(*chord))
+        if length > 0:
+            deviation = np.abs(inner[:, 0] * chord[1] - inner[:, 1] * chord[0]) / length
+        else:
+            deviation = np.hypot(inner[:, 0], inner[:, 1])
+        i = int(np.argmax(deviation))
+        if deviation[i] > 0:
+            heapq.heappush(heap, (-float(deviation[i]), a, b, a + 1 + i))
+
+    split(0, n - 1)
+    while heap and len(keep) < max_points:
+        _, a, b, i = heapq.heappop(heap)
+        keep.append(i)
+        split(a, i)
+        split(i, b)
+    return np.sort(np.array(keep[:max_points]))
+
+
+telemetry_history = TelemetryHistory(
+    async_session_maker,
+    flush_interval_s=settings.history_flush_interval_s,
+    max_pending=settings.history_max_pending,
+    retention_days=settings.history_retention_days,
+    premake_days=settings.history_premake_days,
+)
@@ -0,0 +1,83 @@
+"""Cheapest feasible insertion of a pickup/dropoff pair into existing routes."""
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+INFEASIBLE = np.iinfo(np.int64).max // 4
+
+
+def best_pair(
+    pickup_cost: np.ndarray,
+    dropoff_cost: np.ndarray,
+    same_edge_cost: np.ndarray,
+    pickup_distance: Optional[np.ndarray] = None,
+    dropoff_distance: Optional[np.ndarray] = None,
+    same_edge_distance: Optional[np.ndarray] = None,
+    distance_budget: Optional[int] = None,
+) -> Optional[Tuple[int, int, int]]:
+    """Pick the cheapest (pickup edge ``i``, dropoff edge ``j >= i``) of one route.
+
+    The ``*_cost`` arrays hold the extra time of placing the pickup, the
+    dropoff, or both back to back on each edge. All combinations are scored
+    as one matrix; when ``distance_budget`` is given, combinations whose
+    extra distance exceeds it are excluded. Returns ``(extra_time, i, j)``
+    or None when nothing is feasible.
+    """
+    edges = pickup_cost.size
+    if edges == 0:
+        return None
+
+    def combined(pick, drop, same):
+        total = pick[:, None].astype(np.int64) + drop[None, :]
+        total[np.diag_indices(edges)] = same
+        return total
+
+    cost = combined(pickup_cost, dropoff_cost, same_edge_cost)
+    cost[np.tril_indices(edges, k=-1)] = INFEASIBLE
+    if distance_budget is not None:
+        extra = combined(pickup_distance, dropoff_distance, same_edge_distance)
+        cost[extra > distance_budget] = INFEASIBLE
+
+    flat = int(np.argmin(cost))
+    if cost.flat[flat] >= INFEASIBLE:
+        return None
+    i, j = divmod(flat, edges)
+    return int(cost[i, j]), i, j
+
+
+def cheapest_insertion(
+    distance: np.ndarray,
+    duration: np.ndarray,
+    route: Sequence[int],
+    pickup: int,
+    dropoff: int,
+    max_distance: Optional[int] = None,
+) -> Optional[Tuple[int, int, int]]:
+    """Find where to insert ``pickup`` then ``dropoff`` into ``route``.
+
+    ``route`` lists matrix node indices from the vehicle's start to its end;
+    edge ``i`` is the arc ``route[i] -> route[i + 1]``. Returns
+    ``(extra_time, i, j)`` for the cheapest placement whose route distance
+    stays within ``max_distance``, or None when there is none.
+    """
+    nodes = np.asarray(route, dtype=np.intp)
+    a, b = nodes[:-1], nodes[1:]
+
+    def detours(matrix):
+        base = matrix[a, b].astype(np.int64)
+        pick = matrix[a, pickup].astype(np.int64) + matrix[pickup, b] - base
+        drop = matrix[a, dropoff].astype(np.int64) + matrix[dropoff, b] - base
+        same = matrix[a, pickup].astype(np.int64) + matrix[pickup, dropoff] + matrix[dropoff, b] - base
+        return pick, drop, same, base
+
+    pick, drop, same, _ = detours(duration)
+    if max_distance is None:
+        return best_pair(pick, drop, same)
+    dpick, ddrop, dsame, dbase = detours(distance)
+    return best_pair(pick, drop, same, dpick, ddrop, dsame, max_distance - int(dbase.sum()))
+
+
+def insert_pair(route: Sequence[int], pickup: int, dropoff: int, i: int, j: int) -> list:
+    """Return ``route`` with ``pickup`` placed on edge ``i`` and ``dropoff`` on edge ``j``."""
+    route = list(route)
+    return route[: i + 1] + [pickup] + route[i + 1 : j + 1] + [dropoff] + route[j + 1 :]
@@ -0,0 +1,366 @@
+"""Route optimization jobs executed off the event loop in a process pool."""
+import asyncio
+import importlib
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import OPTIMIZER_PHASE_SECONDS, OPTIMIZER_SOLVES, Gauge, collect_phases
+from .schemas import (
+    IncrementalOptimizeRequest,
+    IncrementalOptimizeResponse,
+    OptimizationJob,
+    OptimizeRouteRequest,
+    OptimizedRouteResponse,
+    RouteProgress,
+)
+from .settings import settings
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting for a worker."""
+
+
+# Stop flags shared with the worker processes, one per pool slot. A running
+# job owns a slot and the solver polls its flag from a search limit, since
+# the OR-Tools search holds the GIL and cannot be interrupted otherwise.
+_cancel_flags = None
+# Queue carrying anytime progress from the workers back to the event loop
+_progress_queue = None
+
+
+def _init_worker(flags, progress_queue):
+    global _cancel_flags, _progress_queue
+    _cancel_flags = flags
+    _progress_queue = progress_queue
+
+
+class _ProgressReporter:
+    """Forwards improving solutions to the parent, at most one per ``interval_s``."""
+
+    def __init__(self, job_id: str, interval_s: float):
+        self.job_id = job_id
+        self.interval_s = interval_s
+        self._started = time.monotonic()
+        self._last: Optional[float] = None
+
+    def __call__(self, objective: int, routes):
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.interval_s:
+            return
+        self._last = now
+        _progress_queue.put(
+            (
+                self.job_id,
+                {
+                    "objective": objective,
+                    "elapsed_seconds": now - self._started,
+                    "optimized_routes": routes().model_dump()["optimized_routes"],
+                },
+            )
+        )
+
+
+# Job kind -> (request model, response model, "module:function" of the solver).
+# Solvers are imported in the workers only, so the API process itself never
+# loads OR-Tools.
+SOLVERS = {
+    "routes": (OptimizeRouteRequest, OptimizedRouteResponse, "optimizer:solve_routes"),
+    "decomposed": (OptimizeRouteRequest, OptimizedRouteResponse, "decomposition:solve_decomposed"),
+    "incremental": (IncrementalOptimizeRequest, IncrementalOptimizeResponse, "optimizer:solve_incremental"),
+}
+
+
+def use_decomposition(request: OptimizeRouteRequest) -> bool:
+    if request.strategy == "decomposed":
+        return True
+    return request.strategy == "auto" and len(request.orders) >= settings.decomposition_auto_orders
+
+
+def _solver(kind: str):
+    module, name = SOLVERS[kind][2].split(":")
+    return getattr(importlib.import_module(f".{module}", __package__), name)
+
+
+def _warm_up_worker() -> int:
+    for kind in SOLVERS:
+        _solver(kind)
+    return os.getpid()
+
+
+def _run_job(kind: str, payload: dict, slot: int, job_id: str, progress_interval_s: float) -> Tuple[dict, dict]:
+    """Solve in a worker; returns the response and the phase timings of the whole job."""
+    request_model, solve = SOLVERS[kind][0], _solver(kind)
+    request = request_model.model_validate(payload)
+    on_progress = _ProgressReporter(job_id, progress_interval_s) if getattr(request, "anytime", False) else None
+    with collect_phases() as phases:
+        response = solve(request, should_stop=lambda: _cancel_flags[slot] != 0, on_progress=on_progress)
+    if not request.debug:
+        response.debug = None
+    return response.model_dump(), dict(phases.totals)
+
+
+class Job:
+    def __init__(self, kind: str, request):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.request = request
+        self.status = QUEUED
+        self.result: Optional[OptimizedRouteResponse] = None
+        self.progress: Optional[RouteProgress] = None
+        self.error: Optional[str] = None
+        self.done = asyncio.Event()
+        self.submitted_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._submitted = time.monotonic()
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._cancel_requested = False
+        self._stop_requested = False
+        self._slot: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def stopped_early(self) -> bool:
+        """Whether the search was asked to stop before its time limit."""
+        return self._stop_requested
+
+    def _mark_running(self, slot: int):
+        self.status = RUNNING
+        self._slot = slot
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+
+    def _mark_finished(self, status: str):
+        self.status = status
+        self.finished_at = datetime.now(timezone.utc)
+        self._finished = time.monotonic()
+        self.done.set()
+
+    def info(self) -> OptimizationJob:
+        now = time.monotonic()
+        queue_end = self._started if self._started is not None else (self._finished or now)
+        run_seconds = None
+        if self._started is not None:
+            run_seconds = (self._finished or now) - self._started
+        return OptimizationJob(
+            id=self.id,
+            kind=self.kind,
+            status=self.status,
+            submitted_at=self.submitted_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            queue_seconds=queue_end - self._submitted,
+            run_seconds=run_seconds,
+            best_objective=self.progress.objective if self.progress else None,
+            error=self.error,
+        )
+
+
+class JobManager:
+    """Runs at most ``max_workers`` solves at once and queues up to ``max_queue`` more."""
+
+    def __init__(self, max_workers: int, max_queue: int, retention_s: float, progress_interval_s: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention_s = retention_s
+        self.progress_interval_s = progress_interval_s
+        self._jobs: Dict[str, Job] = {}
+        self._listeners: List[Callable[[Job], Awaitable[None]]] = []
+        self._progress_listeners: List[Callable[[Job, RouteProgress], Awaitable[None]]] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._flags = None
+        self._progress_queue = None
+        self._pump: Optional[asyncio.Task] = None
+        self._free_slots: List[int] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def add_listener(self, callback: Callable[[Job], Awaitable[None]]):
+        """Register a coroutine called with every job once it finishes."""
+        self._listeners.append(callback)
+
+    def add_progress_listener(self, callback: Callable[[Job, RouteProgress], Awaitable[None]]):
+        """Register a coroutine called with every improving solution of an anytime job."""
+        self._progress_listeners.append(callback)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def _ensure_started(self):
+        if self._slots is None:
+            self._free_slots = list(range(self.max_workers))
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if self._executor is not None:
+            return
+        ctx = multiprocessing.get_context("spawn")
+        self._flags = ctx.Array("b", self.max_workers, lock=False)
+        self._progress_queue = ctx.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self._flags, self._progress_queue),
+        )
+        self._pump = asyncio.get_running_loop().create_task(self._pump_progress())
+
+    def _discard_pool(self, executor: ProcessPoolExecutor):
+        """Drop a pool whose worker died; the next job starts a fresh one.
+
+        Slots and their semaphore are kept, since jobs that were running on
+        the broken pool still release theirs.
+        """
+        if self._executor is not executor:
+            return
+        print("optimization worker died, restarting the process pool")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._progress_queue.put(None)
+        self._pump = None
+
+    async def _pump_progress(self):
+        loop = asyncio.get_running_loop()
+        queue = self._progress_queue
+        while True:
+            item = await loop.run_in_executor(None, queue.get)
+            if item is None:
+                return
+            job_id, data = item
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                continue
+            job.progress = RouteProgress(job_id=job_id, **data)
+            for listener in self._progress_listeners:
+                try:
+                    await listener(job, job.progress)
+                except Exception as exc:
+                    print(f"optimization progress listener failed: {exc!r}")
+
+    def _purge(self):
+        cutoff = time.monotonic() - self.retention_s
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j._finished < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, request, kind: str = "routes") -> Job:
+        self._purge()
+        if self.queue_depth >= self.max_queue:
+            raise QueueFullError(f"{self.queue_depth} optimization jobs already queued")
+        self._ensure_started()
+        job = Job(kind, request)
+        self._jobs[job.id] = job
+        job._task = asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job: Job):
+        """Cancel a queued job, or ask a running solve to stop and discard its result."""
+        if job.finished:
+            return
+        job._cancel_requested = True
+        if job.status == QUEUED:
+            job._task.cancel()
+        else:
+            self._flags[job._slot] = 1
+
+    def stop(self, job: Job):
+        """Stop a running search early and keep the best solution found so far."""
+        if job.finished:
+            return
+        if job.status == QUEUED:
+            self.cancel(job)
+        else:
+            job._stop_requested = True
+            self._flags[job._slot] = 1
+
+    async def wait(self, job: Job) -> Job:
+        await job.done.wait()
+        return job
+
+    async def _run(self, job: Job):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._slots:
+                slot = self._free_slots.pop()
+                self._ensure_started()
+                executor = self._executor
+                self._flags[slot] = 0
+                job._mark_running(slot)
+                try:
+                    payload, phases = await loop.run_in_executor(
+                        executor,
+                        _run_job,
+                        job.kind,
+                        job.request.model_dump(),
+                        slot,
+                        job.id,
+                        self.progress_interval_s,
+                    )
+                except BrokenProcessPool:
+                    self._discard_pool(executor)
+                    raise
+                finally:
+                    self._free_slots.append(slot)
+            for name, seconds in phases.items():
+                OPTIMIZER_PHASE_SECONDS.observe(seconds, kind=job.kind, phase=name)
+            if job._cancel_requested:
+                job._mark_finished(CANCELLED)
+            else:
+                job.result = SOLVERS[job.kind][1].model_validate(payload)
+                job._mark_finished(SUCCEEDED)
+        except asyncio.CancelledError:
+            job._mark_finished(CANCELLED)
+        except Exception as exc:
+            job.error = f"{type(exc).__name__}: {exc}"
+            job._mark_finished(FAILED)
+        OPTIMIZER_SOLVES.inc(kind=job.kind, status=job.status)
+        for listener in self._listeners:
+            try:
+                await listener(job)
+            except Exception as exc:
+                print(f"optimization job listener failed: {exc!r}")
+
+    async def warm_up(self):
+        """Start every worker process and import the solvers in it, ahead of the first job."""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, _warm_up_worker) for _ in range(self.max_workers))
+        )
+        return len(set(pids))
+
+    async def shutdown(self):
+        for job in list(self._jobs.values()):
+            self.cancel(job)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._progress_queue.put(None)
+            await self._pump
+
+
+job_manager = JobManager(
+    max_workers=settings.optimizer_workers,
+    max_queue=settings.optimizer_max_queue,
+    retention_s=settings.optimizer_job_retention_s,
+    progress_interval_s=settings.optimizer_progress_interval_s,
+)
+Gauge("ecoroute_optimizer_queue_depth", "Optimization jobs waiting for a worker.", lambda: job_manager.queue_depth)
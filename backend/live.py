@@ -0,0 +1,73 @@
+"""Live positions of vehicles and open orders, indexed in memory for proximity queries.
+
+The API handlers that create, update, delete or move vehicles and orders
+keep the indexes current; on startup they are loaded from the database.
+Orders are indexed by pickup location while they are open. Only writes
+handled by this process reach the indexes, so with several API workers
+they are left empty and the proximity routes query PostGIS instead.
+"""
+from typing import Optional
+
+from sqlalchemy import select
+
+from .models import Order, Vehicle
+from .schemas import OrderRead, VehicleRead
+from .settings import settings
+from .spatial import LiveIndex
+
+OPEN_ORDER_STATUS = "pending"
+
+
+class LiveState:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.vehicles = LiveIndex()
+        self.orders = LiveIndex()
+
+    def put_vehicle(self, vehicle: dict):
+        if not self.enabled:
+            return
+        self.vehicles.upsert(vehicle["id"], vehicle.get("current_lat"), vehicle.get("current_lng"), vehicle)
+
+    def move_vehicle(self, vehicle_id: int, lat: float, lng: float, status: Optional[str] = None):
+        """Update the position of an indexed vehicle; unknown ids are ignored."""
+        point = self.vehicles.get(vehicle_id) if self.enabled else None
+        if point is None:
+            return
+        vehicle = {**point[2], "current_lat": lat, "current_lng": lng}
+        if status is not None:
+            vehicle["status"] = status
+        self.vehicles.upsert(vehicle_id, lat, lng, vehicle)
+
+    def remove_vehicle(self, vehicle_id: int):
+        self.vehicles.remove(vehicle_id)
+
+    def put_order(self, order: dict):
+        if not self.enabled:
+            return
+        if order.get("status") == OPEN_ORDER_STATUS:
+            self.orders.upsert(order["id"], order.get("pickup_lat"), order.get("pickup_lng"), order)
+        else:
+            self.orders.remove(order["id"])
+
+    def remove_order(self, order_id: int):
+        self.orders.remove(order_id)
+
+    async def load(self, session_maker):
+        """Rebuild both indexes from the database."""
+        if not self.enabled:
+            print(f"live index disabled: {settings.web_concurrency} workers, proximity queries use PostGIS")
+            return
+        async with session_maker() as session:
+            vehicles = (await session.execute(select(Vehicle))).scalars()
+            self.vehicles.clear()
+            for vehicle in vehicles:
+                self.put_vehicle(VehicleRead.model_validate(vehicle, from_attributes=True).model_dump())
+            orders = await session.stream_scalars(select(Order).where(Order.status == OPEN_ORDER_STATUS))
+            self.orders.clear()
+            async for order in orders:
+                self.put_order(OrderRead.model_validate(order, from_attributes=True).model_dump())
+        print(f"live index loaded: {len(self.vehicles)} vehicles, {len(self.orders)} open orders")
+
+
+live_state = LiveState(enabled=settings.web_concurrency <= 1)
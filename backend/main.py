@@ -1,20 +1,82 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, Body
+from fastapi import FastAPI, HTTPException, Depends, Query, Body, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import NoResultFound
-from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncConnection
 from typing import List
 from .models import Order as OrderModel, Vehicle as VehicleModel
-from .database import async_session_maker
-from .routers.optimization import router as optimization_router
+from .database import async_session_maker, get_read_session, get_write_connection, read_session
+from . import repository
+from .routers.metrics import router as metrics_router
+from .routers.telemetry import router as telemetry_router
+from .routers.live import router as live_router
+from .routers.order_import import router as order_import_router
+from .routers.history import router as history_router
+from .metrics import MetricsMiddleware
+from .cache import ORDERS, VEHICLE_STATUSES, VEHICLES, read_cache
+from .result_cache import OPTIMIZATION_CACHE_HEADER
+from .jobs import job_manager
+from .settings import settings
+from .telemetry import telemetry_buffer
+from .history import telemetry_history
+from .sockets import sio
+from .fanout import vehicle_fanout, vehicle_room, viewport_rooms
+from .live import live_state
+from .pagination import NEXT_CURSOR_HEADER, contains, encode_cursor, keyset_page, ndjson_rows
+from .schemas import (
+    NearbyOrder,
+    NearbyVehicle,
+    OrderCreate,
+    OrderRead,
+    TelemetryUpdate,
+    VehicleCreate,
+    VehiclePosition,
+    VehicleRead,
+    VehicleSubscription,
+    VehicleUpsertBatch,
+    VehicleUpsertResult,
+    ViewportSubscription,
+)
+from pydantic import ValidationError
 from sqlalchemy import text
+from contextlib import asynccontextmanager
+import json
 import socketio
 
-app = FastAPI()
-app.include_router(optimization_router)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await live_state.load(async_session_maker)
+    except Exception as exc:
+        print(f"could not load the live index, starting empty: {exc!r}")
+    if settings.optimizer_enabled and settings.optimizer_warmup:
+        from .routers.optimization import warm_up
+        await warm_up()
+    telemetry_buffer.start()
+    if settings.history_enabled:
+        telemetry_history.start()
+    vehicle_fanout.start()
+    yield
+    await telemetry_buffer.close()
+    if settings.history_enabled:
+        await telemetry_history.close()
+    await vehicle_fanout.close()
+    await job_manager.shutdown()
 
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=["http://localhost:3000", "http://127.0.0.1:3000", "*"])
+app = FastAPI(lifespan=lifespan)
+if settings.optimizer_enabled:
+    from .routers.optimization import router as optimization_router
+    from .routers.dispatch import router as dispatch_router
+    app.include_router(optimization_router)
+    app.include_router(dispatch_router)
+app.include_router(metrics_router)
+app.include_router(telemetry_router)
+app.include_router(live_router)
+app.include_router(order_import_router)
+app.include_router(history_router)
+app.add_middleware(MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,44 +84,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, OPTIMIZATION_CACHE_HEADER],
 )
 
-class OrderBase(BaseModel):
-    customer_name: str
-    pickup_address: str
-    dropoff_address: str
-    status: str = "pending"
-    pickup_lat: float | None = None
-    pickup_lng: float | None = None
-    dropoff_lat: float | None = None
-    dropoff_lng: float | None = None
-
-class OrderCreate(OrderBase):
-    id: int
-
-class OrderRead(OrderBase):
-    id: int
-
-class VehicleBase(BaseModel):
-    name: str
-    status: str = "idle"
-    current_lat: float | None = None
-    current_lng: float | None = None
-
-class VehicleCreate(VehicleBase):
-    id: int
-
-class VehicleRead(VehicleBase):
-    id: int
-
-class TelemetryUpdate(BaseModel):
-    current_lat: float
-    current_lng: float
-    status: str | None = None
-
-async def get_session():
-    async with async_session_maker() as session:
-        yield session
+ORDER_COLUMNS = ", ".join(OrderRead.model_fields)
+VEHICLE_COLUMNS = ", ".join(VehicleRead.model_fields)
+QUERY_POINT = "ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography"
 
 @sio.event
 async def connect(sid, environ):
@@ -68,163 +98,290 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     print("disconnect ", sid)
+    vehicle_fanout.unsubscribe(sid)
+
+@sio.event
+async def subscribe_viewport(sid, data):
+    try:
+        viewport = ViewportSubscription.model_validate(data)
+    except ValidationError as exc:
+        return {"error": exc.errors(include_url=False)}
+    rooms = viewport_rooms(viewport.south, viewport.west, viewport.north, viewport.east)
+    await vehicle_fanout.subscribe(sid, "viewport", rooms)
+    return {"rooms": len(rooms)}
+
+@sio.event
+async def subscribe_vehicles(sid, data):
+    try:
+        subscription = VehicleSubscription.model_validate(data)
+    except ValidationError as exc:
+        return {"error": exc.errors(include_url=False)}
+    await vehicle_fanout.subscribe(sid, "vehicles", [vehicle_room(vid) for vid in subscription.vehicle_ids])
+    return {"rooms": len(subscription.vehicle_ids)}
 
 @app.get("/")
 async def health_check():
     return {"status": "ok"}
 
+def _cacheable_read_session():
+    """Session for a read whose result is cached: the primary while the cache is on, else ``read_session``.
+
+    A lagging replica could return a row older than the write that just
+    bumped the cache generation, and it would be stored under the new
+    generation and served until its TTL runs out.
+    """
+    return async_session_maker() if read_cache.enabled else read_session()
+
+async def _load_page(stmt, read_model, limit: int) -> dict:
+    """One list page from the database, with the cursor of the next page if there is one."""
+    async with _cacheable_read_session() as session:
+        rows = (await session.execute(stmt)).scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    return {"items": [read_model.model_validate(row, from_attributes=True).model_dump() for row in rows], "next_cursor": next_cursor}
+
+async def _load_one(model, read_model, id: int) -> dict | None:
+    async with _cacheable_read_session() as session:
+        row = await session.get(model, id)
+    return None if row is None else read_model.model_validate(row, from_attributes=True).model_dump()
+
 @app.post("/orders", response_model=OrderRead)
-async def create_order(order: OrderCreate, session: AsyncSession = Depends(get_session)):
-    db_order = await session.get(OrderModel, order.id)
-    if db_order:
+async def create_order(order: OrderCreate, conn: AsyncConnection = Depends(get_write_connection)):
+    db_order = await repository.create_order(conn, order.model_dump())
+    if db_order is None:
         raise HTTPException(status_code=400, detail="Order with this ID already exists.")
-    db_order = OrderModel(**order.dict())
-    session.add(db_order)
-    await session.commit()
-    await session.refresh(db_order)
+    await read_cache.invalidate(ORDERS)
+    live_state.put_order(db_order)
     return db_order
 
+def _filter_orders(stmt, status: str | None, customer_name: str | None):
+    if status:
+        stmt = stmt.where(OrderModel.status == status)
+    if customer_name:
+        stmt = stmt.where(contains(OrderModel.customer_name, customer_name))
+    return stmt
+
 @app.get("/orders", response_model=List[OrderRead])
 async def list_orders(
-    session: AsyncSession = Depends(get_session),
-    limit: int = Query(10, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    response: Response,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: str | None = Query(None, description=f"Value of the {NEXT_CURSOR_HEADER} header of the previous page"),
+    offset: int = Query(0, ge=0, description="Deprecated, use cursor"),
     status: str | None = None,
     customer_name: str | None = None,
 ):
-    stmt = select(OrderModel)
+    """Orders by id. When there are more, the cursor of the next page is in the X-Next-Cursor header."""
+    stmt = keyset_page(_filter_orders(select(OrderModel), status, customer_name), OrderModel.id, limit, cursor, offset)
+    key = "page:" + json.dumps([limit, cursor, offset, status, customer_name])
+    page = await read_cache.get_or_load(ORDERS, key, lambda: _load_page(stmt, OrderRead, limit))
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return page["items"]
+
+@app.get("/orders/export")
+async def export_orders(status: str | None = None, customer_name: str | None = None):
+    """All matching orders by id as NDJSON, streamed straight from the database."""
+    columns = [getattr(OrderModel, field) for field in OrderRead.model_fields]
+    stmt = _filter_orders(select(*columns), status, customer_name).order_by(OrderModel.id)
+    return StreamingResponse(ndjson_rows(read_session, stmt), media_type="application/x-ndjson")
+
+# Declared before /orders/{order_id} so "nearby" is not taken for an id.
+@app.get("/orders/nearby", response_model=List[NearbyOrder])
+async def get_orders_nearby(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude of the center point"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitude of the center point"),
+    radius_km: float = Query(5, gt=0, description="Radius in kilometers"),
+    limit: int = Query(50, ge=1, le=500),
+    status: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Orders with a pickup within ``radius_km``, nearest first."""
+    # Both the radius filter and the <-> ordering run on the GiST index of pickup_geog.
+    sql = text(f'''
+        SELECT {ORDER_COLUMNS}, ST_Distance(pickup_geog, {QUERY_POINT}) / 1000 AS distance_km
+        FROM orders
+        WHERE ST_DWithin(pickup_geog, {QUERY_POINT}, :radius_m)
+        {"AND status = :status" if status else ""}
+        ORDER BY pickup_geog <-> {QUERY_POINT}
+        LIMIT :limit
+    ''')
+    params = {"lat": lat, "lng": lng, "radius_m": radius_km * 1000, "limit": limit}
     if status:
-        stmt = stmt.where(OrderModel.status == status)
-    if customer_name:
-        stmt = stmt.where(OrderModel.customer_name.ilike(f"%{customer_name}%"))
-    stmt = stmt.offset(offset).limit(limit)
-    result = await session.execute(stmt)
-    orders = result.scalars().all()
-    return orders
+        params["status"] = status
+    result = await session.execute(sql, params)
+    return [NearbyOrder(**row._mapping) for row in result]
 
 @app.get("/orders/{order_id}", response_model=OrderRead)
-async def get_order(order_id: int, session: AsyncSession = Depends(get_session)):
-    order = await session.get(OrderModel, order_id)
-    if not order:
+async def get_order(order_id: int):
+    order = await read_cache.get_or_load(ORDERS, f"id:{order_id}", lambda: _load_one(OrderModel, OrderRead, order_id))
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found.")
     return order
 
 @app.put("/orders/{order_id}", response_model=OrderRead)
-async def update_order(order_id: int, updated_order: OrderCreate, session: AsyncSession = Depends(get_session)):
-    db_order = await session.get(OrderModel, order_id)
-    if not db_order:
+async def update_order(order_id: int, updated_order: OrderCreate, conn: AsyncConnection = Depends(get_write_connection)):
+    db_order = await repository.update_order(conn, order_id, updated_order.model_dump())
+    if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found.")
-    for field, value in updated_order.dict().items():
-        setattr(db_order, field, value)
-    await session.commit()
-    await session.refresh(db_order)
+    await read_cache.invalidate(ORDERS)
+    live_state.remove_order(order_id)
+    live_state.put_order(db_order)
     return db_order
 
 @app.delete("/orders/{order_id}")
-async def delete_order(order_id: int, session: AsyncSession = Depends(get_session)):
-    db_order = await session.get(OrderModel, order_id)
-    if not db_order:
+async def delete_order(order_id: int, conn: AsyncConnection = Depends(get_write_connection)):
+    if not await repository.delete_order(conn, order_id):
         raise HTTPException(status_code=404, detail="Order not found.")
-    await session.delete(db_order)
-    await session.commit()
+    await read_cache.invalidate(ORDERS)
+    live_state.remove_order(order_id)
     return {"detail": "Order deleted."}
 
-@app.get("/orders/nearby", response_model=List[OrderRead])
-async def get_orders_nearby(
-    lat: float = Query(..., description="Latitude of the center point"),
-    lng: float = Query(..., description="Longitude of the center point"),
-    radius_km: float = Query(5, description="Radius in kilometers"),
-    session: AsyncSession = Depends(get_session),
-):
-    # Use raw SQL for PostGIS distance query
-    sql = text('''
-        SELECT * FROM orders
-        WHERE pickup_lat IS NOT NULL AND pickup_lng IS NOT NULL
-        AND ST_DWithin(
-            ST_SetSRID(ST_MakePoint(pickup_lng, pickup_lat), 4326)::geography,
-            ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography,
-            :radius_m
-        )
-    ''')
-    result = await session.execute(sql, {"lat": lat, "lng": lng, "radius_m": radius_km * 1000})
-    orders = result.fetchall()
-    # Convert to list of dicts for Pydantic
-    return [OrderRead(**dict(row)) for row in orders]
-
 @app.post("/vehicles", response_model=VehicleRead)
-async def create_vehicle(vehicle: VehicleCreate, session: AsyncSession = Depends(get_session)):
-    db_vehicle = await session.get(VehicleModel, vehicle.id)
-    if db_vehicle:
+async def create_vehicle(vehicle: VehicleCreate, conn: AsyncConnection = Depends(get_write_connection)):
+    db_vehicle = await repository.create_vehicle(conn, vehicle.model_dump())
+    if db_vehicle is None:
         raise HTTPException(status_code=400, detail="Vehicle with this ID already exists.")
-    db_vehicle = VehicleModel(**vehicle.dict())
-    session.add(db_vehicle)
-    await session.commit()
-    await session.refresh(db_vehicle)
+    await read_cache.invalidate(VEHICLES)
+    live_state.put_vehicle(db_vehicle)
+    vehicle_fanout.publish(db_vehicle)
     return db_vehicle
 
+@app.post("/vehicles/bulk", response_model=VehicleUpsertResult)
+async def upsert_vehicles(batch: VehicleUpsertBatch, conn: AsyncConnection = Depends(get_write_connection)):
+    """Create or overwrite many vehicles in a single statement."""
+    rows = await repository.upsert_vehicles(conn, [vehicle.model_dump() for vehicle in batch.vehicles])
+    await read_cache.invalidate(VEHICLES)
+    for vehicle, _ in rows:
+        telemetry_buffer.discard(vehicle["id"])
+        live_state.put_vehicle(vehicle)
+        vehicle_fanout.publish(vehicle)
+    inserted = sum(1 for _, new in rows if new)
+    return VehicleUpsertResult(inserted=inserted, updated=len(rows) - inserted, vehicles=[vehicle for vehicle, _ in rows])
+
+def _filter_vehicles(stmt, status: str | None, name: str | None):
+    if status:
+        stmt = stmt.where(VehicleModel.status == status)
+    if name:
+        stmt = stmt.where(contains(VehicleModel.name, name))
+    return stmt
+
+def _vehicle_ids(page: dict):
+    return [vehicle["id"] for vehicle in page["items"]]
+
 @app.get("/vehicles", response_model=List[VehicleRead])
 async def list_vehicles(
-    session: AsyncSession = Depends(get_session),
-    limit: int = Query(10, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    response: Response,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: str | None = Query(None, description=f"Value of the {NEXT_CURSOR_HEADER} header of the previous page"),
+    offset: int = Query(0, ge=0, description="Deprecated, use cursor"),
     status: str | None = None,
     name: str | None = None,
 ):
-    stmt = select(VehicleModel)
+    """Vehicles by id. When there are more, the cursor of the next page is in the X-Next-Cursor header."""
+    stmt = keyset_page(_filter_vehicles(select(VehicleModel), status, name), VehicleModel.id, limit, cursor, offset)
+    key = "page:" + json.dumps([limit, cursor, offset, status, name])
     if status:
-        stmt = stmt.where(VehicleModel.status == status)
-    if name:
-        stmt = stmt.where(VehicleModel.name.ilike(f"%{name}%"))
-    stmt = stmt.offset(offset).limit(limit)
-    result = await session.execute(stmt)
-    vehicles = result.scalars().all()
-    return vehicles
+        key += f":statuses:{await read_cache.generation(VEHICLE_STATUSES)}"
+    page = await read_cache.get_or_load(
+        VEHICLES, key, lambda: _load_page(stmt, VehicleRead, limit), items=_vehicle_ids
+    )
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return page["items"]
+
+@app.get("/vehicles/export")
+async def export_vehicles(status: str | None = None, name: str | None = None):
+    """All matching vehicles by id as NDJSON, streamed straight from the database."""
+    columns = [getattr(VehicleModel, field) for field in VehicleRead.model_fields]
+    stmt = _filter_vehicles(select(*columns), status, name).order_by(VehicleModel.id)
+    return StreamingResponse(ndjson_rows(read_session, stmt), media_type="application/x-ndjson")
+
+# Declared before /vehicles/{vehicle_id} so "nearby" is not taken for an id.
+@app.get("/vehicles/nearby", response_model=List[NearbyVehicle])
+async def get_vehicles_nearby(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude of the center point"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitude of the center point"),
+    radius_km: float = Query(5, gt=0, description="Radius in kilometers"),
+    limit: int = Query(50, ge=1, le=500),
+    status: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Vehicles currently within ``radius_km``, nearest first."""
+    sql = text(f'''
+        SELECT {VEHICLE_COLUMNS}, ST_Distance(current_geog, {QUERY_POINT}) / 1000 AS distance_km
+        FROM vehicles
+        WHERE ST_DWithin(current_geog, {QUERY_POINT}, :radius_m)
+        {"AND status = :status" if status else ""}
+        ORDER BY current_geog <-> {QUERY_POINT}
+        LIMIT :limit
+    ''')
+    params = {"lat": lat, "lng": lng, "radius_m": radius_km * 1000, "limit": limit}
+    if status:
+        params["status"] = status
+    result = await session.execute(sql, params)
+    return [NearbyVehicle(**row._mapping) for row in result]
 
 @app.get("/vehicles/{vehicle_id}", response_model=VehicleRead)
-async def get_vehicle(vehicle_id: int, session: AsyncSession = Depends(get_session)):
-    vehicle = await session.get(VehicleModel, vehicle_id)
-    if not vehicle:
+async def get_vehicle(vehicle_id: int):
+    vehicle = await read_cache.get_or_load(
+        VEHICLES,
+        f"id:{vehicle_id}",
+        lambda: _load_one(VehicleModel, VehicleRead, vehicle_id),
+        items=lambda vehicle: [vehicle["id"]],
+    )
+    if vehicle is None:
         raise HTTPException(status_code=404, detail="Vehicle not found.")
     return vehicle
 
 @app.put("/vehicles/{vehicle_id}", response_model=VehicleRead)
-async def update_vehicle(vehicle_id: int, updated_vehicle: VehicleCreate, session: AsyncSession = Depends(get_session)):
-    db_vehicle = await session.get(VehicleModel, vehicle_id)
-    if not db_vehicle:
+async def update_vehicle(vehicle_id: int, updated_vehicle: VehicleCreate, conn: AsyncConnection = Depends(get_write_connection)):
+    db_vehicle = await repository.update_vehicle(conn, vehicle_id, updated_vehicle.model_dump())
+    if db_vehicle is None:
         raise HTTPException(status_code=404, detail="Vehicle not found.")
-    for field, value in updated_vehicle.dict().items():
-        setattr(db_vehicle, field, value)
-    await session.commit()
-    await session.refresh(db_vehicle)
+    await read_cache.invalidate(VEHICLES)
+    telemetry_buffer.discard(vehicle_id)
+    live_state.remove_vehicle(vehicle_id)
+    live_state.put_vehicle(db_vehicle)
+    vehicle_fanout.publish(db_vehicle)
     return db_vehicle
 
 @app.delete("/vehicles/{vehicle_id}")
-async def delete_vehicle(vehicle_id: int, session: AsyncSession = Depends(get_session)):
-    db_vehicle = await session.get(VehicleModel, vehicle_id)
-    if not db_vehicle:
+async def delete_vehicle(vehicle_id: int, conn: AsyncConnection = Depends(get_write_connection)):
+    if not await repository.delete_vehicle(conn, vehicle_id):
         raise HTTPException(status_code=404, detail="Vehicle not found.")
-    await session.delete(db_vehicle)
-    await session.commit()
+    await read_cache.invalidate(VEHICLES)
+    live_state.remove_vehicle(vehicle_id)
+    vehicle_fanout.remove(vehicle_id)
     return {"detail": "Vehicle deleted."}
 
 @app.post("/vehicles/{vehicle_id}/telemetry", response_model=VehicleRead)
 async def update_vehicle_telemetry(
     vehicle_id: int,
     telemetry: TelemetryUpdate = Body(...),
-    session: AsyncSession = Depends(get_session),
+    conn: AsyncConnection = Depends(get_write_connection),
 ):
-    db_vehicle = await session.get(VehicleModel, vehicle_id)
-    if not db_vehicle:
+    vehicle = await repository.move_vehicle(
+        conn, vehicle_id, telemetry.current_lat, telemetry.current_lng, telemetry.status
+    )
+    if vehicle is None:
         raise HTTPException(status_code=404, detail="Vehicle not found.")
-    db_vehicle.current_lat = telemetry.current_lat
-    db_vehicle.current_lng = telemetry.current_lng
+    await read_cache.invalidate_items(VEHICLES, [vehicle_id])
     if telemetry.status is not None:
-        db_vehicle.status = telemetry.status
-    await session.commit()
-    await session.refresh(db_vehicle)
-    # Convert SQLAlchemy model to Pydantic model before emitting
-    await sio.emit("vehicle_update", VehicleRead.model_validate(db_vehicle, from_attributes=True).model_dump())
-    return db_vehicle 
+        await read_cache.invalidate(VEHICLE_STATUSES)
+    telemetry_buffer.discard(vehicle_id)
+    if settings.history_enabled:
+        position = VehiclePosition(
+            vehicle_id=vehicle_id,
+            current_lat=vehicle["current_lat"],
+            current_lng=vehicle["current_lng"],
+            status=vehicle["status"],
+        )
+        telemetry_history.record([position])
+    live_state.put_vehicle(vehicle)
+    vehicle_fanout.publish(vehicle)
+    return vehicle
 
 # Mount the Socket.IO app to the FastAPI app under a specific path
 app = socketio.ASGIApp(sio, other_asgi_app=app)
\ No newline at end of file
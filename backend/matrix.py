@@ -0,0 +1,204 @@
+"""Vectorized distance and travel-time matrices for route optimization."""
+from collections import namedtuple
+from dataclasses import dataclass
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import phase
+from .road_network import current_network
+from .schemas import Location
+from .spatial import EARTH_RADIUS_KM, knn
+from .travel_time import euclidean_distance, predict_travel_time_batch, split_thresholds
+
+# Upper bound on cells evaluated per block so that the float64 temporaries of
+# large instances stay around a few tens of megabytes.
+BLOCK_CELLS = 1 << 20
+
+# NumPy's arctan2 may differ from math.atan2 in the last bit. Cells whose
+# distance lies this close (relative) to a truncation boundary or a booster
+# split are recomputed with the scalar path so results stay bit-identical.
+_BOUNDARY_RTOL = 1e-13
+
+_Point = namedtuple("_Point", "latitude longitude")
+
+
+def location_arrays(locations: Sequence[Location]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return latitude and longitude arrays (degrees) for ``locations``."""
+    lat = np.fromiter((loc.latitude for loc in locations), dtype=float, count=len(locations))
+    lng = np.fromiter((loc.longitude for loc in locations), dtype=float, count=len(locations))
+    return lat, lng
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Great-circle distance in kilometers, broadcasting over array inputs.
+
+    Mirrors ``travel_time.euclidean_distance`` operation for operation.
+    """
+    lat1 = np.radians(lat1)
+    lon1 = np.radians(lng1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lng2)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def _near_boundary(distance_km: np.ndarray) -> np.ndarray:
+    """Mask of cells where a last-bit difference could change the result."""
+    meters = distance_km * 1000
+    frac = meters - np.floor(meters)
+    tol = meters * _BOUNDARY_RTOL + 1e-12
+    mask = (frac < tol) | (1 - frac < tol)
+    thresholds = split_thresholds()
+    if thresholds.size:
+        pos = np.searchsorted(thresholds, distance_km)
+        lower = thresholds[np.maximum(pos - 1, 0)]
+        upper = thresholds[np.minimum(pos, thresholds.size - 1)]
+        nearest = np.minimum(np.abs(distance_km - lower), np.abs(upper - distance_km))
+        mask |= nearest <= tol / 1000
+    # Coincident points are exactly zero on both paths.
+    return mask & (meters > 0)
+
+
+def exact_haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """``haversine_km`` with boundary cells recomputed by the scalar path."""
+    dist_km = np.array(haversine_km(lat1, lng1, lat2, lng2), dtype=float)
+    lat1, lng1, lat2, lng2 = np.broadcast_arrays(lat1, lng1, lat2, lng2)
+    for idx in zip(*np.nonzero(_near_boundary(dist_km))):
+        dist_km[idx] = euclidean_distance(_Point(lat1[idx], lng1[idx]), _Point(lat2[idx], lng2[idx]))
+    return dist_km
+
+
+def travel_distance_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Distance in km of each ``(lat1[i], lng1[i]) -> (lat2[i], lng2[i])`` pair.
+
+    Along the road network when one is configured and knows both points,
+    ``exact_haversine_km`` otherwise.
+    """
+    network = current_network()
+    if network is None:
+        return exact_haversine_km(lat1, lng1, lat2, lng2)
+    dist_km = network.pairs_km(lat1, lng1, lat2, lng2)
+    _fill_haversine(dist_km, lat1, lng1, lat2, lng2)
+    return dist_km
+
+
+def travel_matrix_km(src_lat, src_lng, dst_lat, dst_lng) -> np.ndarray:
+    """``travel_distance_km`` from every source point to every target point."""
+    src_lat, src_lng = np.asarray(src_lat, dtype=float)[:, None], np.asarray(src_lng, dtype=float)[:, None]
+    dst_lat, dst_lng = np.asarray(dst_lat, dtype=float)[None, :], np.asarray(dst_lng, dtype=float)[None, :]
+    network = current_network()
+    if network is None:
+        return exact_haversine_km(src_lat, src_lng, dst_lat, dst_lng)
+    dist_km = network.matrix_km(src_lat.ravel(), src_lng.ravel(), dst_lat.ravel(), dst_lng.ravel())
+    _fill_haversine(dist_km, src_lat, src_lng, dst_lat, dst_lng)
+    return dist_km
+
+
+def _fill_haversine(dist_km: np.ndarray, lat1, lng1, lat2, lng2):
+    """Replace the NaN cells of ``dist_km`` (no road distance) with great-circle distances."""
+    missing = np.nonzero(np.isnan(dist_km))
+    if missing[0].size:
+        lat1, lng1, lat2, lng2 = (np.broadcast_to(a, dist_km.shape)[missing] for a in (lat1, lng1, lat2, lng2))
+        dist_km[missing] = exact_haversine_km(lat1, lng1, lat2, lng2)
+
+
+def travel_cells(distance_km: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert distances in km to solver units (int32 meters and seconds)."""
+    with phase("travel_time_predict"):
+        time_h = predict_travel_time_batch(distance_km)
+    return (distance_km * 1000).astype(np.int32), (time_h * 3600).astype(np.int32)
+
+
+def build_matrices(locations: Sequence[Location], cache=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Build the distance (m) and travel-time (s) matrices for ``locations``.
+
+    Returns two ``size x size`` int32 arrays with a zero diagonal. Distances
+    are computed as whole-array haversine operations and travel times with one
+    batched booster call per block of rows. With a road network configured,
+    distances are its many-to-many matrix where it knows both points. With a
+    ``matrix_cache.TravelTimeCache`` only the location pairs it has not seen
+    yet are computed.
+    """
+    size = len(locations)
+    if cache is not None and size:
+        cached = cache.lookup(locations)
+        if cached is not None:
+            return cached
+
+    distance = np.zeros((size, size), dtype=np.int32)
+    duration = np.zeros((size, size), dtype=np.int32)
+    if size == 0:
+        return distance, duration
+
+    lat, lng = location_arrays(locations)
+    network = current_network()
+    road_km = None
+    if network is not None:
+        road_km = network.matrix_km(lat, lng, lat, lng)
+        _fill_haversine(road_km, lat[:, None], lng[:, None], lat[None, :], lng[None, :])
+    rows = max(1, BLOCK_CELLS // size)
+    for start in range(0, size, rows):
+        stop = min(start + rows, size)
+        if road_km is not None:
+            dist_km = road_km[start:stop]
+        else:
+            dist_km = exact_haversine_km(lat[start:stop, None], lng[start:stop, None], lat[None, :], lng[None, :])
+        distance[start:stop], duration[start:stop] = travel_cells(dist_km)
+
+    np.fill_diagonal(distance, 0)
+    np.fill_diagonal(duration, 0)
+    return distance, duration
+
+
+@dataclass
+class SparseArcs:
+    """Travel costs of a candidate subset of the arcs between ``size`` locations."""
+
+    size: int
+    # from_node * size + to_node -> position in ``distance``/``duration``
+    index: Dict[int, int]
+    distance: list
+    duration: list
+    # Sorted candidate successors of every node
+    successors: list
+
+
+def build_sparse_arcs(
+    locations: Sequence[Location],
+    k: int,
+    extra_arcs: Tuple[np.ndarray, np.ndarray] = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)),
+) -> SparseArcs:
+    """Costs of the arcs between each location and its ``k`` nearest neighbours.
+
+    Neighbour arcs are kept in both directions, plus the ``(from, to)`` node
+    arrays in ``extra_arcs``. Only these cells are computed, with the same
+    distance and booster path as ``build_matrices``.
+    """
+    size = len(locations)
+    lat, lng = location_arrays(locations)
+    neighbours = knn(lat, lng, k)
+    nodes = np.arange(size)
+    src = [np.repeat(nodes, neighbours.shape[1]), neighbours.ravel(), extra_arcs[0]]
+    dst = [neighbours.ravel(), np.repeat(nodes, neighbours.shape[1]), extra_arcs[1]]
+
+    keys = np.unique(np.concatenate(src).astype(np.int64) * size + np.concatenate(dst))
+    src, dst = np.divmod(keys, size)
+    keys, src, dst = keys[src != dst], src[src != dst], dst[src != dst]
+
+    distance = np.empty(0, dtype=np.int32)
+    duration = np.empty(0, dtype=np.int32)
+    if keys.size:
+        dist_km = travel_distance_km(lat[src], lng[src], lat[dst], lng[dst])
+        distance, duration = travel_cells(dist_km)
+    bounds = np.searchsorted(src, np.arange(size + 1))
+    return SparseArcs(
+        size=size,
+        index=dict(zip(keys.tolist(), range(keys.size))),
+        distance=distance.tolist(),
+        duration=duration.tolist(),
+        successors=[dst[bounds[i] : bounds[i + 1]] for i in range(size)],
+    )
@@ -0,0 +1,133 @@
+"""Process-wide cache of travel distances/times between quantized locations."""
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .matrix import travel_cells, travel_distance_km
+from .schemas import Location
+from .settings import settings
+from .road_network import network_version
+from .travel_time import model_version
+
+# Coordinates are rounded to this many decimals before keying the cache;
+# 4 decimals is ~11 m of latitude.
+DEFAULT_PRECISION = 4
+
+
+class TravelTimeCache:
+    """LRU cache of travel costs between quantized locations.
+
+    Every distinct quantized location owns a slot in two dense
+    ``capacity x capacity`` int32 matrices, so the cached cells of a request
+    are gathered with one fancy-indexing operation and only cells that were
+    never computed go through ``travel_distance_km`` and the booster.
+    Evicting the least recently used location invalidates its row and column. Values are
+    computed from the exact coordinates of the first location seen for each
+    quantized key, so a request matches ``build_matrices`` exactly unless
+    another location within the same key populated the slot. The cache is
+    cleared whenever the travel-time model or road network version changes.
+    """
+
+    def __init__(self, capacity: int, precision: int = DEFAULT_PRECISION):
+        self.capacity = capacity
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypasses = 0
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple[str, str]] = None
+        self._slots: "OrderedDict[Tuple[float, float], int]" = OrderedDict()
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lat = np.zeros(capacity, dtype=float)
+        self._lng = np.zeros(capacity, dtype=float)
+        self._distance = np.zeros((capacity, capacity), dtype=np.int32)
+        self._duration = np.zeros((capacity, capacity), dtype=np.int32)
+        self._valid = np.zeros((capacity, capacity), dtype=bool)
+
+    def key(self, location: Location) -> Tuple[float, float]:
+        return (round(location.latitude, self.precision), round(location.longitude, self.precision))
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._slots.clear()
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._valid[:] = False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "capacity": self.capacity,
+            "locations": len(self._slots),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bypasses": self.bypasses,
+        }
+
+    def _slot_for(self, key: Tuple[float, float], location: Location) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            _, slot = self._slots.popitem(last=False)
+            self._valid[slot, :] = False
+            self._valid[:, slot] = False
+            self.evictions += 1
+        self._slots[key] = slot
+        self._lat[slot], self._lng[slot] = location.latitude, location.longitude
+        return slot
+
+    def lookup(self, locations: Sequence[Location]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Return the distance and time matrices for ``locations``, or None if they do not fit."""
+        keys = [self.key(loc) for loc in locations]
+        first = {}
+        for key, location in zip(keys, locations):
+            first.setdefault(key, location)
+        unique = list(first)
+        with self._lock:
+            if len(unique) > self.capacity:
+                self.bypasses += 1
+                return None
+            version = (model_version(), network_version())
+            if version != self._version:
+                self._clear()
+                self._version = version
+
+            # Touch the request's existing locations first so the ones evicted
+            # to make room for new locations never belong to this request.
+            for key in unique:
+                if key in self._slots:
+                    self._slots.move_to_end(key)
+            slot_of = {key: self._slot_for(key, first[key]) for key in unique}
+            slots = np.fromiter(slot_of.values(), dtype=np.intp, count=len(slot_of))
+
+            block = np.ix_(slots, slots)
+            missing = ~self._valid[block]
+            n_missing = int(missing.sum())
+            self.misses += n_missing
+            self.hits += missing.size - n_missing
+            if n_missing:
+                rows, cols = np.nonzero(missing)
+                src, dst = slots[rows], slots[cols]
+                dist_km = travel_distance_km(self._lat[src], self._lng[src], self._lat[dst], self._lng[dst])
+                self._distance[src, dst], self._duration[src, dst] = travel_cells(dist_km)
+                self._valid[src, dst] = True
+
+            index = np.fromiter((slot_of[key] for key in keys), dtype=np.intp, count=len(keys))
+            full = np.ix_(index, index)
+            distance = self._distance[full]
+            duration = self._duration[full]
+        np.fill_diagonal(distance, 0)
+        np.fill_diagonal(duration, 0)
+        return distance, duration
+
+
+travel_cache = TravelTimeCache(settings.matrix_cache_locations) if settings.matrix_cache_locations > 0 else None
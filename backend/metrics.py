@@ -0,0 +1,220 @@
+"""In-process metrics exposed in the Prometheus text format, plus phase timing."""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    """A gauge whose value is read from ``function`` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def render(self):
+        return super().render() + [f"{self.name} {self.function()}"]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[bisect_left(self.buckets, value)] += 1
+            row[-1] += value
+
+    def totals(self, **labels) -> Tuple[int, float]:
+        """Number and sum of the observations with these label values."""
+        with self._lock:
+            row = self._values.get(self._key(labels))
+            return (0, 0.0) if row is None else (int(sum(row[:-1])), row[-1])
+
+    def render(self):
+        lines = super().render()
+        with self._lock:
+            for key, row in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {row[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "ecoroute_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+DB_QUERIES = Histogram(
+    "ecoroute_db_queries_per_request", "Database statements executed per HTTP request.", ("route",), COUNT_BUCKETS
+)
+SOCKETIO_EMITS = Counter("ecoroute_socketio_emits_total", "Socket.IO events emitted by event name.", ("event",))
+OPTIMIZER_PHASE_SECONDS = Histogram(
+    "ecoroute_optimizer_phase_seconds", "Time spent in each phase of an optimization.", ("kind", "phase")
+)
+OPTIMIZER_SOLVES = Counter("ecoroute_optimizer_solves_total", "Finished optimization jobs by status.", ("kind", "status"))
+
+
+# Statement counter of the HTTP request being handled, if any
+_db_query_count: ContextVar[Optional[List[int]]] = ContextVar("db_query_count", default=None)
+
+
+def count_db_query(*_):
+    """SQLAlchemy ``before_cursor_execute`` listener."""
+    counter = _db_query_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and statement count of every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        queries = [0]
+        token = _db_query_count.set(queries)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _db_query_count.reset(token)
+            # The route template keeps label cardinality bounded.
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=path, status=status[0])
+            DB_QUERIES.observe(queries[0], route=path)
+
+
+class PhaseTimer:
+    """Accumulates exclusive wall time per named phase; nested phases are not double counted."""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self._children: List[float] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        self._children.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.totals[name] += elapsed - self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+
+
+_phase_timer: ContextVar[Optional[PhaseTimer]] = ContextVar("phase_timer", default=None)
+
+
+@contextmanager
+def collect_phases():
+    """Time ``phase`` blocks run inside; joins an enclosing collection if there is one."""
+    timer = _phase_timer.get()
+    if timer is not None:
+        yield timer
+        return
+    timer = PhaseTimer()
+    token = _phase_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _phase_timer.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    timer = _phase_timer.get()
+    if timer is None:
+        yield
+    else:
+        with timer.phase(name):
+            yield
@@ -1,8 +1,24 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Computed, DateTime, Index, Integer, String, Float, Table
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
+from sqlalchemy.types import UserDefinedType
 
 Base = declarative_base()
 
+
+class Geography(UserDefinedType):
+    """PostGIS ``geography(Point, 4326)``; values are only used inside SQL, never loaded."""
+
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "geography(Point, 4326)"
+
+
+def _point(lat: str, lng: str) -> Computed:
+    return Computed(f"ST_SetSRID(ST_MakePoint({lng}, {lat}), 4326)::geography", persisted=True)
+
+
 class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True)
@@ -14,6 +30,20 @@ class Order(Base):
     pickup_lng = Column(Float, nullable=True)
     dropoff_lat = Column(Float, nullable=True)
     dropoff_lng = Column(Float, nullable=True)
+    # Generated from the coordinates, GiST indexed (migration 825fd7f5c18e)
+    pickup_geog = deferred(Column(Geography(), _point("pickup_lat", "pickup_lng")))
+    dropoff_geog = deferred(Column(Geography(), _point("dropoff_lat", "dropoff_lng")))
+    __table_args__ = (
+        Index("ix_orders_pickup_geog", "pickup_geog", postgresql_using="gist"),
+        Index("ix_orders_dropoff_geog", "dropoff_geog", postgresql_using="gist"),
+        Index("ix_orders_status_id", "status", "id"),
+        Index(
+            "ix_orders_customer_name_trgm",
+            "customer_name",
+            postgresql_using="gin",
+            postgresql_ops={"customer_name": "gin_trgm_ops"},
+        ),
+    )
 
 class Vehicle(Base):
     __tablename__ = "vehicles"
@@ -21,4 +51,28 @@ class Vehicle(Base):
     name = Column(String, nullable=False)
     status = Column(String, nullable=False, default="idle")
     current_lat = Column(Float, nullable=True)
-    current_lng = Column(Float, nullable=True) 
\ No newline at end of file
+    current_lng = Column(Float, nullable=True)
+    # When the API received the stored position; buffered telemetry received
+    # earlier never overwrites it (migration 9a4d6e2b7c15)
+    position_at = Column(DateTime(timezone=True), nullable=True)
+    current_geog = deferred(Column(Geography(), _point("current_lat", "current_lng")))
+    __table_args__ = (
+        Index("ix_vehicles_current_geog", "current_geog", postgresql_using="gist"),
+        Index("ix_vehicles_status_id", "status", "id"),
+        Index("ix_vehicles_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
+
+
+# Every accepted position, range partitioned into one table per UTC day
+# (migration 5c2e7a9d41f3). Written with COPY by backend/history.py.
+vehicle_positions = Table(
+    "vehicle_positions",
+    Base.metadata,
+    Column("vehicle_id", Integer, nullable=False),
+    Column("recorded_at", DateTime(timezone=True), nullable=False),
+    Column("lat", Float, nullable=False),
+    Column("lng", Float, nullable=False),
+    Column("status", String, nullable=True),
+    Index("ix_vehicle_positions_vehicle_time", "vehicle_id", "recorded_at"),
+    postgresql_partition_by="RANGE (recorded_at)",
+)
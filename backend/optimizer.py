@@ -0,0 +1,552 @@
+"""Pickup-and-delivery route optimization with OR-Tools."""
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+from .insertion import cheapest_insertion, insert_pair
+from .matrix import SparseArcs, build_matrices, build_sparse_arcs
+from .matrix_cache import travel_cache
+from .travel_time import model_version
+from .metrics import collect_phases, phase
+from .schemas import (
+    IncrementalOptimizeRequest,
+    IncrementalOptimizeResponse,
+    Location,
+    OptimizationDebug,
+    OptimizeRouteRequest,
+    OptimizedRouteResponse,
+    OptimizedRoute,
+    OrderInOptimization,
+    PlanChanges,
+    SolverStats,
+    Stop,
+)
+
+# Large penalty to discourage dropping an order
+DROP_PENALTY = 10**7
+MAX_ROUTE_DISTANCE_M = 1000000
+MAX_ROUTE_TIME_S = 100000000
+# Transit of an arc outside the sparse candidate set; more than a route may
+# drive, so the dimension filters reject such arcs without costing them.
+FORBIDDEN_ARC = MAX_ROUTE_DISTANCE_M + 1
+# Dense retry after a sparse solve left orders unassigned: only for problems
+# whose full matrix is this small, and only with this much of the time limit left
+DENSE_RETRY_MAX_NODES = 1000
+DENSE_RETRY_MIN_S = 1.0
+
+
+@dataclass
+class RoutingProblem:
+    """Node layout of a request plus its costs.
+
+    Costs are either contiguous int32 ``distance``/``duration`` matrices or,
+    in sparse mode, the candidate ``arcs`` only.
+    """
+
+    request: OptimizeRouteRequest
+    locations: List[Location]
+    start_indices: List[int]
+    end_indices: List[int]
+    pickup_drop_indices: List[Tuple[int, int, int]]
+    distance: Optional[np.ndarray] = None
+    duration: Optional[np.ndarray] = None
+    arcs: Optional[SparseArcs] = None
+    # Travel-time model the costs were predicted with
+    model_version: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.locations)
+
+
+@dataclass
+class SolverModel:
+    manager: pywrapcp.RoutingIndexManager
+    routing: pywrapcp.RoutingModel
+    distance_dimension: pywrapcp.RoutingDimension
+    time_dimension: pywrapcp.RoutingDimension
+    # Python transit callbacks, which must outlive the solve
+    callbacks: tuple = field(default=())
+
+
+def use_sparse_arcs(request: OptimizeRouteRequest) -> bool:
+    k = request.sparse_neighbors
+    # Below this size every node is a neighbour of every other anyway.
+    return k is not None and 2 * len(request.orders) + 2 * len(request.vehicles) > k + 1
+
+
+def _depot_and_order_arcs(start_indices, end_indices, pickup_drop_indices) -> Tuple[np.ndarray, np.ndarray]:
+    """Arcs sparse mode always keeps: start <-> pickup, dropoff <-> end, start -> own end and pickup -> dropoff.
+
+    Arcs into a start or out of an end are never driven, but OR-Tools picks
+    the insertion positions its operators try from each node's cheapest
+    arcs in either direction, so without them depots are never considered.
+    """
+    starts = np.array(start_indices, dtype=np.int64)
+    ends = np.array(end_indices, dtype=np.int64)
+    pairs = np.array([(p, d) for p, d, _ in pickup_drop_indices], dtype=np.int64).reshape(-1, 2)
+    pickups, dropoffs = pairs[:, 0], pairs[:, 1]
+    depot_src = np.concatenate([np.repeat(starts, pickups.size), np.tile(dropoffs, ends.size)])
+    depot_dst = np.concatenate([np.tile(pickups, starts.size), np.repeat(ends, dropoffs.size)])
+    src = [depot_src, depot_dst, starts, pickups]
+    dst = [depot_dst, depot_src, ends, dropoffs]
+    return np.concatenate(src), np.concatenate(dst)
+
+
+def build_problem(request: OptimizeRouteRequest, dense: bool = False) -> RoutingProblem:
+    """Lay out vehicle start/end and order pickup/dropoff nodes and compute their costs.
+
+    Sparse candidate arcs are built instead of full matrices when the request
+    asks for them, unless ``dense`` is set.
+    """
+    locations = []
+    start_indices = []
+    end_indices = []
+    for v in request.vehicles:
+        start_indices.append(len(locations))
+        locations.append(v.start_location)
+        if v.end_location:
+            end_indices.append(len(locations))
+            locations.append(v.end_location)
+        else:
+            end_indices.append(start_indices[-1])
+
+    pickup_drop_indices = []
+    for o in request.orders:
+        pickup_index = len(locations)
+        locations.append(o.pickup_location)
+        dropoff_index = len(locations)
+        locations.append(o.dropoff_location)
+        pickup_drop_indices.append((pickup_index, dropoff_index, o.id))
+
+    # Checked before the costs are built, so a model replaced meanwhile is
+    # only picked up by the next request.
+    version = model_version()
+    if use_sparse_arcs(request) and not dense:
+        with phase("matrix_build"):
+            extra_arcs = _depot_and_order_arcs(start_indices, end_indices, pickup_drop_indices)
+            arcs = build_sparse_arcs(locations, request.sparse_neighbors, extra_arcs)
+        return RoutingProblem(
+            request=request,
+            locations=locations,
+            start_indices=start_indices,
+            end_indices=end_indices,
+            pickup_drop_indices=pickup_drop_indices,
+            arcs=arcs,
+            model_version=version,
+        )
+
+    with phase("matrix_build"):
+        distance, duration = build_matrices(locations, cache=travel_cache)
+    return RoutingProblem(
+        request=request,
+        locations=locations,
+        start_indices=start_indices,
+        end_indices=end_indices,
+        pickup_drop_indices=pickup_drop_indices,
+        distance=np.ascontiguousarray(distance, dtype=np.int32),
+        duration=np.ascontiguousarray(duration, dtype=np.int32),
+        model_version=version,
+    )
+
+
+def build_model(problem: RoutingProblem) -> SolverModel:
+    """Create the OR-Tools model with the cost matrices registered natively.
+
+    ``RegisterTransitMatrix`` copies the matrices into the solver, so arc costs
+    are looked up in C++ instead of calling back into Python for every arc
+    the local search evaluates.
+    """
+    with phase("model_build"):
+        return _build_model(problem)
+
+
+def _build_model(problem: RoutingProblem) -> SolverModel:
+    manager = pywrapcp.RoutingIndexManager(
+        problem.size, len(problem.request.vehicles), problem.start_indices, problem.end_indices
+    )
+    routing = pywrapcp.RoutingModel(manager)
+
+    callbacks = ()
+    if problem.arcs is not None:
+        callbacks = _sparse_callbacks(problem.arcs, manager)
+        distance_cb = routing.RegisterTransitCallback(callbacks[0])
+        time_cb = routing.RegisterTransitCallback(callbacks[1])
+        _restrict_to_arcs(problem, manager, routing)
+    else:
+        distance_cb = routing.RegisterTransitMatrix(problem.distance.tolist())
+        time_cb = routing.RegisterTransitMatrix(problem.duration.tolist())
+
+    # Optimize primarily for predicted travel time
+    routing.SetArcCostEvaluatorOfAllVehicles(time_cb)
+
+    routing.AddDimension(distance_cb, 0, MAX_ROUTE_DISTANCE_M, True, "Distance")
+    routing.AddDimension(time_cb, 0, MAX_ROUTE_TIME_S, True, "Time")
+    distance_dimension = routing.GetDimensionOrDie("Distance")
+    time_dimension = routing.GetDimensionOrDie("Time")
+
+    for pickup_idx, drop_idx, oid in problem.pickup_drop_indices:
+        pickup_i = manager.NodeToIndex(pickup_idx)
+        drop_i = manager.NodeToIndex(drop_idx)
+        routing.AddPickupAndDelivery(pickup_i, drop_i)
+        routing.solver().Add(
+            routing.VehicleVar(pickup_i) == routing.VehicleVar(drop_i)
+        )
+        routing.solver().Add(
+            distance_dimension.CumulVar(pickup_i)
+            <= distance_dimension.CumulVar(drop_i)
+        )
+        # Both nodes of an order are performed together or not at all.
+        routing.AddDisjunction([pickup_i, drop_i], DROP_PENALTY, 2)
+
+    return SolverModel(manager, routing, distance_dimension, time_dimension, callbacks)
+
+
+def _sparse_callbacks(arcs: SparseArcs, manager: pywrapcp.RoutingIndexManager) -> tuple:
+    size = arcs.size
+    index, distance, duration = arcs.index, arcs.distance, arcs.duration
+
+    def transit(values):
+        def callback(from_index, to_index):
+            from_node = manager.IndexToNode(from_index)
+            to_node = manager.IndexToNode(to_index)
+            if from_node == to_node:
+                return 0
+            pos = index.get(from_node * size + to_node)
+            return FORBIDDEN_ARC if pos is None else values[pos]
+
+        return callback
+
+    return transit(distance), transit(duration)
+
+
+def _restrict_to_arcs(problem: RoutingProblem, manager: pywrapcp.RoutingIndexManager, routing: pywrapcp.RoutingModel):
+    """Limit the successors of every order node to its candidate arcs.
+
+    Vehicle starts keep their full domain (depot arcs), every order node may
+    still go to any vehicle end, and an order node may point to itself,
+    which is how OR-Tools represents an unperformed node.
+    """
+    depots = set(problem.start_indices) | set(problem.end_indices)
+    ends = [routing.End(v) for v in range(len(problem.request.vehicles))]
+    for pickup_idx, drop_idx, _ in problem.pickup_drop_indices:
+        for node in (pickup_idx, drop_idx):
+            index = manager.NodeToIndex(node)
+            allowed = [manager.NodeToIndex(int(n)) for n in problem.arcs.successors[node] if int(n) not in depots]
+            routing.NextVar(index).SetValues(allowed + ends + [index])
+
+
+def default_search_parameters(time_limit_s: float = 10):
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    search_parameters.time_limit.FromMilliseconds(int(time_limit_s * 1000))
+    return search_parameters
+
+
+def extract_solution(problem: RoutingProblem, model: SolverModel, solution) -> OptimizedRouteResponse:
+    """Convert an OR-Tools assignment (or ``CURRENT_SOLUTION``) into the API response."""
+    orders = problem.request.orders
+    vehicles = problem.request.vehicles
+    manager, routing = model.manager, model.routing
+    locations = problem.locations
+
+    optimized_routes: List[OptimizedRoute] = []
+    unassigned_orders: List[int] = []
+
+    if solution:
+        stop_at = {}
+        for p_idx, d_idx, oid in problem.pickup_drop_indices:
+            stop_at[p_idx] = (oid, "pickup")
+            stop_at[d_idx] = (oid, "dropoff")
+        order_assigned = {o.id: False for o in orders}
+        for vehicle_id in range(len(vehicles)):
+            index = routing.Start(vehicle_id)
+            stops: List[Stop] = []
+            while not routing.IsEnd(index):
+                node = manager.IndexToNode(index)
+                stop = stop_at.get(node)
+                if stop is not None:
+                    oid, kind = stop
+                    stops.append(Stop(order_id=oid, location=locations[node], type=kind))
+                    if kind == "pickup":
+                        order_assigned[oid] = True
+                index = solution.Value(routing.NextVar(index))
+            total_dist = solution.Value(model.distance_dimension.CumulVar(routing.End(vehicle_id))) / 1000.0
+            total_time = solution.Value(model.time_dimension.CumulVar(routing.End(vehicle_id))) / 3600.0
+            optimized_routes.append(
+                OptimizedRoute(
+                    vehicle_id=vehicles[vehicle_id].id,
+                    stops=stops,
+                    total_distance=total_dist,
+                    total_time=total_time,
+                )
+            )
+        unassigned_orders = [oid for oid, assigned in order_assigned.items() if not assigned]
+    else:
+        unassigned_orders = [o.id for o in orders]
+
+    return OptimizedRouteResponse(
+        optimized_routes=optimized_routes,
+        unassigned_orders=unassigned_orders,
+        model_version=problem.model_version,
+    )
+
+
+class _CurrentSolution:
+    """Reads variable values of the solution the search is currently at."""
+
+    def Value(self, var):
+        return var.Value()
+
+
+CURRENT_SOLUTION = _CurrentSolution()
+
+ProgressCallback = Callable[[int, Callable[[], OptimizedRouteResponse]], None]
+
+
+def add_progress_callback(problem: RoutingProblem, model: SolverModel, on_progress: ProgressCallback):
+    """Call ``on_progress(objective, routes)`` for every improving solution found.
+
+    ``routes`` extracts the solution when called, which must happen within
+    ``on_progress``; callers that throttle can skip the extraction cost.
+    """
+    routing = model.routing
+    best = []
+
+    def at_solution():
+        objective = routing.CostVar().Value()
+        if best and objective >= best[0]:
+            return
+        best[:] = [objective]
+        on_progress(objective, lambda: extract_solution(problem, model, CURRENT_SOLUTION))
+
+    routing.AddAtSolutionCallback(at_solution)
+    model.callbacks += (at_solution,)
+
+
+def solver_stats(model: SolverModel, solution) -> SolverStats:
+    solver = model.routing.solver()
+    return SolverStats(
+        status=routing_enums_pb2.RoutingSearchStatus.Value.Name(model.routing.status()),
+        objective=solution.ObjectiveValue() if solution else None,
+        solutions=solver.Solutions(),
+        branches=solver.Branches(),
+    )
+
+
+def solve_routes(
+    request: OptimizeRouteRequest,
+    should_stop: Optional[Callable[[], bool]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    time_limit_s: Optional[float] = None,
+) -> OptimizedRouteResponse:
+    """Solve ``request`` synchronously as one model.
+
+    ``should_stop`` is polled by the search; once it returns True the solver
+    stops and the best solution found so far is returned. The whole call,
+    including a dense retry of a sparse solve, takes at most about
+    ``time_limit_s``, by default the request's ``time_limit_seconds``.
+    """
+    if time_limit_s is None:
+        time_limit_s = request.time_limit_seconds
+    deadline = time.monotonic() + time_limit_s
+    with collect_phases() as phases:
+        problem = build_problem(request)
+        response = _solve_problem(problem, should_stop, time_limit_s, on_progress)
+        if problem.arcs is not None and response.unassigned_orders:
+            # The candidate arcs may have cut off a feasible assignment. When the
+            # search ended early and the full matrix is small, retry with every
+            # arc in the time left and keep whichever plan serves more orders.
+            remaining_s = deadline - time.monotonic()
+            stopped = should_stop is not None and should_stop()
+            if not stopped and len(problem.locations) <= DENSE_RETRY_MAX_NODES and remaining_s >= DENSE_RETRY_MIN_S:
+                print(f"sparse arcs left {len(response.unassigned_orders)} orders unassigned, retrying dense")
+                dense_problem = build_problem(request, dense=True)
+                remaining_s = deadline - time.monotonic()
+                if remaining_s >= DENSE_RETRY_MIN_S:
+                    dense = _solve_problem(dense_problem, should_stop, remaining_s, on_progress)
+                    if len(dense.unassigned_orders) < len(response.unassigned_orders):
+                        response = dense
+            else:
+                print(f"sparse arcs left {len(response.unassigned_orders)} orders unassigned")
+    response.debug.phases = dict(phases.totals)
+    return response
+
+
+def _solve_problem(problem: RoutingProblem, should_stop, time_limit_s: float, on_progress=None) -> OptimizedRouteResponse:
+    model = build_model(problem)
+    if should_stop is not None:
+        model.routing.AddSearchMonitor(model.routing.solver().CustomLimit(should_stop))
+    if on_progress is not None:
+        add_progress_callback(problem, model, on_progress)
+    with phase("solve"):
+        solution = model.routing.SolveWithParameters(default_search_parameters(time_limit_s))
+    with phase("extract"):
+        response = extract_solution(problem, model, solution)
+    response.debug = OptimizationDebug(phases={}, solver=solver_stats(model, solution))
+    return response
+
+
+def _previous_orders(previous: OptimizedRouteResponse) -> Dict[int, OrderInOptimization]:
+    """Rebuild the orders of a plan from its pickup and dropoff stops."""
+    pickups: Dict[int, Location] = {}
+    dropoffs: Dict[int, Location] = {}
+    for route in previous.optimized_routes:
+        for stop in route.stops:
+            (pickups if stop.type == "pickup" else dropoffs)[stop.order_id] = stop.location
+    return {
+        oid: OrderInOptimization(id=oid, pickup_location=pickups[oid], dropoff_location=dropoffs[oid])
+        for oid in pickups
+        if oid in dropoffs
+    }
+
+
+def previous_routes(problem: RoutingProblem, previous: OptimizedRouteResponse) -> List[List[int]]:
+    """Map the stops of ``previous`` onto nodes of ``problem``, one list per vehicle.
+
+    Orders that no longer exist, vehicles that left the fleet and stop pairs
+    that are split or out of order are left out.
+    """
+    nodes = {}
+    for pickup_idx, drop_idx, oid in problem.pickup_drop_indices:
+        nodes[(oid, "pickup")] = pickup_idx
+        nodes[(oid, "dropoff")] = drop_idx
+    vehicle_index = {v.id: i for i, v in enumerate(problem.request.vehicles)}
+
+    routes: List[List[int]] = [[] for _ in problem.request.vehicles]
+    placed = set()
+    for route in previous.optimized_routes:
+        vi = vehicle_index.get(route.vehicle_id)
+        if vi is None:
+            continue
+        picked_up = set()
+        complete = set()
+        for stop in route.stops:
+            if stop.order_id in placed or (stop.order_id, stop.type) not in nodes:
+                continue
+            if stop.type == "pickup":
+                picked_up.add(stop.order_id)
+            elif stop.order_id in picked_up:
+                complete.add(stop.order_id)
+        routes[vi] = [nodes[(stop.order_id, stop.type)] for stop in route.stops if stop.order_id in complete]
+        placed |= complete
+    return routes
+
+
+def seed_missing_orders(problem: RoutingProblem, routes: List[List[int]]):
+    """Insert every order absent from ``routes`` at its cheapest feasible position, in place."""
+    placed = {node for route in routes for node in route}
+    for pickup_idx, drop_idx, _ in problem.pickup_drop_indices:
+        if pickup_idx in placed:
+            continue
+        best = None
+        for vi, route in enumerate(routes):
+            full = [problem.start_indices[vi], *route, problem.end_indices[vi]]
+            found = cheapest_insertion(
+                problem.distance, problem.duration, full, pickup_idx, drop_idx, MAX_ROUTE_DISTANCE_M
+            )
+            if found is not None and (best is None or found[0] < best[0]):
+                best = (found[0], vi, found[1], found[2])
+        if best is not None:
+            _, vi, i, j = best
+            full = [problem.start_indices[vi], *routes[vi], problem.end_indices[vi]]
+            routes[vi] = insert_pair(full, pickup_idx, drop_idx, i, j)[1:-1]
+
+
+def plan_changes(
+    previous: OptimizedRouteResponse,
+    current: OptimizedRouteResponse,
+    added_ids: set,
+    removed_ids: set,
+) -> PlanChanges:
+    """Summarize how much of ``previous`` was kept in ``current``."""
+    def assignment(plan):
+        vehicle_of = {}
+        sequences = {}
+        for route in plan.optimized_routes:
+            sequences[route.vehicle_id] = [(s.order_id, s.type) for s in route.stops]
+            for s in route.stops:
+                vehicle_of[s.order_id] = route.vehicle_id
+        return vehicle_of, sequences
+
+    prev_vehicle, prev_seq = assignment(previous)
+    new_vehicle, new_seq = assignment(current)
+
+    kept = set(prev_vehicle) - removed_ids - added_ids
+    reassigned = sorted(oid for oid in kept if new_vehicle.get(oid) != prev_vehicle[oid])
+    changed_vehicles = sorted(
+        vid for vid in set(prev_seq) | set(new_seq) if prev_seq.get(vid, []) != new_seq.get(vid, [])
+    )
+
+    # A kept stop has moved when its vehicle or its position among the
+    # vehicle's kept stops differs from the previous plan.
+    moved = 0
+    total = 0
+    for vid, seq in new_seq.items():
+        total += len(seq)
+        before = [stop for stop in prev_seq.get(vid, []) if stop[0] in kept]
+        after = [stop for stop in seq if stop[0] in kept]
+        moved += sum(1 for pos, stop in enumerate(after) if pos >= len(before) or before[pos] != stop)
+        moved += sum(1 for stop in seq if stop[0] not in kept)
+
+    return PlanChanges(
+        added_orders=len(added_ids),
+        removed_orders=len(removed_ids),
+        reassigned_orders=reassigned,
+        changed_vehicles=changed_vehicles,
+        moved_stops=moved,
+        changed_fraction=moved / total if total else 0.0,
+    )
+
+
+def solve_incremental(
+    request: IncrementalOptimizeRequest,
+    should_stop: Optional[Callable[[], bool]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> IncrementalOptimizeResponse:
+    """Re-optimize a previous plan after orders were added or removed.
+
+    The previous routes are restored as the initial assignment, new or
+    orphaned orders are placed by cheapest insertion, and local search
+    continues from there, so a good plan is reached well within
+    ``request.time_limit_seconds``. Orders that were unassigned in the
+    previous plan are only retried when sent again in ``added_orders``.
+    """
+    removed_ids = set(request.removed_order_ids)
+    added = {o.id: o for o in request.added_orders}
+    orders = [
+        o for oid, o in _previous_orders(request.previous).items() if oid not in removed_ids and oid not in added
+    ]
+    orders.extend(added.values())
+    plan = OptimizeRouteRequest(orders=orders, vehicles=request.vehicles)
+
+    with collect_phases() as phases:
+        problem = build_problem(plan)
+        model = build_model(problem)
+        if should_stop is not None:
+            model.routing.AddSearchMonitor(model.routing.solver().CustomLimit(should_stop))
+        if on_progress is not None:
+            add_progress_callback(problem, model, on_progress)
+        search_parameters = default_search_parameters(request.time_limit_seconds)
+        with phase("model_build"):
+            model.routing.CloseModelWithParameters(search_parameters)
+
+        with phase("seed"):
+            routes = previous_routes(problem, request.previous)
+            seed_missing_orders(problem, routes)
+            index_routes = [[model.manager.NodeToIndex(node) for node in route] for route in routes]
+            initial = model.routing.ReadAssignmentFromRoutes(index_routes, True)
+        with phase("solve"):
+            if initial is not None:
+                solution = model.routing.SolveFromAssignmentWithParameters(initial, search_parameters)
+            else:
+                solution = model.routing.SolveWithParameters(search_parameters)
+
+        with phase("extract"):
+            response = extract_solution(problem, model, solution)
+            changes = plan_changes(request.previous, response, set(added), removed_ids)
+    response.debug = OptimizationDebug(phases=dict(phases.totals), solver=solver_stats(model, solution))
+    return IncrementalOptimizeResponse(**response.model_dump(), changes=changes)
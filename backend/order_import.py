@@ -0,0 +1,227 @@
+"""Bulk order import: stream CSV or NDJSON, validate rows, COPY into a staging table and merge."""
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+
+from .schemas import ImportRowError, OrderCreate, OrderImportResult
+
+# Rows sent per COPY
+COPY_BATCH_ROWS = 5000
+# Row errors returned in full; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+COLUMNS = list(OrderCreate.model_fields)
+# Range of the integer id column
+_INT32_MIN, _INT32_MAX = -(2**31), 2**31 - 1
+_COLUMN_LIST = ", ".join(COLUMNS)
+
+_CREATE_STAGING = text(
+    """
+    CREATE TEMP TABLE order_import (
+        line integer NOT NULL,
+        id integer NOT NULL,
+        customer_name varchar NOT NULL,
+        pickup_address varchar NOT NULL,
+        dropoff_address varchar NOT NULL,
+        status varchar NOT NULL,
+        pickup_lat double precision,
+        pickup_lng double precision,
+        dropoff_lat double precision,
+        dropoff_lng double precision,
+        merged boolean NOT NULL DEFAULT false
+    ) ON COMMIT DROP
+    """
+)
+
+# The last row of the file wins for an id given more than once. xmax = 0
+# tells freshly inserted rows from updated ones. Staged rows are marked
+# with whether their id was merged, for the report.
+_MERGE = {
+    "skip": "ON CONFLICT (id) DO NOTHING",
+    "update": "ON CONFLICT (id) DO UPDATE SET "
+    + ", ".join(f"{c} = EXCLUDED.{c}" for c in COLUMNS if c != "id"),
+}
+
+
+def _merge_statement(on_conflict: str):
+    return text(
+        f"""
+        WITH merged AS (
+            INSERT INTO orders ({_COLUMN_LIST})
+            SELECT DISTINCT ON (id) {_COLUMN_LIST} FROM order_import ORDER BY id, line DESC
+            {_MERGE[on_conflict]}
+            RETURNING {_COLUMN_LIST}, (xmax = 0) AS inserted
+        ), marked AS (
+            UPDATE order_import SET merged = true FROM merged WHERE order_import.id = merged.id
+        )
+        SELECT * FROM merged
+        """
+    )
+
+
+# Staged rows that were not merged: superseded by a later line with the
+# same id, or skipped because the id exists. ``total`` counts them all.
+_NOT_MERGED = text(
+    """
+    SELECT s.line, s.id, last.line AS last_line, count(*) OVER () AS total
+    FROM order_import AS s
+    JOIN (SELECT id, max(line) AS line FROM order_import GROUP BY id) AS last ON last.id = s.id
+    WHERE s.line <> last.line OR NOT s.merged
+    ORDER BY s.line
+    LIMIT :limit
+    """
+)
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """Regroup a byte stream into lists of complete lines (line endings kept)."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        # Only "\n" ends a line; other line breaks may occur inside fields.
+        *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+        if lines:
+            yield [line + "\n" for line in lines]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield [pending]
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[dict], str]]:
+    """Yield ``(line, row, error)`` for every non-blank line."""
+    number = 0
+    async for lines in _lines(chunks):
+        for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield number, None, f"invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "expected a JSON object"
+            else:
+                yield number, row, ""
+
+
+async def parse_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[dict], str]]:
+    """Yield ``(line, row, error)`` for every record after the header line.
+
+    Empty fields are left out so that model defaults apply. Quoted fields may
+    span lines; a record is complete once its quotes are balanced.
+    """
+    header: Optional[List[str]] = None
+    record, start, number, quotes = "", 0, 0, 0
+    async for lines in _lines(chunks):
+        records: List[Tuple[int, str]] = []
+        for line in lines:
+            number += 1
+            if not record:
+                start = number
+            record += line
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                records.append((start, record))
+                record, quotes = "", 0
+        for (line_number, _), fields in zip(records, csv.reader(r for _, r in records)):
+            if not fields or fields == [""]:
+                continue
+            if header is None:
+                header = [name.strip() for name in fields]
+                continue
+            if len(fields) != len(header):
+                yield line_number, None, f"expected {len(header)} fields, got {len(fields)}"
+                continue
+            yield line_number, {name: value for name, value in zip(header, fields) if value != ""}, ""
+    if record:
+        yield start, None, "unterminated quoted field"
+
+
+def _row_id(row: dict) -> Optional[int]:
+    try:
+        return int(row.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _unstorable(order: dict) -> Optional[str]:
+    """Why a valid order cannot be stored, so that it is rejected before COPY rather than failing it."""
+    if not _INT32_MIN <= order["id"] <= _INT32_MAX:
+        return "id: must fit in a 32-bit integer"
+    for column, value in order.items():
+        if isinstance(value, str) and "\x00" in value:
+            return f"{column}: must not contain NUL characters"
+    return None
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in exc.errors())
+
+
+async def import_orders(
+    session, rows: AsyncIterator[Tuple[int, Optional[dict], str]], on_conflict: str = "skip"
+) -> Tuple[OrderImportResult, List[dict]]:
+    """Validate and load ``rows`` in one transaction.
+
+    Returns the summary and the merged orders, for callers keeping caches
+    of orders current.
+    """
+    result = OrderImportResult(received=0, inserted=0, updated=0, rejected=0, errors=[])
+
+    def reject(line: int, order_id: Optional[int], error: str):
+        result.rejected += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append(ImportRowError(line=line, id=order_id, error=error))
+
+    conn = await session.connection()
+    await conn.execute(_CREATE_STAGING)
+    copy = (await conn.get_raw_connection()).driver_connection
+    staged = 0
+    batch: List[tuple] = []
+    async for line, row, error in rows:
+        result.received += 1
+        if row is None:
+            reject(line, None, error)
+            continue
+        try:
+            order = OrderCreate.model_validate(row).model_dump()
+        except ValidationError as exc:
+            reject(line, _row_id(row), _validation_message(exc))
+            continue
+        problem = _unstorable(order)
+        if problem:
+            reject(line, order["id"], problem)
+            continue
+        batch.append((line, *(order[c] for c in COLUMNS)))
+        staged += 1
+        if len(batch) >= COPY_BATCH_ROWS:
+            await copy.copy_records_to_table("order_import", records=batch, columns=["line", *COLUMNS])
+            batch = []
+    if batch:
+        await copy.copy_records_to_table("order_import", records=batch, columns=["line", *COLUMNS])
+
+    merged = []
+    if staged:
+        for row in await conn.execute(_merge_statement(on_conflict)):
+            order = dict(row._mapping)
+            result.inserted += order.pop("inserted")
+            merged.append(order)
+        result.updated = len(merged) - result.inserted
+        # Rejections past the reported ones are only counted.
+        limit = max(MAX_REPORTED_ERRORS - len(result.errors), 1)
+        not_merged = (await conn.execute(_NOT_MERGED, {"limit": limit})).all()
+        for line, order_id, last_line, _ in not_merged:
+            if line != last_line:
+                reject(line, order_id, f"superseded by line {last_line}")
+            else:
+                reject(line, order_id, "order with this ID already exists")
+        if not_merged:
+            result.rejected += not_merged[0].total - len(not_merged)
+    result.errors.sort(key=lambda e: e.line)
+    return result, merged
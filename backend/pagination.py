@@ -0,0 +1,55 @@
+"""Keyset pagination cursors, substring filters and NDJSON streaming of query results."""
+import base64
+import binascii
+import json
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import Select
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Rows fetched per round trip from the server-side cursor of an export
+EXPORT_BATCH_ROWS = 1000
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        after = value["after"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not isinstance(after, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return after
+
+
+def keyset_page(stmt: Select, id_column, limit: int, cursor: Optional[str], offset: int) -> Select:
+    """Order ``stmt`` by id and select the page after ``cursor``, plus one row to tell if there is more."""
+    if cursor is not None:
+        if offset:
+            raise HTTPException(status_code=400, detail="Use either cursor or offset, not both.")
+        stmt = stmt.where(id_column > decode_cursor(cursor))
+    elif offset:
+        stmt = stmt.offset(offset)
+    return stmt.order_by(id_column).limit(limit + 1)
+
+
+def contains(column, text: str):
+    """Case-insensitive substring match, with LIKE wildcards in ``text`` taken literally.
+
+    The pg_trgm GIN indexes serve these for patterns of three or more characters.
+    """
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+async def ndjson_rows(session_maker, stmt: Select) -> AsyncIterator[bytes]:
+    """Stream rows of ``stmt`` as newline-delimited JSON from a server-side cursor."""
+    async with session_maker() as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        async for rows in result.partitions():
+            yield "".join(json.dumps(dict(row._mapping)) + "\n" for row in rows).encode()
@@ -0,0 +1,101 @@
+"""Single-statement writes for orders and vehicles.
+
+Each mutation is one INSERT ... ON CONFLICT, UPDATE ... RETURNING or
+DELETE ... RETURNING. Run on an autocommit connection
+(``database.get_write_connection``), a call is one database round trip,
+with no existence check before it and no refresh after it.
+"""
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .models import Order, Vehicle
+from .schemas import OrderRead, VehicleRead
+
+orders = Order.__table__
+vehicles = Vehicle.__table__
+ORDER_COLUMNS = [orders.c[name] for name in OrderRead.model_fields]
+VEHICLE_COLUMNS = [vehicles.c[name] for name in VehicleRead.model_fields]
+
+
+async def _one(conn: AsyncConnection, stmt) -> Optional[dict]:
+    row = (await conn.execute(stmt)).first()
+    return None if row is None else dict(row._mapping)
+
+
+async def create_order(conn: AsyncConnection, order: dict) -> Optional[dict]:
+    """Insert an order; ``None`` if the id is taken."""
+    stmt = insert(orders).values(**order).on_conflict_do_nothing(index_elements=[orders.c.id]).returning(*ORDER_COLUMNS)
+    return await _one(conn, stmt)
+
+
+async def update_order(conn: AsyncConnection, order_id: int, order: dict) -> Optional[dict]:
+    """Overwrite an order; ``None`` if it does not exist."""
+    stmt = orders.update().where(orders.c.id == order_id).values(**order).returning(*ORDER_COLUMNS)
+    return await _one(conn, stmt)
+
+
+async def delete_order(conn: AsyncConnection, order_id: int) -> bool:
+    stmt = orders.delete().where(orders.c.id == order_id).returning(orders.c.id)
+    return (await conn.execute(stmt)).first() is not None
+
+
+async def create_vehicle(conn: AsyncConnection, vehicle: dict) -> Optional[dict]:
+    """Insert a vehicle; ``None`` if the id is taken."""
+    stmt = (
+        insert(vehicles).values(**vehicle).on_conflict_do_nothing(index_elements=[vehicles.c.id]).returning(*VEHICLE_COLUMNS)
+    )
+    return await _one(conn, stmt)
+
+
+async def update_vehicle(conn: AsyncConnection, vehicle_id: int, vehicle: dict) -> Optional[dict]:
+    """Overwrite a vehicle, its position stamped as received now; ``None`` if it does not exist."""
+    values = {**vehicle, "position_at": datetime.now(timezone.utc)}
+    stmt = vehicles.update().where(vehicles.c.id == vehicle_id).values(**values).returning(*VEHICLE_COLUMNS)
+    return await _one(conn, stmt)
+
+
+async def move_vehicle(
+    conn: AsyncConnection, vehicle_id: int, lat: float, lng: float, status: Optional[str] = None
+) -> Optional[dict]:
+    """Set a vehicle's position, and its status when given; ``None`` if it does not exist.
+
+    The position is stamped as received now, so buffered telemetry received
+    earlier and still being written cannot overwrite it.
+    """
+    values = {"current_lat": lat, "current_lng": lng, "position_at": datetime.now(timezone.utc)}
+    if status is not None:
+        values["status"] = status
+    stmt = vehicles.update().where(vehicles.c.id == vehicle_id).values(**values).returning(*VEHICLE_COLUMNS)
+    return await _one(conn, stmt)
+
+
+async def delete_vehicle(conn: AsyncConnection, vehicle_id: int) -> bool:
+    stmt = vehicles.delete().where(vehicles.c.id == vehicle_id).returning(vehicles.c.id)
+    return (await conn.execute(stmt)).first() is not None
+
+
+async def upsert_vehicles(conn: AsyncConnection, rows: Iterable[dict]) -> List[Tuple[dict, bool]]:
+    """Insert or overwrite many vehicles; returns each stored row and whether it was new.
+
+    A vehicle given more than once is written as its last occurrence.
+    Positions are stamped as received now, like ``move_vehicle``.
+    """
+    now = datetime.now(timezone.utc)
+    rows = list({row["id"]: {**row, "position_at": now} for row in rows}.values())
+    if not rows:
+        return []
+    stmt = insert(vehicles).values(rows)
+    columns = [c.name for c in VEHICLE_COLUMNS if c.name != "id"] + ["position_at"]
+    stmt = stmt.on_conflict_do_update(index_elements=[vehicles.c.id], set_={c: stmt.excluded[c] for c in columns})
+    # xmax is only set on rows the statement updated
+    stmt = stmt.returning(*VEHICLE_COLUMNS, literal_column("xmax = 0").label("inserted"))
+    result = []
+    for row in await conn.execute(stmt):
+        vehicle = dict(row._mapping)
+        inserted = vehicle.pop("inserted")
+        result.append((vehicle, inserted))
+    return result
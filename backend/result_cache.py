@@ -0,0 +1,156 @@
+"""Recent results of identical route optimization requests, and the solves still running for them."""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .jobs import SUCCEEDED, Job, job_manager
+from .metrics import Counter
+from .schemas import Location, OptimizeRouteRequest, OptimizedRoute, OptimizedRouteResponse
+from .settings import settings
+
+OPTIMIZATION_CACHE_HEADER = "X-Optimization-Cache"
+# Values of the header: served from the cache, shared with an identical
+# request's solve that was already running, or solved for this request
+HIT = "hit"
+JOINED = "joined"
+MISS = "miss"
+
+OPTIMIZER_RESULT_CACHE = Counter(
+    "ecoroute_optimizer_result_cache_total", "Route optimization requests by result cache outcome.", ("result",)
+)
+
+
+def _point(location: Optional[Location], precision: int):
+    if location is None:
+        return None
+    return [round(location.latitude, precision), round(location.longitude, precision)]
+
+
+def request_key(request: OptimizeRouteRequest, kind: str) -> str:
+    """Hash of everything that determines the solve of ``request``.
+
+    Orders and vehicles are sorted by id and coordinates quantized like the
+    travel-time cache does, so reordered or re-serialized copies of a
+    request share a key. The travel-time model and road network versions
+    are included, so a new model or graph never serves plans costed with
+    the old one.
+    """
+    # Loads the travel-time model on the first optimization request, not at startup.
+    from .matrix_cache import DEFAULT_PRECISION as p
+    from .road_network import network_version
+    from .travel_time import model_version
+
+    canonical = {
+        "kind": kind,
+        "model": model_version(),
+        "road_network": network_version(),
+        "orders": sorted([o.id, _point(o.pickup_location, p), _point(o.dropoff_location, p)] for o in request.orders),
+        "vehicles": sorted([v.id, _point(v.start_location, p), _point(v.end_location, p)] for v in request.vehicles),
+        "params": request.model_dump(exclude={"orders", "vehicles"}),
+    }
+    return hashlib.sha256(json.dumps(canonical, separators=(",", ":")).encode()).hexdigest()
+
+
+def for_request(response: OptimizedRouteResponse, request: OptimizeRouteRequest) -> OptimizedRouteResponse:
+    """A result of an identical request, with routes in this request's vehicle order and its exact stop locations."""
+    orders = {o.id: o for o in request.orders}
+    routes = {route.vehicle_id: route for route in response.optimized_routes}
+    optimized_routes = []
+    for vehicle in request.vehicles:
+        route = routes.get(vehicle.id)
+        if route is None:
+            continue
+        stops = [
+            stop.model_copy(
+                update={
+                    "location": orders[stop.order_id].pickup_location
+                    if stop.type == "pickup"
+                    else orders[stop.order_id].dropoff_location
+                }
+            )
+            for stop in route.stops
+        ]
+        optimized_routes.append(OptimizedRoute(**{**route.model_dump(exclude={"stops"}), "stops": stops}))
+    return response.model_copy(update={"optimized_routes": optimized_routes})
+
+
+class _InFlight:
+    def __init__(self, job: Job):
+        self.job = job
+        self.waiters = 0
+
+
+class OptimizationResultCache:
+    """Serves identical requests from at most ``max_entries`` results for ``ttl_s`` seconds.
+
+    Identical requests arriving while one is being solved wait for that
+    solve instead of queueing their own. The shared job is cancelled only
+    when every request waiting for it has gone away. Only complete solves
+    are kept: failed, cancelled and early-stopped ones are not.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._results: "OrderedDict[str, Tuple[float, OptimizedRouteResponse]]" = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+
+    def _get(self, key: str) -> Optional[OptimizedRouteResponse]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key: str, response: OptimizedRouteResponse):
+        if self.max_entries <= 0 or self.ttl_s <= 0:
+            return
+        self._results[key] = (time.monotonic() + self.ttl_s, response)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def get_or_solve(
+        self, key: str, submit: Callable[[], Job], result_of: Callable[[Job], OptimizedRouteResponse]
+    ) -> Tuple[OptimizedRouteResponse, str]:
+        """The response for ``key`` and where it came from (``HIT``, ``JOINED`` or ``MISS``).
+
+        ``submit`` starts a solve when none is cached or running;
+        ``result_of`` turns the finished job into its response or an error.
+        """
+        cached = self._get(key)
+        if cached is not None:
+            OPTIMIZER_RESULT_CACHE.inc(result=HIT)
+            return cached, HIT
+        flight = self._in_flight.get(key)
+        source = JOINED
+        if flight is None:
+            flight = self._in_flight[key] = _InFlight(submit())
+            source = MISS
+        OPTIMIZER_RESULT_CACHE.inc(result=source)
+        flight.waiters += 1
+        try:
+            await job_manager.wait(flight.job)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0:
+                self._in_flight.pop(key, None)
+                job_manager.cancel(flight.job)
+            raise
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+            if flight.job.status == SUCCEEDED and not flight.job.stopped_early:
+                self._put(key, flight.job.result)
+        return result_of(flight.job), source
+
+
+result_cache = OptimizationResultCache(
+    max_entries=settings.optimizer_result_cache_entries,
+    ttl_s=settings.optimizer_result_cache_ttl_s,
+)
@@ -0,0 +1,432 @@
+"""Road-network distances from a local graph file, with contraction hierarchies for many-to-many queries.
+
+A graph is compiled once from an edge list into a directory of ``.npy``
+arrays, then memory-mapped by every process that routes on it. Compiling
+ranks the nodes and adds shortcut edges, so that a shortest path always
+climbs in rank and then descends. A matrix then runs one small upward search
+forward from every source and one backward from every target. The
+distance of a pair is the best sum of the two searches over the nodes they
+share. Points further than ``settings.road_snap_m`` from any graph node,
+and pairs the graph does not connect, get no road distance. The matrix
+builders use great-circle distance for those.
+
+Compile an edge list, run from the repository root::
+
+    python -m backend.road_network edges.csv graph_dir
+
+The CSV has a header with ``from_lat,from_lng,to_lat,to_lng`` and,
+optionally, ``length_m`` (great-circle length when missing) and
+``oneway`` (1 if the edge is only driven from ``from`` to ``to``). Nodes
+are identified by their exact coordinates.
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import phase
+from .settings import settings
+from .spatial import _grid, haversine, plane_km
+
+GRAPH_PATH = settings.road_graph_path
+# Arrays of a compiled graph, one ``<name>.npy`` file each. ``up_*`` are the
+# edges from every node to higher-ranked ones, ``down_*`` those into every
+# node from higher-ranked ones, reversed, in compressed sparse row layout.
+ARRAYS = (
+    "node_lat",
+    "node_lng",
+    "up_offsets",
+    "up_targets",
+    "up_length_m",
+    "down_offsets",
+    "down_targets",
+    "down_length_m",
+)
+# Nodes settled by one witness search while compiling. Lower is faster and
+# only adds shortcuts a longer search would have found unnecessary.
+WITNESS_SETTLE_LIMIT = 64
+# Distinct snapped nodes of a query below which searching in worker
+# processes costs more than it saves.
+PARALLEL_MIN_NODES = 256
+# Upward search spaces kept per network; the least recently used go first. Dispatch
+# scores every order against the same route stops, so their searches repeat.
+SPACE_CACHE_SIZE = 16384
+
+
+def read_edge_list(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Nodes and directed edges of an edge list: ``(lat, lng, src, dst, length_m)``."""
+    ids: Dict[Tuple[float, float], int] = {}
+    src, dst, length = [], [], []
+
+    def node(lat: str, lng: str) -> int:
+        return ids.setdefault((float(lat), float(lng)), len(ids))
+
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            a = node(row["from_lat"], row["from_lng"])
+            b = node(row["to_lat"], row["to_lng"])
+            if a == b:
+                continue
+            if row.get("length_m"):
+                meters = float(row["length_m"])
+            else:
+                ends = (row["from_lat"], row["from_lng"], row["to_lat"], row["to_lng"])
+                meters = haversine(*map(float, ends)) * 1000
+            src.append(a)
+            dst.append(b)
+            length.append(meters)
+            if row.get("oneway", "").strip() not in ("1", "true", "yes"):
+                src.append(b)
+                dst.append(a)
+                length.append(meters)
+    coords = np.array(list(ids), dtype=float).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1], np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64), np.array(length)
+
+
+def _witness_distances(out_adj: List[Dict[int, float]], source: int, skip: int, max_m: float) -> Dict[int, float]:
+    dist = {source: 0.0}
+    settled = set()
+    heap = [(0.0, source)]
+    while heap and len(settled) < WITNESS_SETTLE_LIMIT:
+        d, v = heapq.heappop(heap)
+        if v in settled:
+            continue
+        if d > max_m:
+            break
+        settled.add(v)
+        for w, length in out_adj[v].items():
+            if w == skip:
+                continue
+            nd = d + length
+            if nd < dist.get(w, math.inf):
+                dist[w] = nd
+                heapq.heappush(heap, (nd, w))
+    return dist
+
+
+def _shortcuts(out_adj, in_adj, v: int) -> List[Tuple[int, int, float]]:
+    """Edges ``(u, w, length)`` needed to keep shortest paths through ``v`` once it is removed."""
+    shortcuts = []
+    for u, to_v in in_adj[v].items():
+        via = {w: to_v + from_v for w, from_v in out_adj[v].items() if w != u}
+        if not via:
+            continue
+        witness = _witness_distances(out_adj, u, v, max(via.values()))
+        shortcuts.extend((u, w, length) for w, length in via.items() if witness.get(w, math.inf) > length)
+    return shortcuts
+
+
+def contract(n: int, src: np.ndarray, dst: np.ndarray, length_m: np.ndarray):
+    """Contraction hierarchy of a directed graph: upward and reversed downward edges by node.
+
+    Nodes are contracted in order of edge difference plus contracted
+    neighbours, re-evaluated lazily when they reach the front of the queue.
+    """
+    out_adj: List[Dict[int, float]] = [{} for _ in range(n)]
+    in_adj: List[Dict[int, float]] = [{} for _ in range(n)]
+    for a, b, length in zip(src.tolist(), dst.tolist(), length_m.tolist()):
+        if length < out_adj[a].get(b, math.inf):
+            out_adj[a][b] = length
+            in_adj[b][a] = length
+
+    contracted_neighbours = [0] * n
+
+    def priority(v: int):
+        shortcuts = _shortcuts(out_adj, in_adj, v)
+        return len(shortcuts) - len(in_adj[v]) - len(out_adj[v]) + contracted_neighbours[v], shortcuts
+
+    heap = [(priority(v)[0], v) for v in range(n)]
+    heapq.heapify(heap)
+    up: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+    down: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+    while heap:
+        _, v = heapq.heappop(heap)
+        value, shortcuts = priority(v)
+        if heap and value > heap[0][0]:
+            heapq.heappush(heap, (value, v))
+            continue
+        # Every node still in the graph is ranked above v.
+        up[v] = list(out_adj[v].items())
+        down[v] = list(in_adj[v].items())
+        for w in out_adj[v]:
+            del in_adj[w][v]
+            contracted_neighbours[w] += 1
+        for u in in_adj[v]:
+            del out_adj[u][v]
+            contracted_neighbours[u] += 1
+        out_adj[v], in_adj[v] = {}, {}
+        for u, w, length in shortcuts:
+            if length < out_adj[u].get(w, math.inf):
+                out_adj[u][w] = length
+                in_adj[w][u] = length
+    return _csr(up), _csr(down)
+
+
+def _csr(adjacency: List[List[Tuple[int, float]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(adjacency) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(edges) for edges in adjacency])
+    targets = np.fromiter((w for edges in adjacency for w, _ in edges), dtype=np.int64, count=int(offsets[-1]))
+    lengths = np.fromiter((length for edges in adjacency for _, length in edges), dtype=float, count=int(offsets[-1]))
+    return offsets, targets, lengths
+
+
+def compile_graph(edge_list: str, out_dir: str) -> str:
+    """Compile ``edge_list`` into ``out_dir``; returns the graph version (hash of the edge list)."""
+    with open(edge_list, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+    lat, lng, src, dst, length_m = read_edge_list(edge_list)
+    up, down = contract(lat.size, src, dst, length_m)
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = (lat, lng) + up + down
+    for name, array in zip(ARRAYS, arrays):
+        np.save(os.path.join(out_dir, f"{name}.npy"), array)
+    with open(os.path.join(out_dir, "graph.json"), "w") as f:
+        meta = {"version": version, "nodes": int(lat.size), "edges": int(src.size)}
+        json.dump(dict(meta, ch_edges=int(up[1].size + down[1].size)), f)
+    return version
+
+
+def _upward(up, down, source: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Nodes settled climbing the ``up`` edges from ``source`` and their distances in meters.
+
+    A node that a higher-ranked settled node reaches more cheaply through
+    its ``down`` edges is stalled: its distance is not a shortest one, so it
+    is left out and not expanded.
+    """
+    up_offsets, up_targets, up_lengths = up
+    down_offsets, down_targets, down_lengths = down
+    dist = {source: 0.0}
+    settled: Dict[int, float] = {}
+    stalled = set()
+    heap = [(0.0, source)]
+    while heap:
+        d, v = heapq.heappop(heap)
+        if v in settled or v in stalled:
+            continue
+        start, stop = int(down_offsets[v]), int(down_offsets[v + 1])
+        above = zip(down_targets[start:stop].tolist(), down_lengths[start:stop].tolist())
+        if any(dist.get(u, math.inf) + length < d for u, length in above):
+            stalled.add(v)
+            continue
+        settled[v] = d
+        start, stop = int(up_offsets[v]), int(up_offsets[v + 1])
+        for w, length in zip(up_targets[start:stop].tolist(), up_lengths[start:stop].tolist()):
+            nd = d + length
+            if nd < dist.get(w, math.inf):
+                dist[w] = nd
+                heapq.heappush(heap, (nd, w))
+    return np.fromiter(settled.keys(), dtype=np.int64, count=len(settled)), np.fromiter(
+        settled.values(), dtype=float, count=len(settled)
+    )
+
+
+class RoadNetwork:
+    """A compiled graph, memory-mapped from ``path``."""
+
+    def __init__(self, path: str, snap_m: float):
+        self.path = path
+        for name in ARRAYS:
+            # Plain ndarray views of the mapping; slicing a memmap object is much slower.
+            setattr(self, name, np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")))
+        self.version = _read_version(path)
+        self.snap_km = snap_m / 1000
+        self._ref_lat = float(np.mean(self.node_lat)) if self.node_lat.size else 0.0
+        self._points = plane_km(np.asarray(self.node_lat), np.asarray(self.node_lng), self._ref_lat)
+        self._cells = _grid(self._points, self.snap_km) if self.node_lat.size else {}
+        self._spaces: "OrderedDict[Tuple[int, bool], Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._spaces_lock = threading.Lock()
+
+    def snap(self, lat: np.ndarray, lng: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest node of every point within the snap radius (-1 if none) and its distance in meters."""
+        points = plane_km(np.asarray(lat, dtype=float), np.asarray(lng, dtype=float), self._ref_lat)
+        nodes = np.full(len(points), -1, dtype=np.int64)
+        offset_m = np.zeros(len(points))
+        for i, (cx, cy) in enumerate(np.floor(points / self.snap_km).astype(np.int64).tolist()):
+            cells = [(cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+            parts = [self._cells[cell] for cell in cells if cell in self._cells]
+            if not parts:
+                continue
+            candidates = np.concatenate(parts)
+            d2 = ((self._points[candidates] - points[i]) ** 2).sum(axis=1)
+            best = int(np.argmin(d2))
+            if d2[best] <= self.snap_km**2:
+                nodes[i] = candidates[best]
+                offset_m[i] = math.sqrt(d2[best]) * 1000
+        return nodes, offset_m
+
+    def upward_spaces(self, nodes, backward: bool = False) -> List[Tuple[np.ndarray, np.ndarray]]:
+        up = (self.up_offsets, self.up_targets, self.up_length_m)
+        down = (self.down_offsets, self.down_targets, self.down_length_m)
+        if backward:
+            up, down = down, up
+        spaces = []
+        for node in nodes:
+            key = (int(node), backward)
+            with self._spaces_lock:
+                space = self._spaces.get(key)
+                if space is not None:
+                    self._spaces.move_to_end(key)
+            if space is None:
+                space = _upward(up, down, key[0])
+                with self._spaces_lock:
+                    self._spaces[key] = space
+                    if len(self._spaces) > SPACE_CACHE_SIZE:
+                        self._spaces.popitem(last=False)
+            spaces.append(space)
+        return spaces
+
+    def node_matrix_m(self, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """Shortest path lengths in meters between graph nodes, ``inf`` where there is no path."""
+        parallel = _workers() > 1 and len(sources) + len(targets) >= PARALLEL_MIN_NODES
+        if parallel:
+            backward = _in_workers(self, "upward_spaces", targets, True)
+        else:
+            backward = self.upward_spaces(targets, backward=True)
+        # Bucket every node the backward searches met with (target, distance), grouped by node.
+        bucket_node = np.concatenate([nodes for nodes, _ in backward]) if backward else np.empty(0, dtype=np.int64)
+        bucket_target = np.repeat(np.arange(len(targets)), [nodes.size for nodes, _ in backward])
+        bucket_m = np.concatenate([dist for _, dist in backward]) if backward else np.empty(0)
+        order = np.argsort(bucket_node, kind="stable")
+        bucket_node, bucket_target, bucket_m = bucket_node[order], bucket_target[order], bucket_m[order]
+        buckets = (np.unique(bucket_node), bucket_node, bucket_target, bucket_m, len(targets))
+        if parallel:
+            return np.vstack(_in_workers(self, "join_rows", sources, buckets))
+        return self.join_rows(sources, buckets)
+
+    def join_rows(self, sources, buckets) -> np.ndarray:
+        """Rows of the node matrix: each source's forward search met with the target buckets."""
+        keys, bucket_node, bucket_target, bucket_m, n_targets = buckets
+        starts = np.searchsorted(bucket_node, keys)
+        stops = np.searchsorted(bucket_node, keys, side="right")
+        rows = np.full((len(sources), n_targets), np.inf)
+        for row, (nodes, dist) in zip(rows, self.upward_spaces(sources)):
+            pos = np.minimum(np.searchsorted(keys, nodes), max(keys.size - 1, 0))
+            met = keys[pos] == nodes if keys.size else np.zeros(nodes.size, dtype=bool)
+            begin, count = starts[pos[met]], stops[pos[met]] - starts[pos[met]]
+            index = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count) + np.repeat(begin, count)
+            np.minimum.at(row, bucket_target[index], np.repeat(dist[met], count) + bucket_m[index])
+        return rows
+
+    def matrix_km(self, src_lat, src_lng, dst_lat, dst_lng) -> np.ndarray:
+        """Road distance in km between every source and target point, NaN where there is none.
+
+        The straight legs from each point to the node it snaps to are included.
+        """
+        src_nodes, src_offset = self.snap(src_lat, src_lng)
+        dst_nodes, dst_offset = self.snap(dst_lat, dst_lng)
+        distance = np.full((src_nodes.size, dst_nodes.size), np.nan)
+        rows, cols = src_nodes >= 0, dst_nodes >= 0
+        if not rows.any() or not cols.any():
+            return distance
+        sources, src_index = np.unique(src_nodes[rows], return_inverse=True)
+        targets, dst_index = np.unique(dst_nodes[cols], return_inverse=True)
+        with phase("road_matrix"):
+            node_m = self.node_matrix_m(sources, targets)
+        meters = node_m[np.ix_(src_index, dst_index)] + src_offset[rows, None] + dst_offset[None, cols]
+        distance[np.ix_(rows, cols)] = np.where(np.isfinite(meters), meters / 1000, np.nan)
+        return distance
+
+    def pairs_km(self, lat1, lng1, lat2, lng2) -> np.ndarray:
+        """``matrix_km`` of each ``(lat1[i], lng1[i]) -> (lat2[i], lng2[i])`` pair."""
+        src, src_index = np.unique(np.column_stack([lat1, lng1]), axis=0, return_inverse=True)
+        dst, dst_index = np.unique(np.column_stack([lat2, lng2]), axis=0, return_inverse=True)
+        return self.matrix_km(src[:, 0], src[:, 1], dst[:, 0], dst[:, 1])[src_index.ravel(), dst_index.ravel()]
+
+
+_lock = threading.Lock()
+_network: Optional[RoadNetwork] = None
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_path: Optional[str] = None
+
+
+def current_network() -> Optional[RoadNetwork]:
+    """The configured road network, loaded on first use; None when none is configured."""
+    global _network
+    if not GRAPH_PATH:
+        return None
+    if _network is None or _network.path != GRAPH_PATH:
+        with _lock:
+            if _network is None or _network.path != GRAPH_PATH:
+                _network = RoadNetwork(GRAPH_PATH, settings.road_snap_m)
+    return _network
+
+
+def network_version() -> str:
+    """Version of the configured road network, empty without one; caches of distances key on it.
+
+    Read from the graph's metadata, so processes that never route do not load the graph.
+    """
+    if not GRAPH_PATH:
+        return ""
+    if _network is not None and _network.path == GRAPH_PATH:
+        return _network.version
+    return _read_version(GRAPH_PATH)
+
+
+def _read_version(path: str) -> str:
+    with open(os.path.join(path, "graph.json")) as f:
+        return json.load(f)["version"]
+
+
+def _workers() -> int:
+    return max(1, settings.road_matrix_workers)
+
+
+def _init_worker(path: str, snap_m: float):
+    global GRAPH_PATH, _network
+    GRAPH_PATH = path
+    _network = RoadNetwork(path, snap_m)
+
+
+def _call(method: str, nodes, *args):
+    return getattr(current_network(), method)(nodes, *args)
+
+
+def _in_workers(network: RoadNetwork, method: str, nodes: np.ndarray, *args) -> list:
+    """``network.<method>(chunk, *args)`` for chunks of ``nodes`` across the worker processes, in order."""
+    global _pool, _pool_path
+    with _lock:
+        if _pool is None or _pool_path != network.path:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            ctx = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(
+                max_workers=_workers(),
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(network.path, network.snap_km * 1000),
+            )
+            _pool_path = network.path
+        pool = _pool
+    chunks = np.array_split(nodes, min(len(nodes), 4 * _workers()) or 1)
+    results = []
+    for part in pool.map(_call, [method] * len(chunks), chunks, *([arg] * len(chunks) for arg in args)):
+        if isinstance(part, list):
+            results.extend(part)
+        else:
+            results.append(part)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("edge_list")
+    parser.add_argument("out_dir")
+    args = parser.parse_args(argv)
+    version = compile_graph(args.edge_list, args.out_dir)
+    with open(os.path.join(args.out_dir, "graph.json")) as f:
+        print(f"compiled graph {version}: {json.load(f)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import importlib
+
+from fastapi import APIRouter, HTTPException
+from ..schemas import (
+    DispatchPlan,
+    DispatchPlanCreate,
+    InsertionRequest,
+    InsertionResult,
+    OrderInOptimization,
+)
+from ..jobs import SUCCEEDED, job_manager
+
+router = APIRouter()
+
+
+# The handlers are plain functions, so FastAPI runs them in its threadpool:
+# scoring an order is CPU-bound, and so is the first import below.
+
+
+def _dispatch():
+    # Imported on first use: it loads the travel-time model and OR-Tools.
+    return importlib.import_module("..dispatch", __package__)
+
+
+@router.post("/dispatch/insert", response_model=InsertionResult)
+def insert_order(request: InsertionRequest):
+    """Place one new order into the given routes at the cheapest feasible position."""
+    return _dispatch().RoutePlan(request.routes, request.vehicles).evaluate(request.order)
+
+
+@router.post("/dispatch/plans", response_model=DispatchPlan, status_code=201)
+def create_dispatch_plan(request: DispatchPlanCreate):
+    """Keep a plan on the server so repeated insertions skip re-sending and re-indexing the routes."""
+    dispatch_plans = _dispatch().dispatch_plans
+    if request.job_id is not None:
+        job = job_manager.get(request.job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Optimization job not found.")
+        if job.status != SUCCEEDED:
+            raise HTTPException(status_code=409, detail="Optimization job has not succeeded.")
+        plan_id = dispatch_plans.create(
+            job.result.optimized_routes, job.request.vehicles, job.result.unassigned_orders
+        )
+    elif request.routes is not None and request.vehicles is not None:
+        plan_id = dispatch_plans.create(request.routes, request.vehicles)
+    else:
+        raise HTTPException(status_code=422, detail="Provide either job_id or routes and vehicles.")
+    return dispatch_plans.describe(plan_id)
+
+
+def _get_plan(plan_id: str):
+    entry = _dispatch().dispatch_plans.get(plan_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Dispatch plan not found.")
+    return entry
+
+
+@router.get("/dispatch/plans/{plan_id}", response_model=DispatchPlan)
+def get_dispatch_plan(plan_id: str):
+    _get_plan(plan_id)
+    return _dispatch().dispatch_plans.describe(plan_id)
+
+
+@router.post("/dispatch/plans/{plan_id}/orders", response_model=InsertionResult)
+def dispatch_order(plan_id: str, order: OrderInOptimization, apply: bool = True):
+    """Insert an order into a stored plan; with ``apply=false`` only report where it would go."""
+    plan, unassigned = _get_plan(plan_id)
+    with plan.lock:
+        result = plan.evaluate(order)
+        if apply:
+            if result.vehicle_id is None:
+                unassigned.append(order.id)
+            else:
+                plan.apply(result)
+    return result
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_read_session
+from ..history import simplify_track
+from ..schemas import TrackPoint, VehicleTrack
+
+# Vehicle paths from the position history
+router = APIRouter()
+
+MAX_TRACK_SPAN = timedelta(days=31)
+# Douglas-Peucker runs on at most this many evenly spaced positions per point of the budget
+PRESAMPLE_PER_POINT = 50
+
+# Counting the positions of a range stops here, so a dense month costs a bounded index scan.
+MAX_COUNTED_POSITIONS = 100000
+
+# The first position of every ``bucket_s`` slice of the range. Each step seeks the index for the first
+# position at or after the next slice boundary, so the query reads one row per non-empty slice rather
+# than every position in the range.
+_TRACK = text(
+    """
+    WITH RECURSIVE track AS (
+        (
+            SELECT recorded_at, lat, lng, status
+            FROM vehicle_positions
+            WHERE vehicle_id = :vehicle_id AND recorded_at >= :start AND recorded_at < :end
+            ORDER BY recorded_at
+            LIMIT 1
+        )
+        UNION ALL
+        SELECT next.recorded_at, next.lat, next.lng, next.status
+        FROM track
+        CROSS JOIN LATERAL (
+            SELECT recorded_at, lat, lng, status
+            FROM vehicle_positions
+            WHERE vehicle_id = :vehicle_id
+              AND recorded_at >= CAST(:start AS timestamptz) + interval '1 second' * CAST(:bucket_s AS float8) * (
+                  floor(
+                      extract(epoch FROM track.recorded_at - CAST(:start AS timestamptz)) / CAST(:bucket_s AS float8)
+                  ) + 1
+              )
+              AND recorded_at < :end
+            ORDER BY recorded_at
+            LIMIT 1
+        ) AS next
+    )
+    SELECT recorded_at, lat, lng, status FROM track
+    """
+)
+
+_COUNT = text(
+    """
+    SELECT count(*) FROM (
+        SELECT 1
+        FROM vehicle_positions
+        WHERE vehicle_id = :vehicle_id AND recorded_at >= :start AND recorded_at < :end
+        LIMIT :limit
+    ) AS counted
+    """
+)
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+@router.get("/vehicles/{vehicle_id}/track", response_model=VehicleTrack)
+async def vehicle_track(
+    vehicle_id: int,
+    start: Optional[datetime] = Query(None, description="Defaults to one hour before end; UTC without an offset"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    max_points: int = Query(500, ge=2, le=10000),
+    method: Literal["douglas_peucker", "interval"] = "douglas_peucker",
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Positions of a vehicle in ``[start, end)``, downsampled to at most ``max_points``.
+
+    ``interval`` keeps the first position of each of ``max_points`` equal
+    time slices. ``douglas_peucker`` keeps the positions that best preserve
+    the shape of the path, so turns survive and straight stretches thin out.
+    """
+    end = _utc(end) if end else datetime.now(timezone.utc)
+    start = _utc(start) if start else end - timedelta(hours=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start.")
+    if end - start > MAX_TRACK_SPAN:
+        raise HTTPException(status_code=400, detail=f"The range may span at most {MAX_TRACK_SPAN.days} days.")
+
+    slices = max_points if method == "interval" else max_points * PRESAMPLE_PER_POINT
+    params = {
+        "vehicle_id": vehicle_id,
+        "start": start,
+        "end": end,
+        "bucket_s": (end - start).total_seconds() / slices,
+    }
+    rows = (await session.execute(_TRACK, params)).all()
+    total = 0
+    if rows:
+        count_params = {"vehicle_id": vehicle_id, "start": start, "end": end, "limit": MAX_COUNTED_POSITIONS}
+        total = (await session.execute(_COUNT, count_params)).scalar_one()
+    if method == "douglas_peucker" and len(rows) > max_points:
+        keep = simplify_track(np.array([r.lat for r in rows]), np.array([r.lng for r in rows]), max_points)
+        rows = [rows[i] for i in keep]
+    points = [TrackPoint(recorded_at=r.recorded_at, lat=r.lat, lng=r.lng, status=r.status) for r in rows]
+    return VehicleTrack(vehicle_id=vehicle_id, start=start, end=end, total_points=total, points=points)
@@ -0,0 +1,112 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_read_session
+from ..live import OPEN_ORDER_STATUS, live_state
+from ..schemas import NearbyOrder, NearbyVehicle, OrderRead, VehicleRead
+
+# Proximity queries answered from the in-memory live index, without touching the database.
+# With several API workers the index is disabled and the same queries run on PostGIS.
+router = APIRouter()
+
+_POINT = "ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography"
+# table -> (columns, indexed geography column, condition every row must meet)
+_TABLES = {
+    "vehicles": (", ".join(VehicleRead.model_fields), "current_geog", "current_geog IS NOT NULL"),
+    "orders": (
+        ", ".join(OrderRead.model_fields),
+        "pickup_geog",
+        f"pickup_geog IS NOT NULL AND status = '{OPEN_ORDER_STATUS}'",
+    ),
+}
+
+
+def _status_filter(status: Optional[str]):
+    return None if status is None else (lambda item: item["status"] == status)
+
+
+async def _postgis(
+    session: AsyncSession,
+    table: str,
+    lat: float,
+    lng: float,
+    radius_km: Optional[float] = None,
+    k: Optional[int] = None,
+    status: Optional[str] = None,
+) -> List[dict]:
+    """Rows nearest first, as the live index returns them, from the GiST index of the geography column."""
+    columns, geog, condition = _TABLES[table]
+    sql = f"SELECT {columns}, ST_Distance({geog}, {_POINT}) / 1000 AS distance_km FROM {table} WHERE {condition}"
+    params = {"lat": lat, "lng": lng}
+    if radius_km is not None:
+        sql += f" AND ST_DWithin({geog}, {_POINT}, :radius_m)"
+        params["radius_m"] = radius_km * 1000
+    if status is not None:
+        sql += " AND status = :status"
+        params["status"] = status
+    sql += f" ORDER BY {geog} <-> {_POINT}"
+    if k is not None:
+        sql += " LIMIT :k"
+        params["k"] = k
+    return [dict(row._mapping) for row in await session.execute(text(sql), params)]
+
+
+@router.get("/vehicles/nearest", response_model=List[NearbyVehicle])
+async def nearest_vehicles(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=100),
+    status: Optional[str] = Query("idle", description="Only vehicles with this status; empty for any"),
+    max_km: Optional[float] = Query(None, gt=0),
+    session: AsyncSession = Depends(get_read_session),
+):
+    if not live_state.enabled:
+        return await _postgis(session, "vehicles", lat, lng, max_km, k, status or None)
+    hits = live_state.vehicles.nearest(lat, lng, k, max_km or float("inf"), _status_filter(status or None))
+    return [NearbyVehicle(**vehicle, distance_km=d) for d, _, vehicle in hits]
+
+
+@router.get("/vehicles/within", response_model=List[NearbyVehicle])
+async def vehicles_within(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=500),
+    status: Optional[str] = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    if not live_state.enabled:
+        return await _postgis(session, "vehicles", lat, lng, radius_km, status=status)
+    hits = live_state.vehicles.within(lat, lng, radius_km, _status_filter(status))
+    return [NearbyVehicle(**vehicle, distance_km=d) for d, _, vehicle in hits]
+
+
+@router.get("/orders/nearest", response_model=List[NearbyOrder])
+async def nearest_orders(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=100),
+    max_km: Optional[float] = Query(None, gt=0),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Open orders whose pickup is closest to the point."""
+    if not live_state.enabled:
+        return await _postgis(session, "orders", lat, lng, max_km, k)
+    hits = live_state.orders.nearest(lat, lng, k, max_km or float("inf"))
+    return [NearbyOrder(**order, distance_km=d) for d, _, order in hits]
+
+
+@router.get("/orders/within", response_model=List[NearbyOrder])
+async def orders_within(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=500),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Open orders with a pickup within ``radius_km`` of the point."""
+    if not live_state.enabled:
+        return await _postgis(session, "orders", lat, lng, radius_km)
+    hits = live_state.orders.within(lat, lng, radius_km)
+    return [NearbyOrder(**order, distance_km=d) for d, _, order in hits]
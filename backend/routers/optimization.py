@@ -1,161 +1,131 @@
-from fastapi import APIRouter
-from typing import List
-import numpy as np
-import lightgbm as lgb
+import asyncio
+import importlib
+import time
+from typing import Union
+
+from fastapi import APIRouter, HTTPException, Response
 from ..schemas import (
+    IncrementalOptimizeRequest,
+    IncrementalOptimizeResponse,
     OptimizeRouteRequest,
     OptimizedRouteResponse,
-    OptimizedRoute,
-    Stop,
-    VehicleInOptimization,
-    OrderInOptimization,
+    OptimizationJob,
+    RouteProgress,
 )
-from ortools.constraint_solver import pywrapcp, routing_enums_pb2
-import math
+from ..jobs import CANCELLED, FAILED, SUCCEEDED, Job, QueueFullError, job_manager, use_decomposition
+from ..result_cache import MISS, OPTIMIZATION_CACHE_HEADER, for_request, request_key, result_cache
+from ..sockets import sio
 
 router = APIRouter()
 
-# Load pre-trained LightGBM model for travel time prediction
-_travel_time_model = lgb.Booster(model_file="backend/lightgbm_travel_time.txt")
 
+async def _notify_job_finished(job: Job):
+    await sio.emit("optimization_job_finished", job.info().model_dump(mode="json"))
+
+
+async def _notify_route_progress(job: Job, progress: RouteProgress):
+    await sio.emit("route_progress", progress.model_dump(mode="json"))
+
+job_manager.add_listener(_notify_job_finished)
+job_manager.add_progress_listener(_notify_route_progress)
+
+
+async def warm_up():
+    """Load ahead of time what the first optimization and dispatch requests would."""
+    start = time.perf_counter()
+    # The dispatch module pulls in the travel-time model and OR-Tools.
+    await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, "..dispatch", __package__)
+    workers = await job_manager.warm_up()
+    print(f"optimizer warmed up in {time.perf_counter() - start:.2f}s with {workers} worker processes")
+
+
+def _submit(request, kind: str = "routes") -> Job:
+    try:
+        return job_manager.submit(request, kind)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Optimization queue is full.", headers={"Retry-After": "5"})
 
-def predict_travel_time_km(distance_km: float) -> float:
-    """Predict travel time in hours for a given distance in kilometers."""
-    pred = _travel_time_model.predict(np.array([[distance_km]], dtype=float))
-    return float(pred[0])
 
-def euclidean_distance(p1, p2):
-    """Return approximate great-circle distance in kilometers."""
-    lat1 = math.radians(p1.latitude)
-    lon1 = math.radians(p1.longitude)
-    lat2 = math.radians(p2.latitude)
-    lon2 = math.radians(p2.longitude)
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return 6371.0 * c
+def _routes_kind(request: OptimizeRouteRequest) -> str:
+    return "decomposed" if use_decomposition(request) else "routes"
+
+
+def _get_job(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Optimization job not found.")
+    return job
+
+
+def _job_result(job: Job):
+    if job.status == SUCCEEDED:
+        return job.result
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=f"Optimization failed: {job.error}")
+    if job.status == CANCELLED:
+        raise HTTPException(status_code=409, detail="Optimization job was cancelled.")
+    raise HTTPException(status_code=409, detail="Optimization job has not finished yet.")
+
+
+async def _wait_for_result(job: Job):
+    try:
+        await job_manager.wait(job)
+    except asyncio.CancelledError:
+        job_manager.cancel(job)
+        raise
+    return _job_result(job)
 
 
 @router.post("/optimize_routes", response_model=OptimizedRouteResponse)
-async def optimize_routes(request: OptimizeRouteRequest):
-    orders = request.orders
-    vehicles = request.vehicles
-
-    # Build list of all locations
-    locations = []
-    start_indices = []
-    end_indices = []
-    for v in vehicles:
-        start_indices.append(len(locations))
-        locations.append(v.start_location)
-        if v.end_location:
-            end_indices.append(len(locations))
-            locations.append(v.end_location)
-        else:
-            end_indices.append(start_indices[-1])
-
-    pickup_drop_indices = []
-    for o in orders:
-        pickup_index = len(locations)
-        locations.append(o.pickup_location)
-        dropoff_index = len(locations)
-        locations.append(o.dropoff_location)
-        pickup_drop_indices.append((pickup_index, dropoff_index, o.id))
-
-    # Distance and travel time matrices
-    size = len(locations)
-    distance_matrix = [[0] * size for _ in range(size)]
-    time_matrix = [[0] * size for _ in range(size)]
-    for i in range(size):
-        for j in range(size):
-            if i != j:
-                dist_km = euclidean_distance(locations[i], locations[j])
-                distance_matrix[i][j] = int(dist_km * 1000)
-                time_matrix[i][j] = int(predict_travel_time_km(dist_km) * 3600)
-
-    manager = pywrapcp.RoutingIndexManager(size, len(vehicles), start_indices, end_indices)
-    routing = pywrapcp.RoutingModel(manager)
-
-    def distance_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return distance_matrix[from_node][to_node]
-
-    def time_callback(from_index, to_index):
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return time_matrix[from_node][to_node]
-    
-
-    distance_cb = routing.RegisterTransitCallback(distance_callback)
-    time_cb = routing.RegisterTransitCallback(time_callback)
-
-    # Optimize primarily for predicted travel time
-    routing.SetArcCostEvaluatorOfAllVehicles(time_cb)
-
-    routing.AddDimension(distance_cb, 0, 1000000, True, "Distance")
-    routing.AddDimension(time_cb, 0, 100000000, True, "Time")
-    distance_dimension = routing.GetDimensionOrDie("Distance")
-    time_dimension = routing.GetDimensionOrDie("Time")
-
-    # Large penalty to discourage dropping an order
-    drop_penalty = 10**7
-
-    for pickup_idx, drop_idx, oid in pickup_drop_indices:
-        pickup_i = manager.NodeToIndex(pickup_idx)
-        drop_i = manager.NodeToIndex(drop_idx)
-        routing.AddPickupAndDelivery(pickup_i, drop_i)
-        routing.solver().Add(
-            routing.VehicleVar(pickup_i) == routing.VehicleVar(drop_i)
-        )
-        routing.solver().Add(
-            distance_dimension.CumulVar(pickup_i)
-            <= distance_dimension.CumulVar(drop_i)
-        )
-
-        routing.AddDisjunction([pickup_i, drop_i], drop_penalty)
-
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    search_parameters.time_limit.seconds = 10
-
-    solution = routing.SolveWithParameters(search_parameters)
-
-    optimized_routes: List[OptimizedRoute] = []
-    unassigned_orders: List[int] = []
-
-    if solution:
-        order_assigned = {o.id: False for o in orders}
-        for vehicle_id in range(len(vehicles)):
-            index = routing.Start(vehicle_id)
-            stops: List[Stop] = []
-            while not routing.IsEnd(index):
-                node = manager.IndexToNode(index)
-                next_index = solution.Value(routing.NextVar(index))
-                # Check if node corresponds to pickup or dropoff
-                for p_idx, d_idx, oid in pickup_drop_indices:
-                    if node == p_idx:
-                        stops.append(Stop(order_id=oid, location=locations[node], type="pickup"))
-                        order_assigned[oid] = True
-                    elif node == d_idx:
-                        stops.append(Stop(order_id=oid, location=locations[node], type="dropoff"))
-                index = next_index
-            total_dist = solution.Value(distance_dimension.CumulVar(routing.End(vehicle_id))) / 1000.0
-            total_time = solution.Value(time_dimension.CumulVar(routing.End(vehicle_id))) / 3600.0
-            optimized_routes.append(
-                OptimizedRoute(
-                    vehicle_id=vehicles[vehicle_id].id,
-                    stops=stops,
-                    total_distance=total_dist,
-                    total_time=total_time,
-                )
-            )
-        unassigned_orders = [oid for oid, assigned in order_assigned.items() if not assigned]
-    else:
-        unassigned_orders = [o.id for o in orders]
-
-    return OptimizedRouteResponse(
-        optimized_routes=optimized_routes,
-        unassigned_orders=unassigned_orders,
-    )
\ No newline at end of file
+async def optimize_routes(request: OptimizeRouteRequest, response: Response):
+    """Solve, or reuse the solve of an identical recent or running request (see the X-Optimization-Cache header)."""
+    kind = _routes_kind(request)
+    result, source = await result_cache.get_or_solve(
+        request_key(request, kind), lambda: _submit(request, kind), _job_result
+    )
+    response.headers[OPTIMIZATION_CACHE_HEADER] = source
+    return result if source == MISS else for_request(result, request)
+
+
+@router.post("/optimize_routes/incremental", response_model=IncrementalOptimizeResponse)
+async def optimize_routes_incremental(request: IncrementalOptimizeRequest):
+    """Re-optimize a previous plan after orders were added, removed or vehicles moved."""
+    return await _wait_for_result(_submit(request, "incremental"))
+
+
+@router.post("/optimize_routes/incremental/jobs", response_model=OptimizationJob, status_code=202)
+async def create_incremental_optimization_job(request: IncrementalOptimizeRequest):
+    return _submit(request, "incremental").info()
+
+
+@router.post("/optimize_routes/jobs", response_model=OptimizationJob, status_code=202)
+async def create_optimization_job(request: OptimizeRouteRequest):
+    return _submit(request, _routes_kind(request)).info()
+
+
+@router.get("/optimize_routes/jobs/{job_id}", response_model=OptimizationJob)
+async def get_optimization_job(job_id: str):
+    return _get_job(job_id).info()
+
+
+@router.get(
+    "/optimize_routes/jobs/{job_id}/result",
+    response_model=Union[IncrementalOptimizeResponse, OptimizedRouteResponse],
+)
+async def get_optimization_job_result(job_id: str):
+    return _job_result(_get_job(job_id))
+
+
+@router.post("/optimize_routes/jobs/{job_id}/stop", response_model=OptimizationJob)
+async def stop_optimization_job(job_id: str):
+    """Finish a running search now and keep the best plan found so far as its result."""
+    job = _get_job(job_id)
+    job_manager.stop(job)
+    return job.info()
+
+
+@router.delete("/optimize_routes/jobs/{job_id}", response_model=OptimizationJob)
+async def cancel_optimization_job(job_id: str):
+    job = _get_job(job_id)
+    job_manager.cancel(job)
+    return job.info()
@@ -0,0 +1,46 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from ..cache import ORDERS, read_cache
+from ..database import async_session_maker
+from ..live import live_state
+from ..order_import import import_orders, parse_csv, parse_ndjson
+from ..schemas import OrderImportResult
+
+router = APIRouter()
+
+_PARSERS = {"csv": parse_csv, "ndjson": parse_ndjson}
+_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json": "ndjson",
+}
+
+
+@router.post("/orders/import", response_model=OrderImportResult)
+async def import_orders_endpoint(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = Query(None, description="Defaults from the Content-Type"),
+    on_conflict: Literal["skip", "update"] = "skip",
+):
+    """Load many orders from a CSV (with a header line) or NDJSON body.
+
+    Valid rows are merged in one transaction; invalid rows, rows whose id
+    already exists (with ``on_conflict=skip``) and rows superseded by a
+    later row with the same id are reported by line.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        format = _CONTENT_TYPES.get(content_type)
+        if format is None:
+            raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or pass format.")
+    async with async_session_maker() as session:
+        async with session.begin():
+            result, merged = await import_orders(session, _PARSERS[format](request.stream()), on_conflict)
+    if merged:
+        await read_cache.invalidate(ORDERS)
+    for order in merged:
+        live_state.put_order(order)
+    return result
@@ -0,0 +1,37 @@
+from typing import List
+
+from fastapi import APIRouter, HTTPException
+
+from ..cache import VEHICLE_STATUSES, VEHICLES, read_cache
+from ..fanout import vehicle_fanout
+from ..history import telemetry_history
+from ..live import live_state
+from ..schemas import TelemetryAccepted, TelemetryBatch
+from ..settings import settings
+from ..telemetry import BufferFullError, telemetry_buffer
+
+router = APIRouter()
+
+
+async def _notify_vehicle_updates(rows: List[dict]):
+    await read_cache.invalidate_items(VEHICLES, [row["id"] for row in rows])
+    if any(row["status"] != row["previous_status"] for row in rows):
+        await read_cache.invalidate(VEHICLE_STATUSES)
+    for row in rows:
+        vehicle_fanout.publish({key: value for key, value in row.items() if key != "previous_status"})
+
+telemetry_buffer.add_listener(_notify_vehicle_updates)
+
+
+@router.post("/vehicles/telemetry", response_model=TelemetryAccepted, status_code=202)
+async def ingest_telemetry(batch: TelemetryBatch):
+    """Buffer positions of many vehicles; they are written to the database in bulk shortly after."""
+    try:
+        accepted = telemetry_buffer.offer(batch.positions)
+    except BufferFullError:
+        raise HTTPException(status_code=503, detail="Telemetry buffer is full.", headers={"Retry-After": "1"})
+    if settings.history_enabled:
+        telemetry_history.record(batch.positions)
+    for position in batch.positions:
+        live_state.move_vehicle(position.vehicle_id, position.current_lat, position.current_lng, position.status)
+    return TelemetryAccepted(accepted=accepted, pending_vehicles=telemetry_buffer.pending)
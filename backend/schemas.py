@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
 
 class Location(BaseModel):
     latitude: float
@@ -17,7 +18,18 @@ class VehicleInOptimization(BaseModel):
 
 class OptimizeRouteRequest(BaseModel):
     orders: List[OrderInOptimization]
-    vehicles: List[VehicleInOptimization]
+    vehicles: List[VehicleInOptimization] = Field(..., min_length=1)
+    # "decomposed" solves geographic clusters of orders and vehicles in
+    # parallel; "auto" does so only for large requests
+    strategy: Literal["single", "decomposed", "auto"] = "single"
+    # When set, only arcs to each location's nearest neighbours (plus depot
+    # and pickup->dropoff arcs) are costed and searched
+    sparse_neighbors: Optional[int] = Field(None, ge=1)
+    time_limit_seconds: float = Field(10.0, gt=0, le=300)
+    # Stream improving solutions as "route_progress" Socket.IO events
+    anytime: bool = False
+    # Include per-phase timings and solver statistics in the response
+    debug: bool = False
 
 class Stop(BaseModel):
     order_id: int
@@ -30,6 +42,187 @@ class OptimizedRoute(BaseModel):
     total_distance: Optional[float] = None
     total_time: Optional[float] = None
 
+class SolverStats(BaseModel):
+    status: str
+    objective: Optional[int] = None
+    solutions: int = 0
+    branches: int = 0
+
+class OptimizationDebug(BaseModel):
+    # Exclusive wall time per phase in seconds
+    phases: Dict[str, float]
+    solver: Optional[SolverStats] = None
+
 class OptimizedRouteResponse(BaseModel):
     optimized_routes: List[OptimizedRoute]
-    unassigned_orders: Optional[List[int]] = None
\ No newline at end of file
+    unassigned_orders: Optional[List[int]] = None
+    debug: Optional[OptimizationDebug] = None
+    # Travel-time model the plan was costed with
+    model_version: Optional[str] = None
+
+class IncrementalOptimizeRequest(BaseModel):
+    previous: OptimizedRouteResponse
+    # Current fleet, with start locations taken from the latest telemetry
+    vehicles: List[VehicleInOptimization] = Field(..., min_length=1)
+    added_orders: List[OrderInOptimization] = []
+    removed_order_ids: List[int] = []
+    time_limit_seconds: float = Field(2.0, gt=0, le=60)
+    anytime: bool = False
+    debug: bool = False
+
+class PlanChanges(BaseModel):
+    added_orders: int
+    removed_orders: int
+    reassigned_orders: List[int]
+    changed_vehicles: List[int]
+    moved_stops: int
+    changed_fraction: float
+
+class IncrementalOptimizeResponse(OptimizedRouteResponse):
+    changes: PlanChanges
+
+class InsertionRequest(BaseModel):
+    routes: List[OptimizedRoute]
+    vehicles: List[VehicleInOptimization] = Field(..., min_length=1)
+    order: OrderInOptimization
+
+class InsertionResult(BaseModel):
+    order_id: int
+    # None when no vehicle can take the order
+    vehicle_id: Optional[int] = None
+    pickup_position: Optional[int] = None
+    dropoff_position: Optional[int] = None
+    added_distance: Optional[float] = None
+    added_time: Optional[float] = None
+    route: Optional[OptimizedRoute] = None
+
+class DispatchPlanCreate(BaseModel):
+    # Either the id of a finished optimization job, or explicit routes and vehicles
+    job_id: Optional[str] = None
+    routes: Optional[List[OptimizedRoute]] = None
+    vehicles: Optional[List[VehicleInOptimization]] = Field(None, min_length=1)
+
+class DispatchPlan(BaseModel):
+    id: str
+    vehicles: List[VehicleInOptimization]
+    optimized_routes: List[OptimizedRoute]
+    unassigned_orders: List[int] = []
+
+class RouteProgress(BaseModel):
+    job_id: str
+    objective: int
+    elapsed_seconds: float
+    optimized_routes: List[OptimizedRoute]
+
+class OptimizationJob(BaseModel):
+    id: str
+    kind: str = "routes"
+    status: str
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queue_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
+    # Objective of the best solution streamed so far by an anytime solve
+    best_objective: Optional[int] = None
+    error: Optional[str] = None
+
+class VehiclePosition(BaseModel):
+    vehicle_id: int
+    current_lat: float = Field(..., ge=-90, le=90)
+    current_lng: float = Field(..., ge=-180, le=180)
+    status: Optional[str] = None
+
+class TelemetryBatch(BaseModel):
+    # Positions of one vehicle are applied in list order; the last one wins
+    positions: List[VehiclePosition] = Field(..., min_length=1, max_length=5000)
+
+class TelemetryAccepted(BaseModel):
+    accepted: int
+    pending_vehicles: int
+
+class TrackPoint(BaseModel):
+    recorded_at: datetime
+    lat: float
+    lng: float
+    status: Optional[str] = None
+
+class VehicleTrack(BaseModel):
+    vehicle_id: int
+    start: datetime
+    end: datetime
+    # Positions stored in the range, before downsampling to ``points``; counting
+    # stops at routers.history.MAX_COUNTED_POSITIONS
+    total_points: int
+    points: List[TrackPoint]
+
+class ViewportSubscription(BaseModel):
+    south: float = Field(..., ge=-90, le=90)
+    west: float = Field(..., ge=-180, le=180)
+    north: float = Field(..., ge=-90, le=90)
+    east: float = Field(..., ge=-180, le=180)
+
+class VehicleSubscription(BaseModel):
+    vehicle_ids: List[int] = Field(..., max_length=1000)
+
+class OrderBase(BaseModel):
+    customer_name: str
+    pickup_address: str
+    dropoff_address: str
+    status: str = "pending"
+    pickup_lat: float | None = None
+    pickup_lng: float | None = None
+    dropoff_lat: float | None = None
+    dropoff_lng: float | None = None
+
+class OrderCreate(OrderBase):
+    id: int
+
+class OrderRead(OrderBase):
+    id: int
+
+class VehicleBase(BaseModel):
+    name: str
+    status: str = "idle"
+    current_lat: float | None = None
+    current_lng: float | None = None
+
+class VehicleCreate(VehicleBase):
+    id: int
+
+class VehicleRead(VehicleBase):
+    id: int
+
+class VehicleUpsertBatch(BaseModel):
+    # A vehicle listed more than once is stored as its last occurrence
+    vehicles: List[VehicleCreate] = Field(..., min_length=1, max_length=5000)
+
+class VehicleUpsertResult(BaseModel):
+    inserted: int
+    updated: int
+    vehicles: List[VehicleRead]
+
+class TelemetryUpdate(BaseModel):
+    current_lat: float
+    current_lng: float
+    status: str | None = None
+
+class NearbyVehicle(VehicleRead):
+    distance_km: float
+
+class NearbyOrder(OrderRead):
+    # Distance to the pickup location
+    distance_km: float
+
+class ImportRowError(BaseModel):
+    line: int
+    id: Optional[int] = None
+    error: str
+
+class OrderImportResult(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    rejected: int
+    # The first rejected rows by line; ``rejected`` counts all of them
+    errors: List[ImportRowError]
@@ -0,0 +1,12 @@
+import socketio
+
+from .metrics import SOCKETIO_EMITS
+
+
+class AsyncServer(socketio.AsyncServer):
+    async def emit(self, event, *args, **kwargs):
+        SOCKETIO_EMITS.inc(event=event)
+        await super().emit(event, *args, **kwargs)
+
+
+sio = AsyncServer(async_mode="asgi", cors_allowed_origins=["http://localhost:3000", "http://127.0.0.1:3000", "*"])
@@ -0,0 +1,225 @@
+"""Uniform-grid spatial indexes for nearest-neighbour and radius queries over coordinates."""
+import heapq
+import math
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def plane_km(lat: np.ndarray, lng: np.ndarray, ref_lat: float) -> np.ndarray:
+    """Equirectangular projection to kilometers around ``ref_lat``; accurate at city scale."""
+    return np.column_stack([lat * KM_PER_DEGREE, lng * KM_PER_DEGREE * math.cos(math.radians(ref_lat))])
+
+
+def _grid(points: np.ndarray, cell_km: float) -> Dict[Tuple[int, int], np.ndarray]:
+    cells = np.floor(points / cell_km).astype(np.int64)
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    keys = cells[order]
+    breaks = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+    return {
+        (int(keys[start, 0]), int(keys[start, 1])): order[start:stop]
+        for start, stop in zip(np.r_[0, breaks], np.r_[breaks, len(order)])
+    }
+
+
+def knn(lat: np.ndarray, lng: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` nearest other points of every point, shape ``(n, k)``.
+
+    Points are bucketed into a grid sized to hold about ``k`` points per
+    cell. Each cell's points are compared only against the surrounding
+    ring of cells, which is widened until the ``k``-th neighbour provably
+    lies inside it, so the cost grows with ``n * k`` rather than ``n ** 2``.
+    """
+    n = len(lat)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.intp)
+    points = plane_km(lat, lng, float(np.mean(lat)))
+    extent = np.ptp(points, axis=0)
+    area = max(float(extent[0]) * float(extent[1]), float(extent.max()) ** 2 / n, 1e-6)
+    cell_km = math.sqrt(area * k / n)
+    grid = _grid(points, cell_km)
+    max_ring = max(1, math.ceil(float(extent.max()) / cell_km) + 1)
+
+    neighbours = np.empty((n, k), dtype=np.intp)
+    for (cx, cy), members in grid.items():
+        ring = 1
+        while True:
+            parts: List[np.ndarray] = [
+                grid[(cx + dx, cy + dy)]
+                for dx in range(-ring, ring + 1)
+                for dy in range(-ring, ring + 1)
+                if (cx + dx, cy + dy) in grid
+            ]
+            candidates = np.concatenate(parts)
+            if len(candidates) > k or ring >= max_ring:
+                d2 = ((points[members, None, :] - points[None, candidates, :]) ** 2).sum(axis=2)
+                d2[members[:, None] == candidates[None, :]] = np.inf
+                nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+                kth = np.take_along_axis(d2, nearest, axis=1).max(axis=1)
+                # Anything outside the ring is at least ``ring`` cells away.
+                if ring >= max_ring or np.all(kth <= (ring * cell_km) ** 2):
+                    neighbours[members] = candidates[nearest]
+                    break
+            ring += 1
+    return neighbours
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in kilometers between two points (scalar version)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# (distance_km, key, item)
+Hit = Tuple[float, int, Any]
+
+
+class LiveIndex:
+    """Mutable index of points keyed by id, bucketed into ``cell_deg`` square cells.
+
+    Each point carries an arbitrary ``item`` returned by queries, so callers
+    can answer without going back to the database. Queries only visit the
+    cells around the query point. A query that would visit more cells than
+    are occupied scans the occupied cells instead, so sparse or distant
+    points never cost more than a linear scan.
+    """
+
+    def __init__(self, cell_deg: float = 0.02):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float, Any]]] = {}
+        self._cell_of: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._cell_of
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def get(self, key: int) -> Optional[Tuple[float, float, Any]]:
+        cell = self._cell_of.get(key)
+        return None if cell is None else self._cells[cell][key]
+
+    def upsert(self, key: int, lat: Optional[float], lng: Optional[float], item: Any = None):
+        """Add or move a point; a point without coordinates is removed."""
+        if lat is None or lng is None:
+            self.remove(key)
+            return
+        cell = self._cell(lat, lng)
+        previous = self._cell_of.get(key)
+        if previous is not None and previous != cell:
+            self._discard(previous, key)
+        self._cells.setdefault(cell, {})[key] = (lat, lng, item)
+        self._cell_of[key] = cell
+
+    def remove(self, key: int):
+        cell = self._cell_of.pop(key, None)
+        if cell is not None:
+            self._discard(cell, key)
+
+    def _discard(self, cell: Tuple[int, int], key: int):
+        points = self._cells[cell]
+        del points[key]
+        if not points:
+            del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._cell_of.clear()
+
+    def _ring(self, cx: int, cy: int, r: int) -> Iterator[Dict[int, Tuple[float, float, Any]]]:
+        """Occupied cells at Chebyshev distance exactly ``r`` from ``(cx, cy)``."""
+        if r == 0:
+            cells = [(cx, cy)]
+        else:
+            cells = [(cx + dx, cy + dy) for dx in (-r, r) for dy in range(-r, r + 1)]
+            cells += [(cx + dx, cy + dy) for dy in (-r, r) for dx in range(-r + 1, r)]
+        for cell in cells:
+            points = self._cells.get(cell)
+            if points:
+                yield points
+
+    def _ring_clearance_km(self, lat: float, r: int) -> float:
+        """Lower bound on the distance from a point in the centre cell to anything beyond ring ``r``."""
+        # Points beyond the ring differ by at least r cells in latitude or in
+        # longitude; the longitude gap is shortest at the highest latitude reached.
+        gap = math.radians(r * self.cell_deg)
+        highest = min(math.pi / 2, math.radians(abs(lat) + (r + 1) * self.cell_deg))
+        return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.cos(highest) * math.sin(gap / 2)))
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_km: float = math.inf,
+        where: Optional[Callable[[Any], bool]] = None,
+    ) -> List[Hit]:
+        """Up to ``k`` points closest to ``(lat, lng)``, nearest first."""
+        if k <= 0:
+            return []
+        best: List[Tuple[float, int, Any]] = []  # max-heap of (-distance, key, item)
+        limit = max_km
+
+        def consider(points):
+            nonlocal limit
+            for key, (plat, plng, item) in points.items():
+                d = haversine(lat, lng, plat, plng)
+                if d > limit or (where is not None and not where(item)):
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-d, key, item))
+                else:
+                    heapq.heappushpop(best, (-d, key, item))
+                if len(best) == k:
+                    limit = min(max_km, -best[0][0])
+
+        cx, cy = self._cell(lat, lng)
+        r = 0
+        while True:
+            if (2 * r + 1) ** 2 > len(self._cells):
+                # The ring has outgrown the occupied cells: scan what is left.
+                for (x, y), points in self._cells.items():
+                    if max(abs(x - cx), abs(y - cy)) >= r:
+                        consider(points)
+                break
+            for points in self._ring(cx, cy, r):
+                consider(points)
+            if self._ring_clearance_km(lat, r) >= limit:
+                break
+            r += 1
+        return [(-d, key, item) for d, key, item in sorted(best, reverse=True)]
+
+    def within(
+        self, lat: float, lng: float, radius_km: float, where: Optional[Callable[[Any], bool]] = None
+    ) -> List[Hit]:
+        """All points within ``radius_km`` of ``(lat, lng)``, nearest first."""
+        hits = []
+
+        def consider(points):
+            for key, (plat, plng, item) in points.items():
+                d = haversine(lat, lng, plat, plng)
+                if d <= radius_km and (where is None or where(item)):
+                    hits.append((d, key, item))
+
+        cx, cy = self._cell(lat, lng)
+        r = 0
+        while r == 0 or self._ring_clearance_km(lat, r - 1) < radius_km:
+            if (2 * r + 1) ** 2 > len(self._cells):
+                for (x, y), points in self._cells.items():
+                    if max(abs(x - cx), abs(y - cy)) >= r:
+                        consider(points)
+                break
+            for points in self._ring(cx, cy, r):
+                consider(points)
+            r += 1
+        hits.sort(key=lambda hit: hit[:2])
+        return hits
@@ -0,0 +1,167 @@
+"""Write-behind buffer that coalesces vehicle telemetry into periodic bulk updates."""
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from .database import async_session_maker
+from .schemas import VehiclePosition
+from .settings import settings
+
+# One statement per flush, however many vehicles it covers. A NULL status
+# keeps the stored one. ``old`` is the row as it was before the update. A
+# position received before the stored one (a direct write that landed while
+# this batch was in flight) is skipped.
+_BULK_UPDATE = text(
+    """
+    UPDATE vehicles AS v
+    SET current_lat = u.lat, current_lng = u.lng, status = COALESCE(u.status, v.status), position_at = u.received_at
+    FROM unnest(
+        CAST(:ids AS integer[]),
+        CAST(:lats AS double precision[]),
+        CAST(:lngs AS double precision[]),
+        CAST(:statuses AS varchar[]),
+        CAST(:received AS timestamptz[])
+    ) AS u(id, lat, lng, status, received_at)
+    JOIN vehicles AS old ON old.id = u.id
+    WHERE v.id = u.id AND (v.position_at IS NULL OR v.position_at < u.received_at)
+    RETURNING v.id, v.name, v.status, v.current_lat, v.current_lng, old.status AS previous_status
+    """
+)
+
+
+class BufferFullError(Exception):
+    """Raised when too many vehicles already have positions waiting to be written."""
+
+
+class TelemetryBuffer:
+    """Keeps the latest position of every vehicle and writes them out in bulk.
+
+    Memory is bounded by the number of distinct vehicles pending, not by the
+    ping rate: a vehicle reporting again before the next flush replaces its
+    buffered position. When ``max_pending`` vehicles are waiting (the flush
+    is failing or falling behind) new vehicles are refused rather than
+    queued without limit.
+    """
+
+    def __init__(self, session_maker, flush_interval_s: float, max_pending: int):
+        self.session_maker = session_maker
+        self.flush_interval_s = flush_interval_s
+        self.max_pending = max_pending
+        # vehicle id -> (latest position, when it was received)
+        self._pending: Dict[int, Tuple[VehiclePosition, datetime]] = {}
+        # Vehicles discarded since the current flush took its batch
+        self._discarded: Set[int] = set()
+        self._listeners: List[Callable[[List[dict]], Awaitable[None]]] = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add_listener(self, listener: Callable[[List[dict]], Awaitable[None]]):
+        """Register a coroutine called with the updated vehicle rows after every flush.
+
+        Rows also hold ``previous_status``, the status before the update;
+        listeners must not change them.
+        """
+        self._listeners.append(listener)
+
+    def offer(self, positions: Iterable[VehiclePosition]) -> int:
+        positions = list(positions)
+        new = {p.vehicle_id for p in positions} - self._pending.keys()
+        if len(self._pending) + len(new) > self.max_pending:
+            raise BufferFullError(f"{len(self._pending)} vehicles already waiting to be written")
+        at = datetime.now(timezone.utc)
+        for position in positions:
+            self._merge(self._pending, position, at)
+        # Don't wait for the timer once half the buffer is used.
+        if len(self._pending) * 2 >= self.max_pending:
+            self._wakeup.set()
+        return len(positions)
+
+    def discard(self, vehicle_id: int):
+        """Drop a buffered position superseded by a direct write."""
+        self._pending.pop(vehicle_id, None)
+        self._discarded.add(vehicle_id)
+
+    @staticmethod
+    def _merge(pending: Dict[int, Tuple[VehiclePosition, datetime]], position: VehiclePosition, at: datetime):
+        previous = pending.get(position.vehicle_id)
+        if position.status is None and previous is not None and previous[0].status is not None:
+            position = position.model_copy(update={"status": previous[0].status})
+        pending[position.vehicle_id] = (position, at)
+
+    async def flush(self) -> int:
+        """Write all buffered positions; returns the number of vehicles updated."""
+        self._discarded = set()
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        positions = [position for position, _ in batch.values()]
+        params = {
+            "ids": [p.vehicle_id for p in positions],
+            "lats": [p.current_lat for p in positions],
+            "lngs": [p.current_lng for p in positions],
+            "statuses": [p.status for p in positions],
+            "received": [at for _, at in batch.values()],
+        }
+        try:
+            async with self.session_maker() as session:
+                rows = [dict(row._mapping) for row in await session.execute(_BULK_UPDATE, params)]
+                await session.commit()
+        except BaseException:
+            # Put the batch back under anything that arrived during the write,
+            # except vehicles a direct write discarded meanwhile.
+            newer = self._pending
+            self._pending = {key: entry for key, entry in batch.items() if key not in self._discarded}
+            for position, at in newer.values():
+                self._merge(self._pending, position, at)
+            raise
+        if len(rows) < len(positions):
+            print(f"telemetry flush: {len(positions) - len(rows)} unknown or superseded vehicles ignored")
+        for listener in self._listeners:
+            try:
+                await listener(rows)
+            except Exception as exc:
+                print(f"telemetry listener failed: {exc!r}")
+        return len(rows)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"telemetry flush failed, retrying: {exc!r}")
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop the flush loop and write out whatever is still buffered."""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as exc:
+            print(f"telemetry flush on shutdown failed, {self.pending} vehicle positions lost: {exc!r}")
+
+
+telemetry_buffer = TelemetryBuffer(
+    async_session_maker,
+    flush_interval_s=settings.telemetry_flush_interval_s,
+    max_pending=settings.telemetry_max_pending,
+)
@@ -0,0 +1,149 @@
+"""Travel-time predictions from the LightGBM model, compiled into a step table over distance.
+
+The booster has a single feature, the distance, so its prediction only
+changes where a tree splits: between two consecutive split thresholds it
+is constant. Loading a model evaluates the booster once per interval and
+afterwards a prediction is a binary search over the thresholds and an
+array lookup, exactly equal to what ``Booster.predict`` returns. The model
+file is watched and a replaced file is compiled and swapped in without a
+restart.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+import lightgbm as lgb
+
+from .settings import settings
+
+MODEL_PATH = settings.travel_time_model_path
+# How often the model file is stat-ed to pick up a replaced model.
+_RELOAD_CHECK_S = 5.0
+
+
+def _file_version(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _split_thresholds(booster: lgb.Booster) -> np.ndarray:
+    thresholds = set()
+    stack = [tree["tree_structure"] for tree in booster.dump_model()["tree_info"]]
+    while stack:
+        node = stack.pop()
+        if "threshold" in node:
+            thresholds.add(float(node["threshold"]))
+            stack.append(node["left_child"])
+            stack.append(node["right_child"])
+    return np.array(sorted(thresholds), dtype=float)
+
+
+class CompiledTravelTimeModel:
+    """Step table of a single-feature booster: hours of travel by distance in km."""
+
+    def __init__(self, booster: lgb.Booster, version: str):
+        self.booster = booster
+        self.version = version
+        self.thresholds = _split_thresholds(booster)
+        # Interval i is (thresholds[i-1], thresholds[i]], as LightGBM sends
+        # x <= threshold to the left; the last one is above every threshold.
+        probes = np.append(self.thresholds, np.nextafter(self.thresholds[-1], np.inf) if self.thresholds.size else 0.0)
+        self.values = np.asarray(booster.predict(probes.reshape(-1, 1)), dtype=float)
+        # Some models route exactly zero (coincident points) as a missing value.
+        zero = float(booster.predict(np.zeros((1, 1)))[0])
+        self._zero_value = None if zero == self.values[np.searchsorted(self.thresholds, 0.0)] else zero
+
+    def predict(self, distances_km: np.ndarray) -> np.ndarray:
+        distances_km = np.asarray(distances_km, dtype=float)
+        hours = self.values[np.searchsorted(self.thresholds, distances_km, side="left")]
+        if self._zero_value is not None:
+            hours = np.where(distances_km == 0, self._zero_value, hours)
+        return hours
+
+
+def load_model(path: str) -> CompiledTravelTimeModel:
+    with open(path, "rb") as f:
+        content = f.read()
+    booster = lgb.Booster(model_str=content.decode())
+    return CompiledTravelTimeModel(booster, hashlib.sha256(content).hexdigest()[:12])
+
+
+_lock = threading.Lock()
+_model: Optional[CompiledTravelTimeModel] = None
+_file_stamp = None
+_next_check = 0.0
+
+
+def _reload(force: bool = False):
+    global _model, _file_stamp
+    stamp = _file_version(MODEL_PATH)
+    if stamp == _file_stamp and not force:
+        return
+    model = load_model(MODEL_PATH)
+    if _model is not None and model.version != _model.version:
+        print(f"travel-time model {_model.version} replaced by {model.version}")
+    _model, _file_stamp = model, stamp
+
+
+def current_model() -> CompiledTravelTimeModel:
+    """The loaded model, after reloading it if the file changed (checked every few seconds).
+
+    A file that cannot be read or compiled, e.g. one still being written,
+    keeps the previous model in service.
+    """
+    global _next_check
+    now = time.monotonic()
+    if now >= _next_check:
+        with _lock:
+            if now >= _next_check:
+                _next_check = now + _RELOAD_CHECK_S
+                try:
+                    _reload()
+                except Exception as exc:
+                    print(f"could not reload the travel-time model, keeping {_model.version}: {exc!r}")
+    return _model
+
+
+def model_version() -> str:
+    """Content hash of the loaded model; caches of predicted travel times key their contents on it."""
+    return current_model().version
+
+
+with _lock:
+    _reload(force=True)
+_next_check = time.monotonic() + _RELOAD_CHECK_S
+
+
+def predict_travel_time_km(distance_km: float) -> float:
+    """Predict travel time in hours for a given distance in kilometers."""
+    return float(current_model().predict(np.array([distance_km]))[0])
+
+
+def predict_travel_time_batch(distances_km: np.ndarray) -> np.ndarray:
+    """Predict travel times in hours for an array of distances in kilometers.
+
+    Returns an array with the same shape as ``distances_km``.
+    """
+    return current_model().predict(distances_km)
+
+
+def split_thresholds() -> np.ndarray:
+    """Return the sorted distance thresholds used by the booster's splits."""
+    return current_model().thresholds
+
+
+def euclidean_distance(p1, p2):
+    """Return approximate great-circle distance in kilometers."""
+    lat1 = math.radians(p1.latitude)
+    lon1 = math.radians(p1.longitude)
+    lat2 = math.radians(p2.latitude)
+    lon2 = math.radians(p2.longitude)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return 6371.0 * c
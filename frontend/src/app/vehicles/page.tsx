@@ -1,8 +1,8 @@
 "use client";
-import { useEffect, useState, Fragment } from "react";
+import { useEffect, useRef, useState, Fragment } from "react";
 import "leaflet/dist/leaflet.css";
 import dynamic from "next/dynamic";
-import { io } from "socket.io-client";
+import { io, Socket } from "socket.io-client";
 
 interface Vehicle {
   id: number;
@@ -82,9 +82,11 @@ export default function VehiclesPage() {
   const [telemetryError, setTelemetryError] = useState<string | null>(null);
 
   const [selectedVehicleId, setSelectedVehicleId] = useState<number | null>(null);
+  const socketRef = useRef<Socket | null>(null);
 
   useEffect(() => {
     const socket = io("http://localhost:8000"); // Connect to backend Socket.IO server
+    socketRef.current = socket;
 
     socket.on("connect", () => {
       console.log("Connected to Socket.IO");
@@ -94,19 +96,41 @@ export default function VehiclesPage() {
       console.log("Disconnected from Socket.IO");
     });
 
-    socket.on("vehicle_update", (updatedVehicle: Vehicle) => {
-      console.log("Received vehicle update:", updatedVehicle);
+    // Frames carry only the fields that changed since the previous frame,
+    // and the ids of deleted vehicles under "removed"
+    socket.on("vehicle_deltas", (frame: { vehicles: Partial<Vehicle>[]; removed?: number[] }) => {
+      const deltas = new Map(frame.vehicles.map((d) => [d.id, d]));
+      const removed = new Set(frame.removed ?? []);
       setVehicles((prev) =>
-        prev.map((v) => (v.id === updatedVehicle.id ? updatedVehicle : v))
+        prev
+          .filter((v) => !removed.has(v.id))
+          .map((v) => (deltas.has(v.id) ? { ...v, ...deltas.get(v.id) } : v))
       );
     });
 
     // Clean up on component unmount
     return () => {
       socket.disconnect();
+      socketRef.current = null;
     };
   }, []); // Run once on mount
 
+  // Only receive updates for the vehicles on the current page
+  const vehicleIds = vehicles.map((v) => v.id).join(",");
+  useEffect(() => {
+    const socket = socketRef.current;
+    if (!socket) return;
+    const subscribe = () =>
+      socket.emit("subscribe_vehicles", {
+        vehicle_ids: vehicleIds ? vehicleIds.split(",").map(Number) : [],
+      });
+    subscribe();
+    socket.on("connect", subscribe);
+    return () => {
+      socket.off("connect", subscribe);
+    };
+  }, [vehicleIds]);
+
   useEffect(() => {
     fetch("http://localhost:8000/orders?limit=100")
       .then((res) => res.json())